@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, List
+
+from app.pipeline import ScrapedPage
+from app.sdk.models import KernelPlancksterSourceData
+from app.utils import safe_file_name
+
+
+class ScrapeCheckpoint:
+    """
+    Durable progress of a scrape job, so that a rerun with the same tracer id and job id resumes where the last run stopped.
+
+    The checkpoint is an append-only journal in `checkpoint_dir`: a header line with the job's artifact timestamp, the date
+    windows of a partitioned job, then one line per page that was fetched, augmented, persisted and uploaded, holding its
+    raw tweets, augmented rows and source data.
+    Lines are flushed to disk every `interval` pages; a crash loses at most that many pages, which are scraped again on resume.
+    A torn last line is ignored when loading. Only the source data of completed pages is kept in memory; their tweets and
+    rows are streamed from the journal by `iter_pages`.
+    """
+
+    def __init__(self, checkpoint_dir: str, tracer_id: str, job_id: int, interval: int = 10) -> None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        # the tracer id comes from the clients of the API
+        self._path = os.path.join(checkpoint_dir, f"{safe_file_name(f'{tracer_id}-{job_id}')}.ndjson")
+        self._interval = max(1, interval)
+        self._completed: Dict[int, KernelPlancksterSourceData | None] = {}
+        self._windows: List[dict] | None = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        self._file = None
+        self._timestamp = self._load()
+        torn = self._ends_with_torn_line()
+        self._file = open(self._path, "a", encoding="utf-8")
+        if os.path.getsize(self._path) == 0:
+            self._write({"type": "job", "timestamp": self._timestamp})
+            self._sync()
+        elif torn:
+            # terminate the torn last line, so that it does not swallow the next record
+            self._file.write("\n")
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def timestamp(self) -> str:
+        """
+        The timestamp used in the job's artifact names, kept across resumes so that they keep the same names.
+        """
+        return self._timestamp
+
+    @property
+    def completed(self) -> Dict[int, KernelPlancksterSourceData | None]:
+        """
+        The source data of the pages completed by earlier runs, by page number.
+        """
+        return self._completed
+
+    @property
+    def windows(self) -> List[dict] | None:
+        """
+        The date windows a partitioned job was split into by its first run, so that a resume keeps its page keys.
+        """
+        return self._windows
+
+    def record_windows(self, windows: List[dict]) -> None:
+        """
+        Record the date windows of a partitioned job. They are synced to disk right away.
+        """
+        with self._lock:
+            self._windows = windows
+            self._write({"type": "windows", "windows": windows})
+            self._sync()
+
+    def iter_pages(self) -> Iterator[ScrapedPage]:
+        """
+        Stream the pages completed by earlier runs from the journal.
+        """
+        for entry in self._read():
+            if entry["type"] == "page":
+                yield ScrapedPage.model_validate(entry["data"])
+
+    def record(self, page: ScrapedPage) -> None:
+        """
+        Record a page as completed. It is synced to disk with the next `interval` pages, or on close.
+        """
+        with self._lock:
+            self._write({"type": "page", "data": json.loads(page.model_dump_json())})
+            self._pending += 1
+            if self._pending >= self._interval:
+                self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def clear(self) -> None:
+        """
+        Delete the checkpoint, once the job has finished and its final artifacts are registered.
+        """
+        self.close()
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+    def _write(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry) + "\n")
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def _read(self) -> Iterator[dict]:
+        if not os.path.exists(self._path):
+            return
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._file.flush()
+        with open(self._path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    self.logger.warning(f"Ignoring a torn line in checkpoint {self._path}")
+
+    def _ends_with_torn_line(self) -> bool:
+        if not os.path.exists(self._path) or os.path.getsize(self._path) == 0:
+            return False
+        with open(self._path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def _load(self) -> str:
+        timestamp = None
+        for entry in self._read():
+            if entry["type"] == "job":
+                timestamp = entry["timestamp"]
+            elif entry["type"] == "windows":
+                self._windows = entry["windows"]
+            elif entry["type"] == "page":
+                source_data = entry["data"].get("source_data")
+                self._completed[entry["data"]["page"]] = KernelPlancksterSourceData.model_validate(source_data) if source_data else None
+        if timestamp is not None:
+            self.logger.info(f"Resuming from checkpoint {self._path} with {len(self._completed)} completed pages")
+            return timestamp
+        return time.strftime("%Y%m%d_%H%M%S")
@@ -0,0 +1,227 @@
+import hashlib
+import logging
+import random
+import re
+import sqlite3
+import threading
+from array import array
+from typing import Dict, Iterable, List, Set
+from urllib.parse import urlsplit
+
+from app.llm_cache import normalize_text
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_link(link: str) -> str:
+    """
+    Normalize a tweet link: lowercased host, twitter.com and x.com unified, query, fragment and trailing slash dropped.
+    """
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower().removeprefix("www.").removeprefix("mobile.")
+    if host == "x.com":
+        host = "twitter.com"
+    return f"{host}{parts.path.rstrip('/')}"
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """
+    The word shingles of a tweet text, ignoring a leading "RT @user:", links, mentions and punctuation.
+    """
+    text = normalize_text(text)
+    text = re.sub(r"^rt @\w+:?", " ", text)
+    text = re.sub(r"https?://\S+|@\w+", " ", text)
+    words = re.findall(r"\w+", text)
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class DedupIndex:
+    """
+    Detects tweets that were already seen: exact duplicates by normalized link, near duplicates, such as retweets and
+    reposts with small edits, by MinHash signatures of their word shingles, bucketed with locality-sensitive hashing.
+
+    The index lives in an in-memory SQLite database by default, which deduplicates within a job. Given a `path`, it is
+    persisted there and deduplicates across jobs.
+
+    Tweets added with a `job` key are tagged with it and their page until `commit`, so that a resumed job can `discard`
+    the tweets of the pages its earlier run did not complete, and deduplicate them again.
+
+    :param threshold: The estimated Jaccard similarity from which a tweet is a near duplicate.
+    :param num_perm: The number of MinHash permutations.
+    :param bands: The number of LSH bands; num_perm must be divisible by it. More bands find less similar candidates.
+    """
+
+    def __init__(
+            self,
+            path: str | None = None,
+            threshold: float = 0.8,
+            num_perm: int = 64,
+            bands: int = 16,
+            shingle_size: int = 3,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self._threshold = threshold
+        self._num_perm = num_perm
+        self._bands = bands
+        self._rows = num_perm // bands
+        self._shingle_size = shingle_size
+        generator = random.Random(1)
+        self._permutations = [
+            (generator.randrange(1, _MERSENNE_PRIME), generator.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)
+        ]
+        self._stats: Dict[str, int] = {"unique": 0, "duplicate_links": 0, "near_duplicates": 0}
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+        self._connection = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS links (link TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS signatures (id INTEGER PRIMARY KEY, signature BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL, id INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+            """
+        )
+        for table in ("links", "signatures"):
+            # indexes persisted before tweets were tagged by job and page
+            columns = {row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")}
+            if "job" not in columns:
+                self._connection.execute(f"ALTER TABLE {table} ADD COLUMN job TEXT")
+                self._connection.execute(f"ALTER TABLE {table} ADD COLUMN page INTEGER")
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_job ON {table} (job, page)")
+        self._connection.commit()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+    def signature(self, text: str) -> array | None:
+        """
+        The MinHash signature of a tweet text, None if it has no words to compare, e.g. only emoji, links or mentions.
+        """
+        text_shingles = shingles(text, self._shingle_size)
+        if not text_shingles:
+            return None
+        signature = array("Q", [_MAX_HASH] * self._num_perm)
+        for shingle in text_shingles:
+            value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little")
+            for i, (a, b) in enumerate(self._permutations):
+                hashed = ((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH
+                if hashed < signature[i]:
+                    signature[i] = hashed
+        return signature
+
+    def seen(self, tweet: dict, job: str | None = None, page: int | None = None) -> bool:
+        """
+        Check whether the tweet is a duplicate of a tweet already in the index, and add it to the index if it is not.
+
+        :param job: The key of the job the tweet was scraped by, to tag the tweet with until `commit`.
+        :param page: The page the tweet is on.
+        """
+        link = tweet.get("link")
+        text = tweet.get("snippet") or ""
+        # texts without words are only checked by their link, their signatures would all be the same
+        signature = self.signature(text) if text else None
+
+        with self._lock:
+            if link:
+                normalized_link = normalize_link(link)
+                if self._connection.execute("SELECT 1 FROM links WHERE link = ?", (normalized_link,)).fetchone():
+                    self._stats["duplicate_links"] += 1
+                    return True
+
+            buckets = self._buckets(signature) if signature is not None else []
+            if signature is not None and self._has_near_duplicate(signature, buckets):
+                self._stats["near_duplicates"] += 1
+                if link:
+                    self._connection.execute("INSERT OR IGNORE INTO links (link, job, page) VALUES (?, ?, ?)", (normalized_link, job, page))
+                    self._connection.commit()
+                return True
+
+            if link:
+                self._connection.execute("INSERT OR IGNORE INTO links (link, job, page) VALUES (?, ?, ?)", (normalized_link, job, page))
+            if signature is not None:
+                id = self._connection.execute(
+                    "INSERT INTO signatures (signature, job, page) VALUES (?, ?, ?)", (signature.tobytes(), job, page)
+                ).lastrowid
+                self._connection.executemany(
+                    "INSERT INTO bands (band, bucket, id) VALUES (?, ?, ?)",
+                    [(band, bucket, id) for band, bucket in enumerate(buckets)],
+                )
+            self._connection.commit()
+            self._stats["unique"] += 1
+            return False
+
+    def unique(self, tweets: List[dict], job: str | None = None, page: int | None = None) -> List[dict]:
+        """
+        Return the tweets that are not duplicates, in order, adding them to the index, tagged with `job` and `page` if given.
+        """
+        return [tweet for tweet in tweets if tweet is not None and not self.seen(tweet, job, page)]
+
+    def commit(self, job: str) -> None:
+        """
+        Keep the tweets tagged with a job for good, once the job has finished.
+        """
+        with self._lock:
+            for table in ("links", "signatures"):
+                self._connection.execute(f"UPDATE {table} SET job = NULL, page = NULL WHERE job = ?", (job,))
+            self._connection.commit()
+
+    def discard(self, job: str, keep_pages: Iterable[int] = ()) -> int:
+        """
+        Remove the tweets tagged with a job, except those on `keep_pages`, so that the pages an interrupted run did not
+        complete are not taken for duplicates of themselves when they are scraped again.
+
+        :return: The number of tweets removed.
+        """
+        keep = set(keep_pages)
+        with self._lock:
+            pages = {
+                row[0] for table in ("links", "signatures")
+                for row in self._connection.execute(f"SELECT DISTINCT page FROM {table} WHERE job = ?", (job,))
+            }
+            removed = 0
+            for page in pages - keep:
+                self._connection.execute(
+                    "DELETE FROM bands WHERE id IN (SELECT id FROM signatures WHERE job = ? AND page IS ?)", (job, page)
+                )
+                self._connection.execute("DELETE FROM signatures WHERE job = ? AND page IS ?", (job, page))
+                removed += self._connection.execute("DELETE FROM links WHERE job = ? AND page IS ?", (job, page)).rowcount
+            self._connection.commit()
+        if removed:
+            self.logger.info(f"Discarded {removed} tweets of {job} on {len(pages - keep)} pages that were not completed")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _buckets(self, signature: array) -> List[int]:
+        buckets = []
+        for band in range(self._bands):
+            rows = signature[band * self._rows:(band + 1) * self._rows].tobytes()
+            buckets.append(int.from_bytes(hashlib.blake2b(rows, digest_size=7).digest(), "little"))
+        return buckets
+
+    def _has_near_duplicate(self, signature: array, buckets: List[int]) -> bool:
+        candidates: Set[int] = set()
+        for band, bucket in enumerate(buckets):
+            rows = self._connection.execute("SELECT id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)).fetchall()
+            candidates.update(row[0] for row in rows)
+
+        for candidate in candidates:
+            stored = array("Q")
+            stored.frombytes(self._connection.execute("SELECT signature FROM signatures WHERE id = ?", (candidate,)).fetchone()[0])
+            similarity = sum(1 for x, y in zip(signature, stored) if x == y) / self._num_perm
+            if similarity >= self._threshold:
+                return True
+        return False
@@ -0,0 +1,174 @@
+import contextlib
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Set, Tuple
+
+import requests
+
+from app.metrics import ScrapeMetrics
+from app.quota import UpstreamQuota
+from app.retry import RetryBudget, RetryPolicy
+from app.tracing import Tracer, traced
+
+
+SCRAPERAPI_TWITTER_SEARCH_URL = "https://api.scraperapi.com/structured/twitter/search"
+
+
+class FetchCancelled(Exception):
+    """
+    Raised by a page request that is no longer needed, instead of retrying it.
+    """
+
+
+def fetch_page(
+    job_id: int,
+    page: int,
+    query: str,
+    start_date: str,
+    end_date: str,
+    scraper_api_key: str,
+    page_delay: float = 1.0,
+    search_url: str = SCRAPERAPI_TWITTER_SEARCH_URL,
+    retry_policy: RetryPolicy | None = None,
+    retry_budget: RetryBudget | None = None,
+    cancelled: threading.Event | None = None,
+    quota: UpstreamQuota | None = None,
+    metrics: ScrapeMetrics | None = None,
+    tracer: Tracer | None = None,
+) -> Dict[str, Any]:
+    """
+    Fetch a single page of the ScraperAPI twitter search, retrying failed and undecodable responses according to the retry policy.
+
+    :param job_id: The id of the job, used for logging.
+    :param page: The page number to fetch.
+    :param page_delay: Seconds to wait after the request, before the slot is reused for another page.
+    :param search_url: The search endpoint to query.
+    :param retry_policy: When to retry, RetryPolicy() if not given.
+    :param retry_budget: The retry budget of the job.
+    :param cancelled: Once set, waits for a retry end early and no further attempts are made.
+    :param quota: The ScraperAPI quota shared by the jobs of the process; every attempt draws from it.
+    :param metrics: Where to time every attempt, as the "fetch" stage.
+    :param tracer: Records every attempt as a "fetch" span.
+    :raises RetryBudgetExhausted: If the job's retry budget is used up.
+    :raises requests.exceptions.RequestException: On fatal errors, e.g. a 401, or once the policy gives up.
+    """
+
+    payload = {
+        'api_key': scraper_api_key,
+        'query': query,
+        'date_range_start': start_date,
+        'date_range_end': end_date,
+        'page': page,
+        'format': 'json'
+    }
+
+    def get() -> Dict[str, Any]:
+        with traced(tracer, "fetch", page=page), metrics.timed("fetch", job_id) if metrics is not None else contextlib.nullcontext():
+            response = requests.get(search_url, params=payload)
+            response.raise_for_status()
+            return response.json()
+
+    def request() -> Dict[str, Any]:
+        if cancelled is not None and cancelled.is_set():
+            raise FetchCancelled(f"Fetching page {page} was cancelled")
+        return quota.call(get) if quota is not None else get()
+
+    data = (retry_policy or RetryPolicy()).call(
+        request,
+        budget=retry_budget,
+        description=f"{job_id}: Fetching page {page}",
+        sleep=cancelled.wait if cancelled is not None else time.sleep,
+    )
+
+    if page_delay > 0:
+        time.sleep(page_delay)
+
+    return data
+
+
+def fetch_pages(
+    job_id: int,
+    query: str,
+    start_date: str,
+    end_date: str,
+    scraper_api_key: str,
+    concurrency: int = 1,
+    page_delay: float = 1.0,
+    start_page: int = 1,
+    search_url: str = SCRAPERAPI_TWITTER_SEARCH_URL,
+    skip_pages: Set[int] | None = None,
+    retry_policy: RetryPolicy | None = None,
+    retry_budget: RetryBudget | None = None,
+    quota: UpstreamQuota | None = None,
+    metrics: ScrapeMetrics | None = None,
+    tracer: Tracer | None = None,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Fetch consecutive search pages, keeping up to `concurrency` requests in flight, and yield them in page order.
+
+    Iteration stops at the first page without `organic_results`; requests for later pages that are still in flight are discarded.
+
+    :param concurrency: The maximum number of page requests in flight at once. 1 fetches pages sequentially.
+    :param page_delay: Seconds each request slot waits after a request before fetching another page.
+    :param start_page: The first page to fetch.
+    :param skip_pages: Pages that are neither fetched nor yielded, e.g. pages completed by an earlier run of a resumed job.
+    :param retry_policy: When to retry failed requests, see `fetch_page`.
+    :param retry_budget: The retry budget of the job, shared by all its requests.
+    :param quota: The ScraperAPI quota shared by the jobs of the process.
+    :param metrics: Where to time the requests, see `fetch_page`.
+    :param tracer: Records the requests as spans, see `fetch_page`.
+    :return: An iterator of (page, response data) tuples. Errors fetching a page are raised when that page is reached.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+
+    logger = logging.getLogger(__name__)
+    skip_pages = skip_pages or set()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"fetch-{job_id}")
+    in_flight: Dict[int, Future] = {}
+    # stops the retries of discarded requests
+    cancelled = threading.Event()
+    next_page = start_page
+    current_page = start_page
+
+    try:
+        while True:
+            while len(in_flight) < concurrency:
+                while next_page in skip_pages:
+                    next_page += 1
+                in_flight[next_page] = executor.submit(
+                    fetch_page,
+                    job_id=job_id,
+                    page=next_page,
+                    query=query,
+                    start_date=start_date,
+                    end_date=end_date,
+                    scraper_api_key=scraper_api_key,
+                    page_delay=page_delay,
+                    search_url=search_url,
+                    retry_policy=retry_policy,
+                    retry_budget=retry_budget,
+                    cancelled=cancelled,
+                    quota=quota,
+                    metrics=metrics,
+                    tracer=tracer,
+                )
+                next_page += 1
+
+            while current_page in skip_pages:
+                current_page += 1
+            data = in_flight.pop(current_page).result()
+
+            if not data.get("organic_results"):
+                logger.info(f"{job_id}: Page {current_page} is empty, no more tweets for this query.")
+                return
+
+            yield current_page, data
+            current_page += 1
+    finally:
+        cancelled.set()
+        for future in in_flight.values():
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
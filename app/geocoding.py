@@ -0,0 +1,347 @@
+import csv
+import difflib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Literal, Protocol, Tuple
+
+from geopy.geocoders import Nominatim
+
+from app.llm_cache import normalize_text
+from app.quota import UpstreamQuota, get_quota_manager
+from app.retry import RetryPolicy
+from app.utils import normalize_words
+
+
+Coordinates = Tuple[float, float]
+
+# returned by GeocodeCache.get for locations that are not cached, as None is a cached negative result
+MISSING = object()
+
+
+class Geocoder(Protocol):
+    def geocode(self, location_name: str) -> Coordinates | None:
+        ...
+
+
+class RateLimiter:
+    """
+    Spaces calls at least `min_interval` seconds apart, across all threads sharing the limiter.
+    """
+
+    def __init__(self, min_interval: float) -> None:
+        self._min_interval = min_interval
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self._min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class GeocodeCache:
+    """
+    A persistent location -> coordinates cache in SQLite, with an in-memory map in front.
+    Negative results, i.e. locations the geocoder could not resolve, are cached as well and expire after `negative_ttl` seconds.
+    """
+
+    def __init__(self, cache_dir: str = ".cache", negative_ttl: float | None = 7 * 24 * 3600) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self._negative_ttl = negative_ttl
+        # location -> (coordinates, created_at), so that negative results expire in memory as they do on disk
+        self._memory: Dict[str, Tuple[Coordinates | None, float]] = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(cache_dir, "geocode_cache.sqlite"), check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS locations (location TEXT PRIMARY KEY, latitude REAL, longitude REAL, created_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, location_name: str) -> Any:
+        """
+        Return the cached coordinates, None for a cached negative result, or MISSING if the location is not cached.
+        """
+        key = normalize_text(location_name)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._connection.execute(
+                    "SELECT latitude, longitude, created_at FROM locations WHERE location = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return MISSING
+                latitude, longitude, created_at = row
+                coordinates = (latitude, longitude) if latitude is not None and longitude is not None else None
+                entry = self._memory[key] = (coordinates, created_at)
+            coordinates, created_at = entry
+            if self._expired(coordinates, created_at):
+                del self._memory[key]
+                return MISSING
+        return coordinates
+
+    def put(self, location_name: str, coordinates: Coordinates | None) -> None:
+        key = normalize_text(location_name)
+        latitude, longitude = coordinates if coordinates else (None, None)
+        created_at = time.time()
+        with self._lock:
+            self._memory[key] = (coordinates, created_at)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO locations (location, latitude, longitude, created_at) VALUES (?, ?, ?, ?)",
+                (key, latitude, longitude, created_at),
+            )
+            self._connection.commit()
+
+    def _expired(self, coordinates: Coordinates | None, created_at: float) -> bool:
+        return coordinates is None and self._negative_ttl is not None and time.time() - created_at > self._negative_ttl
+
+
+class NominatimGeocoder:
+    """
+    Geocodes location names with one shared Nominatim client, rate limited to one request per `min_interval` seconds,
+    following Nominatim's usage policy. Results, including negative ones, are cached when a cache is given.
+
+    Requests are serialized, so concurrent lookups of the same location reach Nominatim only once. With a retry policy,
+    failed requests are retried, each attempt still waiting for the rate limit. With a quota, requests draw from it instead
+    of `min_interval`, so that geocoders sharing the quota are rate limited together.
+    """
+
+    def __init__(
+            self,
+            user_agent: str = "location_to_lat_long",
+            min_interval: float = 1.0,
+            cache: GeocodeCache | None = None,
+            geolocator: Any = None,
+            retry_policy: RetryPolicy | None = None,
+            quota: UpstreamQuota | None = None,
+    ) -> None:
+        self._geolocator = geolocator if geolocator is not None else Nominatim(user_agent=user_agent)
+        self._rate_limiter = RateLimiter(min_interval)
+        self._cache = cache
+        self._retry_policy = retry_policy
+        self._quota = quota
+        self._request_lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    def geocode(self, location_name: str) -> Coordinates | None:
+        """
+        Resolve a location name to (latitude, longitude), or None if it could not be resolved.
+        Errors talking to Nominatim are logged, return None and are not cached.
+        """
+        if self._cache is not None:
+            cached = self._cache.get(location_name)
+            if cached is not MISSING:
+                return cached
+
+        with self._request_lock:
+            if self._cache is not None:
+                cached = self._cache.get(location_name)
+                if cached is not MISSING:
+                    return cached
+
+            def request() -> Any:
+                if self._quota is not None:
+                    return self._quota.call(lambda: self._geolocator.geocode(location_name))
+                self._rate_limiter.wait()
+                return self._geolocator.geocode(location_name)
+
+            try:
+                if self._retry_policy is not None:
+                    location = self._retry_policy.call(request, description=f"Geocoding '{location_name}'")
+                else:
+                    location = request()
+            except Exception as e:
+                self.logger.error(f"Could not geocode '{location_name}'. Error: {e}")
+                return None
+
+            coordinates = (location.latitude, location.longitude) if location else None
+            if self._cache is not None:
+                self._cache.put(location_name, coordinates)
+            return coordinates
+
+
+class GazetteerGeocoder:
+    """
+    Geocodes location names offline, from a gazetteer file loaded into memory.
+
+    Two TSV layouts are supported:
+    - GeoNames dumps, e.g. cities1000.txt: 19 columns, of which name, asciiname, alternatenames, latitude, longitude, country code and population are used
+    - a simple layout with a header row: name, country, latitude, longitude
+
+    Locations are looked up as "city,country". The city is matched exactly on its normalized name, and, failing that, fuzzily
+    against names starting with the same letter. Among candidates, places in the given country win, then the most populous.
+    The country can be an ISO code or a country name; names are learned from the simple layout or from a GeoNames countryInfo.txt.
+    """
+
+    def __init__(
+            self,
+            gazetteer_path: str,
+            country_info_path: str | None = None,
+            index_alternate_names: bool = False,
+            fuzzy_cutoff: float = 0.85,
+    ) -> None:
+        self._fuzzy_cutoff = fuzzy_cutoff
+        self._latitudes = array("d")
+        self._longitudes = array("d")
+        self._populations = array("q")
+        self._countries: List[str] = []
+        self._index: Dict[str, List[int]] = {}
+        self._country_codes: Dict[str, str] = {}
+        self._names_by_initial: Dict[str, List[str]] | None = None
+        self._logger = logging.getLogger(__name__)
+
+        if country_info_path:
+            self._load_country_info(country_info_path)
+        self._load(gazetteer_path, index_alternate_names)
+        self.logger.info(f"Loaded {len(self._countries)} places and {len(self._index)} names from gazetteer {gazetteer_path}")
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    def __len__(self) -> int:
+        return len(self._countries)
+
+    def geocode(self, location_name: str) -> Coordinates | None:
+        city, _, country = location_name.rpartition(",")
+        if not city:
+            city, country = country, ""
+        name = normalize_words(city)
+        country = normalize_words(country)
+        country_code = self._country_codes.get(country, country.upper())
+
+        candidates = self._index.get(name)
+        if candidates is None:
+            match = self._fuzzy_match(name)
+            if match is None:
+                return None
+            candidates = self._index[match]
+
+        best = max(
+            candidates,
+            key=lambda place: (self._countries[place] == country_code, self._populations[place]),
+        )
+        return self._latitudes[best], self._longitudes[best]
+
+    def _fuzzy_match(self, name: str) -> str | None:
+        if not name:
+            return None
+        if self._names_by_initial is None:
+            names_by_initial: Dict[str, List[str]] = {}
+            for indexed_name in self._index:
+                names_by_initial.setdefault(indexed_name[:1], []).append(indexed_name)
+            self._names_by_initial = names_by_initial
+        matches = difflib.get_close_matches(name, self._names_by_initial.get(name[:1], []), n=1, cutoff=self._fuzzy_cutoff)
+        return matches[0] if matches else None
+
+    def _add(self, names: List[str], country: str, latitude: float, longitude: float, population: int) -> None:
+        place = len(self._countries)
+        self._countries.append(country)
+        self._latitudes.append(latitude)
+        self._longitudes.append(longitude)
+        self._populations.append(population)
+        for name in {normalize_words(name) for name in names if name}:
+            self._index.setdefault(name, []).append(place)
+
+    def _load(self, gazetteer_path: str, index_alternate_names: bool) -> None:
+        with open(gazetteer_path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+            for row in reader:
+                if not row or row[0].startswith("#"):
+                    continue
+                if len(row) >= 19:
+                    names = [row[1], row[2]]
+                    if index_alternate_names:
+                        names.extend(row[3].split(","))
+                    self._add(names, row[8].upper(), float(row[4]), float(row[5]), int(row[14] or 0))
+                elif len(row) >= 4:
+                    try:
+                        latitude, longitude = float(row[2]), float(row[3])
+                    except ValueError:
+                        # header row
+                        continue
+                    country = normalize_words(row[1])
+                    country_code = self._country_codes.setdefault(country, country.upper())
+                    self._add([row[0]], country_code, latitude, longitude, 0)
+
+    def _load_country_info(self, country_info_path: str) -> None:
+        with open(country_info_path, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                if len(row) < 5 or row[0].startswith("#"):
+                    continue
+                code = row[0].upper()
+                self._country_codes[normalize_words(row[1])] = code  # ISO3
+                self._country_codes[normalize_words(row[4])] = code  # country name
+
+
+class FallbackGeocoder:
+    """
+    Tries the primary geocoder first, and the fallback only if the primary cannot resolve the location.
+    """
+
+    def __init__(self, primary: Geocoder, fallback: Geocoder) -> None:
+        self._primary = primary
+        self._fallback = fallback
+
+    def geocode(self, location_name: str) -> Coordinates | None:
+        coordinates = self._primary.geocode(location_name)
+        if coordinates is None:
+            coordinates = self._fallback.geocode(location_name)
+        return coordinates
+
+
+def create_geocoder(
+        backend: Literal["nominatim", "gazetteer", "offline"] = "nominatim",
+        gazetteer_path: str | None = None,
+        country_info_path: str | None = None,
+) -> Geocoder:
+    """
+    Create the geocoder for a job.
+
+    :param backend: "nominatim" uses the process-wide Nominatim geocoder, "gazetteer" a local gazetteer with Nominatim as fallback
+        on a miss, and "offline" the local gazetteer only.
+    :param gazetteer_path: The gazetteer TSV file, required by the "gazetteer" and "offline" backends.
+    :param country_info_path: An optional GeoNames countryInfo.txt, to resolve country names to codes.
+    """
+    if backend == "nominatim":
+        return get_default_geocoder()
+    if not gazetteer_path:
+        raise ValueError(f"The '{backend}' geocoder backend needs a gazetteer file")
+    gazetteer = GazetteerGeocoder(gazetteer_path, country_info_path=country_info_path)
+    if backend == "offline":
+        return gazetteer
+    if backend == "gazetteer":
+        return FallbackGeocoder(gazetteer, get_default_geocoder())
+    raise ValueError(f"Unknown geocoder backend '{backend}'")
+
+
+_default_geocoder: NominatimGeocoder | None = None
+_default_geocoder_lock = threading.Lock()
+
+
+def get_default_geocoder() -> NominatimGeocoder:
+    """
+    Return the process-wide geocoder, creating it on first use. Its cache lives in the directory set by GEOCODE_CACHE_DIR (default: .cache),
+    and it draws from the process-wide Nominatim quota.
+    Lookups that fail because Nominatim is unavailable or rate limiting are retried a few times, since the lookups of every job
+    wait behind them.
+    """
+    global _default_geocoder
+    with _default_geocoder_lock:
+        if _default_geocoder is None:
+            _default_geocoder = NominatimGeocoder(
+                cache=GeocodeCache(cache_dir=os.getenv("GEOCODE_CACHE_DIR", ".cache")),
+                retry_policy=RetryPolicy(max_attempts=3, max_delay=10.0, max_retry_after=30.0),
+                quota=get_quota_manager().get("nominatim"),
+            )
+        return _default_geocoder
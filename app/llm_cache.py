@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a formatted tweet for use in a cache key: unicode NFKC, case folded, whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class LLMCache:
+    """
+    A persistent cache of LLM completions, keyed by the kind of request, the model, the filter topic and the normalized tweet.
+
+    Entries are stored as JSON in a SQLite database in `cache_dir`, fronted by an in-process LRU of `memory_entries` entries.
+    Entries older than `ttl` seconds are treated as misses and evicted; once the database holds more than `max_entries`,
+    the least recently used entries are evicted.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str = ".cache",
+            ttl: float | None = 30 * 24 * 3600,
+            max_entries: int = 100_000,
+            memory_entries: int = 4096,
+    ) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self._path = os.path.join(cache_dir, "llm_cache.sqlite")
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._memory_entries = memory_entries
+        self._memory: OrderedDict[str, tuple[Dict[str, Any], float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._logger = logging.getLogger(__name__)
+
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS completions_accessed_at ON completions (accessed_at)")
+        if self._ttl is not None:
+            self._connection.execute("DELETE FROM completions WHERE created_at < ?", (time.time() - self._ttl,))
+        self._connection.commit()
+        self._size = self._connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self._hits, "misses": self._misses, "entries": self._size}
+
+    def key(self, kind: str, model: str, topic: str, text: str) -> str:
+        raw = json.dumps([kind, model, topic, normalize_text(text)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, kind: str, model: str, topic: str, text: str) -> Dict[str, Any] | None:
+        """
+        Return the cached completion for the request, or None on a miss.
+
+        :param kind: The kind of request, e.g. "filter" or "extract".
+        :param model: The model the completion was requested from.
+        :param topic: The filter topic of the request, empty if it does not depend on one.
+        :param text: The formatted tweet.
+        """
+        key = self.key(kind, model, topic, text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+
+            row = self._connection.execute("SELECT value, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                if row is not None:
+                    self._connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._connection.commit()
+                    self._size -= 1
+                self._memory.pop(key, None)
+                self._misses += 1
+                return None
+
+            self._connection.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            self._hits += 1
+            return value
+
+    def put(self, kind: str, model: str, topic: str, text: str, value: Dict[str, Any]) -> None:
+        """
+        Store a completion, as a JSON serializable dict, e.g. the `model_dump()` of the response model.
+        """
+        key = self.key(kind, model, topic, text)
+        now = time.time()
+
+        with self._lock:
+            inserted = self._connection.execute(
+                "INSERT OR IGNORE INTO completions (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            ).rowcount
+            if not inserted:
+                self._connection.execute(
+                    "UPDATE completions SET value = ?, created_at = ?, accessed_at = ? WHERE key = ?",
+                    (json.dumps(value), now, now, key),
+                )
+            self._size += inserted
+            if self._size > self._max_entries:
+                self._evict()
+            self._connection.commit()
+            self._remember(key, value, now)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self._ttl is not None and now - created_at > self._ttl
+
+    def _remember(self, key: str, value: Dict[str, Any], created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        # evict a tenth of the entries at once, so eviction does not run on every insert
+        excess = self._size - self._max_entries + max(1, self._max_entries // 10)
+        evicted = self._connection.execute(
+            "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY accessed_at LIMIT ?)",
+            (excess,),
+        ).rowcount
+        self._size -= evicted
+        self._memory.clear()
+        self.logger.info(f"Evicted {evicted} entries from the LLM cache at {self._path}")
@@ -0,0 +1,201 @@
+import bisect
+import contextlib
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+from app.geocoding import Coordinates, Geocoder, get_default_geocoder
+
+
+# seconds, from a cached lookup to a slow LLM completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} needs the labels {list(self.labels)}, got {list(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, per combination of label values.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError(f"{self.name} can only go up, got {amount}")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """
+    Counts observations into cumulative buckets by their upper bound, per combination of label values, and keeps their sum.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: the count of each bucket, not cumulative, the last one for +Inf, and the sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], [0.0]))
+            return sum(counts)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines = super().render()
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class ScrapeMetrics:
+    """
+    Latencies, throughput and errors of the scrape jobs of the process, labelled by job, rendered in the Prometheus
+    text format for the `/metrics` route.
+
+    Stages are "fetch" (ScraperAPI), "llm_filter" and "llm_extract" (OpenAI), "geocode", "upload" (object store) and
+    "register" (Kernel Planckster). Jobs run in worker processes, see JobExecutor, are counted in those processes.
+    """
+
+    def __init__(self) -> None:
+        self.stage_duration = Histogram("scraper_stage_duration_seconds", "Duration of the calls of each stage of a job", ("job", "stage"))
+        self.errors = Counter("scraper_errors_total", "Failed calls of each stage of a job", ("job", "stage"))
+        self.pages = Counter("scraper_pages_total", "Pages of search results processed by a job", ("job",))
+        self.tweets = Counter("scraper_tweets_total", "Tweets processed by a job", ("job",))
+        self.relevant_tweets = Counter("scraper_relevant_tweets_total", "Tweets of a job that were relevant and augmented", ("job",))
+        self.uploads = Counter("scraper_uploads_total", "Files a job uploaded and registered", ("job",))
+
+    @contextlib.contextmanager
+    def timed(self, stage: str, job_id: int) -> Iterator[None]:
+        """
+        Time a call of a stage, and count it as an error if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors.inc(job=job_id, stage=stage)
+            raise
+        finally:
+            self.stage_duration.observe(time.perf_counter() - start, job=job_id, stage=stage)
+
+    def render(self) -> str:
+        metrics: List[_Metric] = [self.stage_duration, self.errors, self.pages, self.tweets, self.relevant_tweets, self.uploads]
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+class TimedChatClient:
+    """
+    Wraps an instructor client, so that `chat.completions.create` is timed as the stage of its response model.
+
+    :param stages: The stage of each response model, e.g. {filterData: "llm_filter"}; other calls are timed as "llm".
+    """
+
+    def __init__(self, client: Any, metrics: ScrapeMetrics, job_id: int, stages: Dict[Any, str] | None = None) -> None:
+        self._client = client
+        self._metrics = metrics
+        self._job_id = job_id
+        self._stages = stages or {}
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs: Any) -> Any:
+        with self._metrics.timed(self._stages.get(kwargs.get("response_model"), "llm"), self._job_id):
+            return self._client.chat.completions.create(**kwargs)
+
+
+class TimedGeocoder:
+    """
+    Wraps a geocoder, so that its lookups are timed as the "geocode" stage.
+
+    :param geocoder: The geocoder to time, the process-wide default geocoder if None, which is created on first use.
+    """
+
+    def __init__(self, geocoder: Geocoder | None, metrics: ScrapeMetrics, job_id: int) -> None:
+        self._geocoder = geocoder
+        self._metrics = metrics
+        self._job_id = job_id
+
+    def geocode(self, location_name: str) -> Coordinates | None:
+        geocoder = self._geocoder if self._geocoder is not None else get_default_geocoder()
+        with self._metrics.timed("geocode", self._job_id):
+            return geocoder.geocode(location_name)
+
+
+_default_metrics: ScrapeMetrics | None = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> ScrapeMetrics:
+    """
+    Return the process-wide scrape metrics.
+    """
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = ScrapeMetrics()
+        return _default_metrics
@@ -0,0 +1,235 @@
+import logging
+import math
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+
+# page keys of a partitioned job are `window.index * WINDOW_PAGE_STRIDE + page`, so they stay unique across windows
+WINDOW_PAGE_STRIDE = 100_000
+
+PageSource = Callable[..., Iterator[Tuple[int, Dict[str, Any]]]]
+
+
+class DateWindow(BaseModel):
+    """
+    A part of a job's date range, scraped as its own paginated query.
+
+    @attr index: the position of the window in the job's plan, which makes its page keys unique
+    @attr start: the first day of the window
+    @attr end: the day after the last day of the window, like the `end_date` of a query
+    @attr expected_pages: the number of pages the upstream expects for the window, if known
+    @attr first_page: the first page, if it was fetched to plan the window; not persisted
+    """
+    index: int = 0
+    start: date
+    end: date
+    expected_pages: int | None = None
+    first_page: Dict[str, Any] | None = Field(default=None, exclude=True)
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days
+
+    def key(self, page: int) -> int:
+        """
+        The job-wide key of a page of this window.
+        """
+        return self.index * WINDOW_PAGE_STRIDE + page
+
+    def pages_of(self, keys: Set[int]) -> Set[int]:
+        """
+        The pages of this window among job-wide page keys.
+        """
+        return {key - self.index * WINDOW_PAGE_STRIDE for key in keys if key // WINDOW_PAGE_STRIDE == self.index}
+
+    def split(self) -> List["DateWindow"]:
+        """
+        Split the window in two halves, by days.
+        """
+        middle = self.start + timedelta(days=self.days // 2)
+        return [DateWindow(start=self.start, end=middle), DateWindow(start=middle, end=self.end)]
+
+    def split_days(self) -> List["DateWindow"]:
+        return [DateWindow(start=self.start + timedelta(days=i), end=self.start + timedelta(days=i + 1)) for i in range(self.days)]
+
+
+def expected_pages(data: Dict[str, Any] | None) -> int | None:
+    """
+    Estimate the number of pages of a query from its first page, if the upstream reports its total number of results.
+    """
+    if not data or not data.get("organic_results"):
+        return 0
+    total = (data.get("search_information") or {}).get("total_results")
+    if not isinstance(total, int):
+        return None
+    return max(1, math.ceil(total / len(data["organic_results"])))
+
+
+def daily_windows(start_date: str, end_date: str) -> List[DateWindow]:
+    """
+    One window per day of the range `start_date`..`end_date`, the end excluded.
+    """
+    window = DateWindow(start=date.fromisoformat(start_date), end=date.fromisoformat(end_date))
+    if window.days < 1:
+        raise ValueError(f"The date range {start_date}..{end_date} needs to span at least one day to be partitioned")
+    return _indexed(window.split_days())
+
+
+def plan_windows(
+    job_id: int,
+    start_date: str,
+    end_date: str,
+    probe: Callable[[DateWindow], Dict[str, Any] | None],
+    max_pages: int = 10,
+    min_days: int = 1,
+    concurrency: int = 4,
+) -> List[DateWindow]:
+    """
+    Split the range `start_date`..`end_date`, the end excluded, into windows of about `max_pages` pages at most.
+
+    Starting from the whole range, each window is probed for its first page, and split in halves while the upstream
+    expects more than `max_pages` pages for it and it spans more than `min_days` days. Windows whose volume the upstream
+    does not report are split into days. The first pages are kept on the windows, so probing costs no extra requests.
+
+    :param probe: Fetches the first page of a window, or returns None if it has no results.
+    :param concurrency: The number of windows probed at once.
+    """
+    logger = logging.getLogger(__name__)
+    pending = [DateWindow(start=date.fromisoformat(start_date), end=date.fromisoformat(end_date))]
+    if pending[0].days < 1:
+        raise ValueError(f"The date range {start_date}..{end_date} needs to span at least one day to be partitioned")
+
+    windows: List[DateWindow] = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"probe-{job_id}") as executor:
+        while pending:
+            split: List[DateWindow] = []
+            for window, first_page in zip(pending, executor.map(probe, pending)):
+                window.first_page = first_page
+                window.expected_pages = expected_pages(first_page)
+                if window.days <= min_days or (window.expected_pages is not None and window.expected_pages <= max_pages):
+                    windows.append(window)
+                elif window.expected_pages is None:
+                    split.extend(window.split_days())
+                else:
+                    split.extend(window.split())
+            pending = split
+
+    windows = _indexed(windows)
+    logger.info(f"{job_id}: Planned {len(windows)} windows: " + ", ".join(f"{w.start}..{w.end} ({w.expected_pages} pages)" for w in windows))
+    return windows
+
+
+def _indexed(windows: List[DateWindow]) -> List[DateWindow]:
+    windows = sorted(windows, key=lambda window: window.start)
+    for index, window in enumerate(windows):
+        window.index = index
+    return windows
+
+
+_DONE = object()
+
+
+def fetch_windows(
+    job_id: int,
+    windows: List[DateWindow],
+    fetch: PageSource,
+    concurrency: int = 4,
+    page_concurrency: int = 1,
+    skip_pages: Set[int] | None = None,
+    **fetch_kwargs: Any,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Fetch the pages of several windows at once, and yield them as they arrive, keyed by `DateWindow.key`.
+
+    Windows are taken longest first, by their expected pages, so that the longest pagination chains start early and the
+    total time approaches that of the longest window.
+
+    :param fetch: Yields the pages of a query, like `fetch_pages`, which it is called with `start_date`, `end_date`,
+        `start_page`, `skip_pages`, `concurrency` and `fetch_kwargs`.
+    :param concurrency: The number of windows fetched at once.
+    :param page_concurrency: The number of pages of a window fetched at once.
+    :param skip_pages: Page keys that are neither fetched nor yielded, e.g. the pages completed by an earlier run.
+    :return: An iterator of (page key, response data) tuples. The first error of a window is raised once it is reached.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+
+    skip_pages = skip_pages or set()
+    work: "queue.Queue[DateWindow]" = queue.Queue()
+    for window in sorted(windows, key=lambda window: -(window.expected_pages or 0)):
+        work.put(window)
+    results: queue.Queue = queue.Queue(maxsize=2 * concurrency)
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def window_pages(window: DateWindow) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        if window.expected_pages == 0:
+            return
+        skip = window.pages_of(skip_pages)
+        start_page = 1
+        if window.first_page is not None:
+            if 1 not in skip:
+                yield 1, window.first_page
+            start_page = 2
+        pages = fetch(
+            job_id=job_id,
+            start_date=window.start.isoformat(),
+            end_date=window.end.isoformat(),
+            start_page=start_page,
+            skip_pages=skip,
+            concurrency=page_concurrency,
+            **fetch_kwargs,
+        )
+        try:
+            yield from pages
+        finally:
+            pages.close()
+
+    def worker() -> None:
+        try:
+            while not stopped.is_set():
+                try:
+                    window = work.get_nowait()
+                except queue.Empty:
+                    return
+                pages = window_pages(window)
+                try:
+                    for page, data in pages:
+                        if not put((window.key(page), data)):
+                            return
+                finally:
+                    pages.close()
+        except Exception as error:
+            put(error)
+        finally:
+            put(_DONE)
+
+    threads = [threading.Thread(target=worker, name=f"window-{job_id}-{i}", daemon=True) for i in range(min(concurrency, len(windows)))]
+    for thread in threads:
+        thread.start()
+
+    try:
+        running = len(threads)
+        while running:
+            item = results.get()
+            if item is _DONE:
+                running -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stopped.set()
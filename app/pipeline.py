@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List
+
+from pydantic import BaseModel
+
+from app.sdk.models import KernelPlancksterSourceData
+
+
+class StageConfig(BaseModel):
+    """
+    Configuration of a single pipeline stage.
+
+    Attributes:
+    - workers: the number of threads processing items of this stage
+    - queue_size: the maximum number of items waiting for this stage; producers block when it is full
+    """
+    workers: int = 1
+    queue_size: int = 4
+
+
+class PipelineConfig(BaseModel):
+    """
+    Per-stage configuration of the scrape pipeline: fetch -> dedup -> augment -> persist -> upload.
+    Fetch concurrency is configured separately, through `fetch_concurrency`. The dedup stage only runs with a dedup index.
+    """
+    dedup: StageConfig = StageConfig()
+    augment: StageConfig = StageConfig()
+    persist: StageConfig = StageConfig()
+    upload: StageConfig = StageConfig()
+
+
+class ScrapedPage(BaseModel):
+    """
+    A page of search results, as it travels through the scrape pipeline.
+
+    @attr page: the page number in the search results
+    @attr tweets: the raw tweets of the page, without the duplicates of tweets already seen if deduplication is on
+    @attr augmented: the augmented rows of the relevant tweets of the page
+    @attr local_file: the local file the raw tweets were persisted to
+    @attr source_data: the source data the raw tweets were registered as
+    """
+    page: int
+    tweets: List[dict]
+    augmented: List[list] = []
+    local_file: str | None = None
+    source_data: KernelPlancksterSourceData | None = None
+
+
+class PipelineStage:
+    """
+    A stage of a Pipeline. `func` is called with each item and returns the item to hand to the next stage, or None to drop it.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1, queue_size: int = 4) -> None:
+        if workers < 1:
+            raise ValueError(f"Stage '{name}' needs at least one worker, got {workers}")
+        if queue_size < 1:
+            raise ValueError(f"Stage '{name}' needs a queue size of at least 1, got {queue_size}")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+
+    @classmethod
+    def from_config(cls, name: str, func: Callable[[Any], Any], config: StageConfig) -> "PipelineStage":
+        return cls(name=name, func=func, workers=config.workers, queue_size=config.queue_size)
+
+
+_DONE = object()
+
+
+class Pipeline:
+    """
+    Runs items from a source through a chain of stages. Each stage has its own worker threads and a bounded input queue,
+    so the stages overlap, and a slow stage blocks the ones before it instead of letting work pile up in memory.
+    """
+
+    def __init__(self, job_id: int, stages: List[PipelineStage]) -> None:
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self._job_id = job_id
+        self._stages = stages
+        self._errors: List[str] = []
+        self._processed: Dict[str, int] = {stage.name: 0 for stage in stages}
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def errors(self) -> List[str]:
+        return self._errors
+
+    @property
+    def processed(self) -> Dict[str, int]:
+        return self._processed
+
+    def run(self, source: Iterable[Any]) -> None:
+        """
+        Feed every item of `source` into the first stage and block until all stages have drained.
+
+        Items failing in a stage are logged, recorded in `errors` and dropped. Errors raised by the source itself are re-raised
+        once the items already in the pipeline have been processed.
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self._stages]
+        remaining_workers = [stage.workers for stage in self._stages]
+        threads: List[threading.Thread] = []
+
+        for index, stage in enumerate(self._stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(index, queues, remaining_workers),
+                    name=f"{self._job_id}-{stage.name}-{worker}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in source:
+                queues[0].put(item)
+        finally:
+            for _ in range(self._stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+    def _work(self, index: int, queues: List[queue.Queue], remaining_workers: List[int]) -> None:
+        stage = self._stages[index]
+        is_last = index == len(self._stages) - 1
+
+        while True:
+            item = queues[index].get()
+            if item is _DONE:
+                break
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                error = f"{self._job_id}: Stage '{stage.name}' failed: {e}"
+                self.logger.error(error)
+                with self._lock:
+                    self._errors.append(error)
+                continue
+            with self._lock:
+                self._processed[stage.name] += 1
+            if result is not None and not is_last:
+                queues[index + 1].put(result)
+
+        with self._lock:
+            remaining_workers[index] -= 1
+            last_worker = remaining_workers[index] == 0
+
+        if last_worker and not is_last:
+            for _ in range(self._stages[index + 1].workers):
+                queues[index + 1].put(_DONE)
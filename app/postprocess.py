@@ -0,0 +1,94 @@
+import collections
+import itertools
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Iterable, Iterator, List, TypeVar
+
+from app.sdk.job_executor import process_context
+
+
+T = TypeVar("T")
+
+
+class PostProcessingPool:
+    """
+    Runs the CPU-bound post-processing of a job, like formatting and scoring tweets and serializing pages and final
+    artifacts, in worker processes, so that it is not limited to the one core the GIL leaves to the job's threads.
+
+    Work is sent in batches, a page or a chunk of lines at a time, as plain tuples and strings, so that pickling costs
+    little compared to the work itself. The functions run in the pool must be defined at module level.
+
+    With `workers=0`, everything runs inline in the calling thread.
+
+    :param workers: The number of worker processes, 0 to run inline.
+    :param max_pending: The number of batches `map` keeps in flight at once, twice the number of workers by default.
+    """
+
+    def __init__(self, workers: int = 0, max_pending: int | None = None) -> None:
+        if workers < 0:
+            raise ValueError(f"workers must not be negative, got {workers}")
+        self._workers = workers
+        self._max_pending = max_pending or 2 * max(workers, 1)
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=process_context()) if workers else None
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Run `func(*args)` in a worker process and wait for its result.
+        """
+        if self._executor is None:
+            return func(*args)
+        return self._executor.submit(func, *args).result()
+
+    def map(self, func: Callable[..., T], batches: Iterable[Any]) -> Iterator[T]:
+        """
+        Yield `func(batch)` for each batch, in order, with up to `max_pending` batches processed at once.
+        Batches are taken from `batches` lazily, so a large input is never held in memory at once.
+        """
+        if self._executor is None:
+            yield from map(func, batches)
+            return
+
+        pending: Deque[Future] = collections.deque()
+        batches = iter(batches)
+        try:
+            for batch in itertools.islice(batches, self._max_pending):
+                pending.append(self._executor.submit(func, batch))
+            while pending:
+                result = pending.popleft().result()
+                for batch in itertools.islice(batches, 1):
+                    pending.append(self._executor.submit(func, batch))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self) -> "PostProcessingPool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Split `items` into lists of `size` items, the last one possibly shorter.
+    """
+    if size < 1:
+        raise ValueError(f"size must be at least 1, got {size}")
+    items = iter(items)
+    while chunk := list(itertools.islice(items, size)):
+        yield chunk
@@ -0,0 +1,152 @@
+import collections
+import json
+import logging
+import math
+import re
+import threading
+from typing import Any, Dict, List, Literal, Tuple
+
+from app.utils import normalize_words
+
+
+PrefilterBand = Literal["drop", "llm", "accept"]
+
+# Keyword weights per filter topic. Keywords match whole words; a trailing "*" makes the last word a stem, so "evacuat*"
+# matches "evacuation" and "evacuated". Stems are kept to prefixes that no unrelated word starts with: "fire" is spelled
+# out, since "fire*" would match "fireworks" and "fired".
+TOPIC_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "forest wildfire": {
+        "wildfire*": 4.0,
+        "bushfire*": 4.0,
+        "forest fire*": 4.0,
+        "brush fire*": 3.0,
+        "fire": 2.0,
+        "fires": 2.0,
+        "blaze": 2.0,
+        "blazes": 2.0,
+        "blazing": 2.0,
+        "flame": 1.5,
+        "flames": 1.5,
+        "burn": 1.5,
+        "burns": 1.5,
+        "burned": 1.5,
+        "burning": 1.5,
+        "burnt": 1.5,
+        "smoke": 1.0,
+        "smoky": 1.0,
+        "firefight*": 2.0,
+        "evacuat*": 1.5,
+        "acre": 1.0,
+        "acres": 1.0,
+        "containment": 1.5,
+        "red flag warning*": 2.0,
+        "forest": 1.0,
+        "forests": 1.0,
+        "ember": 1.0,
+        "embers": 1.0,
+    },
+}
+
+
+class KeywordPrefilter:
+    """
+    Scores tweets locally against weighted topic keywords, so that only ambiguous tweets need the LLM relevance filter.
+
+    A tweet's score is the sum of the weights of the keywords it contains, each counted with a sublinear term frequency
+    (1 + log(tf)). Tweets scoring below `low` are dropped, tweets scoring at least `high` are accepted without asking the LLM,
+    and the tweets in between go to the LLM. The number of tweets in each band is counted, to tune the thresholds.
+    """
+
+    def __init__(self, keywords: Dict[str, float], low: float = 1.0, high: float = 6.0) -> None:
+        if low > high:
+            raise ValueError(f"The low threshold ({low}) must not exceed the high threshold ({high})")
+        # (words, whether the last word is a stem, weight)
+        self._keywords: List[Tuple[Tuple[str, ...], bool, float]] = []
+        for keyword, weight in keywords.items():
+            words = tuple(normalize_words(keyword).split())
+            if not words:
+                raise ValueError(f"Keyword '{keyword}' has no words")
+            self._keywords.append((words, keyword.strip().endswith("*"), weight))
+        self._low = low
+        self._high = high
+        self._counts: Dict[str, int] = {"drop": 0, "llm": 0, "accept": 0}
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    @classmethod
+    def for_topic(cls, topic: str, low: float = 1.0, high: float = 6.0) -> "KeywordPrefilter":
+        """
+        Create the prefilter for one of the topics in TOPIC_KEYWORDS.
+        """
+        if topic not in TOPIC_KEYWORDS:
+            raise ValueError(f"No prefilter keywords for topic '{topic}'. Known topics: {list(TOPIC_KEYWORDS)}")
+        return cls(TOPIC_KEYWORDS[topic], low=low, high=high)
+
+    @classmethod
+    def from_file(cls, path: str) -> "KeywordPrefilter":
+        """
+        Load a prefilter from a JSON file of the form {"keywords": {"wildfire": 4.0, ...}, "low": 1.0, "high": 6.0}.
+        """
+        with open(path, "r") as f:
+            config = json.load(f)
+        return cls(config["keywords"], low=config.get("low", 1.0), high=config.get("high", 6.0))
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+    def score(self, text: str) -> float:
+        tokens = normalize_words(text).split()
+        counts = collections.Counter(tokens)
+
+        score = 0.0
+        for words, stem, weight in self._keywords:
+            if len(words) == 1 and not stem:
+                tf = counts[words[0]]
+            else:
+                tf = sum(1 for start in range(len(tokens) - len(words) + 1) if _matches(tokens, start, words, stem))
+            if tf:
+                score += weight * (1 + math.log(tf))
+        return score
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # sent to post-processing workers to score tweets there; the band counts stay with the original
+        state = self.__dict__.copy()
+        del state["_lock"], state["_logger"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    def classify(self, text: str) -> PrefilterBand:
+        return self.band(self.score(text))
+
+    def band(self, score: float) -> PrefilterBand:
+        """
+        The band of a tweet with the given score, which is counted.
+        """
+        if score < self._low:
+            band: PrefilterBand = "drop"
+        elif score >= self._high:
+            band = "accept"
+        else:
+            band = "llm"
+        with self._lock:
+            self._counts[band] += 1
+        return band
+
+    def classify_all(self, texts: List[str]) -> List[PrefilterBand]:
+        return [self.classify(text) for text in texts]
+
+
+def _matches(tokens: List[str], start: int, words: Tuple[str, ...], stem: bool) -> bool:
+    last = start + len(words) - 1
+    if tuple(tokens[start:last]) != words[:-1]:
+        return False
+    return tokens[last].startswith(words[-1]) if stem else tokens[last] == words[-1]
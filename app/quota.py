@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, TypeVar
+
+from pydantic import BaseModel, computed_field
+
+from app.retry import retry_after_of, status_of
+
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at `rate` tokens per second up to `capacity`, shared by all threads that draw from it.
+
+    Callers reserve their tokens up front and may drive the bucket into debt, so each caller learns right away how long
+    it has to wait. Waiters are served in the order they arrived, spaced by the refill rate, instead of all retrying at
+    once when the bucket refills.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self._rate = rate
+        self._capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def capacity(self) -> float:
+        return self._capacity
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """
+        Take `amount` tokens and return the seconds to wait before using them.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self._rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hand out no tokens for the next `seconds`, e.g. after the upstream asked to back off.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self._rate)
+
+
+class QuotaStats(BaseModel):
+    """
+    How much the calls to an upstream waited for its quota.
+
+    Attributes:
+    - upstream: the name of the upstream
+    - requests_per_second: the request quota, None if unlimited
+    - tokens_per_minute: the token quota, None if unlimited
+    - requests: the calls that drew from the quota
+    - waited: the calls that had to wait
+    - total_wait: the seconds waited in total
+    - max_wait: the longest wait, in seconds
+    - rate_limited: the calls the upstream rejected as rate limited, despite the quota
+    """
+    upstream: str
+    requests_per_second: float | None = None
+    tokens_per_minute: float | None = None
+    requests: int = 0
+    waited: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    rate_limited: int = 0
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.requests if self.requests else 0.0
+
+
+class UpstreamQuota:
+    """
+    The request and token quotas of one upstream, shared by all jobs of the process.
+
+    :param requests_per_second: The request rate, unlimited if None.
+    :param tokens_per_minute: The token rate, e.g. OpenAI's TPM limit, unlimited if None.
+    :param burst: The seconds of quota that may be used at once after an idle period. 0 spaces all requests evenly.
+    """
+
+    def __init__(self, name: str, requests_per_second: float | None = None, tokens_per_minute: float | None = None, burst: float = 1.0) -> None:
+        self._name = name
+        self._requests = TokenBucket(requests_per_second, max(1.0, requests_per_second * burst)) if requests_per_second else None
+        self._tokens = TokenBucket(tokens_per_minute / 60, max(1.0, tokens_per_minute / 60 * burst)) if tokens_per_minute else None
+        self._stats = QuotaStats(upstream=name, requests_per_second=requests_per_second, tokens_per_minute=tokens_per_minute)
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def acquire(self, tokens: float = 0) -> float:
+        """
+        Wait until a request using `tokens` tokens fits the quota. Returns the seconds waited.
+        """
+        delay = 0.0
+        if self._requests is not None:
+            delay = self._requests.reserve(1)
+        if self._tokens is not None and tokens > 0:
+            delay = max(delay, self._tokens.reserve(tokens))
+        with self._lock:
+            self._stats.requests += 1
+            if delay > 0:
+                self._stats.waited += 1
+                self._stats.total_wait += delay
+                self._stats.max_wait = max(self._stats.max_wait, delay)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def call(self, func: Callable[[], T], tokens: float = 0) -> T:
+        """
+        Call `func` once the quota allows it. When the upstream still answers 429, the quota is paused for its Retry-After,
+        so the other jobs back off with it instead of running into the limit as well.
+        """
+        self.acquire(tokens)
+        try:
+            return func()
+        except Exception as error:
+            if status_of(error) == 429 or type(error).__name__ == "GeocoderRateLimited":
+                with self._lock:
+                    self._stats.rate_limited += 1
+                retry_after = retry_after_of(error)
+                if retry_after:
+                    for bucket in (self._requests, self._tokens):
+                        if bucket is not None:
+                            bucket.pause(retry_after)
+            raise
+
+    def stats(self) -> QuotaStats:
+        with self._lock:
+            return self._stats.model_copy()
+
+
+class QuotaManager:
+    """
+    The quotas of the upstreams the scraper calls: "scraperapi", "openai" and "nominatim".
+    """
+
+    UPSTREAMS = ("scraperapi", "openai", "nominatim")
+
+    def __init__(self, quotas: Dict[str, UpstreamQuota] | None = None) -> None:
+        self._quotas = dict(quotas or {})
+        for name in self.UPSTREAMS:
+            self._quotas.setdefault(name, UpstreamQuota(name))
+
+    @classmethod
+    def from_env(cls) -> "QuotaManager":
+        """
+        Read the quotas from the environment:
+        - SCRAPERAPI_REQUESTS_PER_SECOND
+        - OPENAI_REQUESTS_PER_SECOND and OPENAI_TOKENS_PER_MINUTE
+        - NOMINATIM_REQUESTS_PER_SECOND, 1 by default, as Nominatim's usage policy asks
+        - QUOTA_BURST_SECONDS, the seconds of quota that may be used at once, 1 by default
+        Unset or empty quotas are unlimited. Values must be positive numbers; 0 is rejected rather than read as unlimited.
+        """
+        burst = _float_env("QUOTA_BURST_SECONDS")
+        if burst is None:
+            burst = 1.0
+        nominatim = _float_env("NOMINATIM_REQUESTS_PER_SECOND")
+        if nominatim is None:
+            nominatim = 1.0
+        return cls({
+            "scraperapi": UpstreamQuota("scraperapi", _float_env("SCRAPERAPI_REQUESTS_PER_SECOND"), burst=burst),
+            "openai": UpstreamQuota("openai", _float_env("OPENAI_REQUESTS_PER_SECOND"), _float_env("OPENAI_TOKENS_PER_MINUTE"), burst=burst),
+            "nominatim": UpstreamQuota("nominatim", nominatim, burst=burst),
+        })
+
+    def get(self, upstream: str) -> UpstreamQuota:
+        if upstream not in self._quotas:
+            raise ValueError(f"Unknown upstream '{upstream}', expected one of {', '.join(self._quotas)}")
+        return self._quotas[upstream]
+
+    def stats(self) -> List[QuotaStats]:
+        return [quota.stats() for quota in self._quotas.values()]
+
+
+def _float_env(name: str) -> float | None:
+    value = os.getenv(name)
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got '{value}'")
+    if not number > 0:
+        raise ValueError(f"{name} must be positive, got '{value}'")
+    return number
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], completion_tokens: int = 256) -> int:
+    """
+    A rough estimate of the tokens a chat completion uses, about 4 characters per token, to draw from a token quota
+    before the request is made.
+    """
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4 + completion_tokens
+
+
+class QuotaLimitedChatClient:
+    """
+    Wraps an instructor client, so that `chat.completions.create` draws from the OpenAI quota.
+    """
+
+    def __init__(self, client: Any, quota: UpstreamQuota) -> None:
+        self._client = client
+        self._quota = quota
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs: Any) -> Any:
+        return self._quota.call(
+            lambda: self._client.chat.completions.create(**kwargs),
+            tokens=estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens") or 256),
+        )
+
+
+_default_quota_manager: QuotaManager | None = None
+_default_quota_manager_lock = threading.Lock()
+
+
+def get_quota_manager() -> QuotaManager:
+    """
+    Return the process-wide quota manager, read from the environment on first use. Jobs run in worker processes, see
+    JobExecutor, each get the quota manager of their process, so the quotas are not shared with the server's other jobs.
+    """
+    global _default_quota_manager
+    with _default_quota_manager_lock:
+        if _default_quota_manager is None:
+            _default_quota_manager = QuotaManager.from_env()
+        return _default_quota_manager
@@ -0,0 +1,185 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, FrozenSet, TypeVar
+
+from pydantic import BaseModel
+
+
+T = TypeVar("T")
+
+
+class RetryBudgetExhausted(Exception):
+    """
+    Raised when a call fails with a retryable error after its job has used up its retry budget.
+    """
+
+
+class RetryBudget:
+    """
+    The number of retries a job may spend in total, across all its calls and threads, so that an upstream that keeps failing
+    fails the job instead of retrying forever.
+    """
+
+    def __init__(self, max_retries: int) -> None:
+        if max_retries < 0:
+            raise ValueError(f"max_retries must not be negative, got {max_retries}")
+        self._max_retries = max_retries
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    @property
+    def remaining(self) -> int:
+        return self._max_retries - self._used
+
+    def consume(self) -> bool:
+        """
+        Take one retry from the budget. Returns False, without taking it, if the budget is used up.
+        """
+        with self._lock:
+            if self._used >= self._max_retries:
+                return False
+            self._used += 1
+            return True
+
+
+def status_of(error: BaseException) -> int | None:
+    """
+    The HTTP status code of an error raised by requests, httpx or openai, if it carries one.
+    """
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_of(error: BaseException) -> float | None:
+    """
+    The delay in seconds an error asks for, from its response's `Retry-After` header (seconds or an HTTP date), or from
+    geopy's `retry_after`.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+# errors without a status code that are worth retrying: connection problems, timeouts and garbled responses
+_RETRYABLE_ERROR_NAMES = frozenset({
+    "ConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout", "ChunkedEncodingError", "JSONDecodeError",
+    "TransportError", "TimeoutException", "NetworkError", "RemoteProtocolError",
+    "APIConnectionError", "APITimeoutError",
+    "GeocoderUnavailable", "GeocoderTimedOut", "GeocoderRateLimited",
+})
+
+
+class RetryPolicy(BaseModel):
+    """
+    When and how long to wait before retrying a failed call.
+
+    Calls failing with a status in `retryable_statuses`, or with a connection error or timeout, are retried up to
+    `max_attempts` times in total. Other errors, e.g. 400 or 401, are fatal and raised right away. The delay before retry n
+    is drawn uniformly from [0, min(max_delay, base_delay * 2 ** n)] ("full jitter"), unless the response asks for a longer
+    one with `Retry-After`, which is honoured up to `max_retry_after` seconds.
+
+    Attributes:
+    - max_attempts: the number of attempts per call, including the first one
+    - base_delay: the backoff before the first retry, in seconds
+    - max_delay: the longest backoff, in seconds
+    - max_retry_after: the longest `Retry-After` that is honoured, in seconds
+    - retryable_statuses: the HTTP statuses that are retried
+    """
+    max_attempts: int = 8
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    max_retry_after: float = 300.0
+    retryable_statuses: FrozenSet[int] = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+    def is_retryable(self, error: BaseException) -> bool:
+        status = status_of(error)
+        if status is not None:
+            return status in self.retryable_statuses
+        return any(cls.__name__ in _RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+    def delay(self, attempt: int, error: BaseException | None = None) -> float:
+        """
+        The delay before retrying after the `attempt`-th failed attempt, counting from 0.
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_of(error) if error is not None else None
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_retry_after))
+        return backoff
+
+    def call(
+        self,
+        func: Callable[[], T],
+        budget: RetryBudget | None = None,
+        description: str = "call",
+        sleep: Callable[[float], Any] = time.sleep,
+    ) -> T:
+        """
+        Call `func`, retrying it according to this policy.
+
+        :param budget: The retry budget of the job, shared with its other calls. Each retry takes one from it.
+        :param description: What is being called, for logging.
+        :param sleep: Waits for the given number of seconds; replaceable for tests.
+        :raises RetryBudgetExhausted: If a retryable error occurs and the budget is used up.
+        :return: The result of `func`. Fatal errors, and the last error once `max_attempts` is reached, are re-raised.
+        """
+        logger = logging.getLogger(__name__)
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as error:
+                if not self.is_retryable(error) or attempt + 1 >= self.max_attempts:
+                    raise
+                if budget is not None and not budget.consume():
+                    raise RetryBudgetExhausted(f"Retry budget used up, giving up on {description}: {error}") from error
+                delay = self.delay(attempt, error)
+                logger.warning(f"{description} failed (attempt {attempt + 1} of {self.max_attempts}), retrying in {delay:.1f}s: {error}")
+                sleep(delay)
+                attempt += 1
+
+
+class RetryingChatClient:
+    """
+    Wraps an instructor client, so that `chat.completions.create` is retried according to a policy and budget.
+    """
+
+    def __init__(self, client: Any, policy: RetryPolicy, budget: RetryBudget | None = None) -> None:
+        self._client = client
+        self._policy = policy
+        self._budget = budget
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs: Any) -> Any:
+        return self._policy.call(
+            lambda: self._client.chat.completions.create(**kwargs),
+            budget=self._budget,
+            description=f"{kwargs.get('model', 'OpenAI')} completion",
+        )
@@ -1,21 +1,36 @@
 from logging import Logger
 import logging
-import requests
-import pandas as pd
 import json
 import time
 import sys
+import threading
+from concurrent.futures import Future
+from app.checkpoint import ScrapeCheckpoint
+from app.dedup import DedupIndex
+from app.fetcher import fetch_pages
+from app.geocoding import Geocoder, get_default_geocoder
+from app.llm_cache import LLMCache
+from app.metrics import ScrapeMetrics, TimedChatClient, TimedGeocoder, get_metrics
+from app.partitioning import DateWindow, daily_windows, fetch_windows, plan_windows
+from app.pipeline import Pipeline, PipelineConfig, PipelineStage, ScrapedPage
+from app.postprocess import PostProcessingPool
+from app.prefilter import KeywordPrefilter
+from app.quota import QuotaLimitedChatClient, QuotaManager, get_quota_manager
+from app.retry import RetryBudget, RetryBudgetExhausted, RetryingChatClient, RetryPolicy
+from app.tracing import TracedChatClient, TracedGeocoder, Tracer, get_span_exporter, traced
+from app.sharding import ScrapedShard, ShardBuffer, save_shard, save_shard_manifest
+from app.sdk.job_executor import JobCancelled
 from app.sdk.models import KernelPlancksterSourceData, BaseJobState, JobOutput
+from app.tweet_stream import TweetStreamWriter
 from app.sdk.scraped_data_repository import ScrapedDataRepository
 import os 
 import uuid
 import re
 from pydantic import BaseModel
-from typing import Literal
+from typing import Iterator, List, Literal, Sequence
 import instructor
 from instructor import Instructor
 from openai import OpenAI
-from geopy.geocoders import Nominatim
 import shutil 
 
 class messageData(BaseModel):
@@ -36,9 +51,22 @@ class messageData(BaseModel):
 #     day: Literal['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20', '21', '22', '23', '24', '25', '26', '27', '28', '29', '30', '31', 'Unsure']
 #     disaster_type: Literal['Wildfire', 'Other']
 
+FILTER_MODEL = "gpt-4"
+EXTRACTION_MODEL = "gpt-4-turbo"
+
 class filterData(BaseModel):
     relevant: bool
 
+class batchFilterData(BaseModel):
+    relevant: List[bool]
+
+AUGMENTED_FORMATS = ("json", "parquet")
+# "daily" scrapes every day of the date range as its own query, "adaptive" splits the range by the volume of its parts
+PARTITION_MODES = ("none", "daily", "adaptive")
+
+# the stages the LLM calls are timed as, by response model
+LLM_STAGES = {filterData: "llm_filter", batchFilterData: "llm_filter", messageData: "llm_extract"}
+
 class TwitterScrapeRequestModel(BaseModel):
     query: str
     outfile: str
@@ -56,8 +84,40 @@ def scrape(
     work_dir: str,
     log_level: Logger,
     scraper_api_key: str,
-    openai_api_key: str
+    openai_api_key: str,
+    fetch_concurrency: int = 1,
+    pipeline_config: PipelineConfig | None = None,
+    filter_batch_size: int = 20,
+    llm_cache: LLMCache | None = None,
+    geocoder: Geocoder | None = None,
+    prefilter: KeywordPrefilter | None = None,
+    dedup_index: DedupIndex | None = None,
+    checkpoint_dir: str | None = None,
+    checkpoint_interval: int = 10,
+    augmented_formats: Sequence[str] = ("json",),
+    shard_pages: int | None = None,
+    retry_policy: RetryPolicy | None = None,
+    retry_budget: int = 100,
+    quota_manager: QuotaManager | None = None,
+    cancel_event: threading.Event | None = None,
+    partition: Literal["none", "daily", "adaptive"] = "none",
+    partition_concurrency: int = 4,
+    partition_max_pages: int = 10,
+    postprocess_workers: int = 0,
+    metrics: ScrapeMetrics | None = None,
+    tracer: Tracer | None = None,
 ) -> JobOutput:
+    if partition not in PARTITION_MODES:
+        raise ValueError(f"partition must be one of {PARTITION_MODES}, got '{partition}'")
+    unknown_formats = set(augmented_formats) - set(AUGMENTED_FORMATS)
+    if unknown_formats or not augmented_formats:
+        raise ValueError(f"augmented_formats must be a non-empty selection of {AUGMENTED_FORMATS}, got {list(augmented_formats)}")
+
+    checkpoint: ScrapeCheckpoint | None = None
+    pool: PostProcessingPool | None = None
+    root_span = None
+    job_error: BaseException | None = None
+    errors: list[str] = []
     try:
         logger = logging.getLogger(__name__)
         logging.basicConfig(level=log_level)
@@ -71,109 +131,359 @@ def scrape(
         output_data_list: list[KernelPlancksterSourceData] = []
 
         filter = "forest wildfire"
-        # Enables `response_model`
-        client = instructor.from_openai(OpenAI(api_key=openai_api_key))
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        # shared by the ScraperAPI and OpenAI requests of the job; once it is used up, the job fails
+        job_retry_budget = RetryBudget(retry_budget)
+        budget_exhausted: list[RetryBudgetExhausted] = []
+
+        # shared with the other jobs of the process, so that together they stay within the upstream rate limits
+        if quota_manager is None:
+            quota_manager = get_quota_manager()
+
+        # latencies, throughput and errors of the job, served on /metrics
+        if metrics is None:
+            metrics = get_metrics()
+        # the pages, tweets and uploads of the job as spans under one root span, exported under the tracer id
+        if tracer is None:
+            tracer = Tracer(tracer_id, get_span_exporter())
+        root_span = tracer.start_span("scrape", job_id=job_id, query=query, start_date=start_date, end_date=end_date, partition=partition)
+        geocoder = TracedGeocoder(TimedGeocoder(geocoder, metrics, job_id), tracer)
+
+        # Enables `response_model`; retries are left to the retry policy
+        client = RetryingChatClient(
+            QuotaLimitedChatClient(
+                TracedChatClient(TimedChatClient(instructor.from_openai(OpenAI(api_key=openai_api_key, max_retries=0)), metrics, job_id, LLM_STAGES), tracer),
+                quota_manager.get("openai"),
+            ),
+            retry_policy,
+            job_retry_budget,
+        )
+
+        if pipeline_config is None:
+            pipeline_config = PipelineConfig()
 
         logger.info(f"{job_id}: Starting Job")
         job_state = BaseJobState.RUNNING
-        results = []
-        augmented_results = []
-        page = 1
+        uploaded_pages: dict[int, KernelPlancksterSourceData] = {}
         tweet_count = 0
+        lock = threading.Lock()
 
         timestamp = time.strftime("%Y%m%d_%H%M%S")
 
-        while True:
-            payload = {
-                'api_key': scraper_api_key,
-                'query': query,
-                'date_range_start': start_date,
-                'date_range_end': end_date,
-                'page': page,
-                'format': 'json'
-            }
-            try:
-                response = requests.get('https://api.scraperapi.com/structured/twitter/search', params=payload)
-                response.raise_for_status()
-                data = response.json()
-                
-                if 'organic_results' in data:
-                    new_tweets = data['organic_results']
-                    results.extend(new_tweets)
-
-                    augmented_tweet = None
-                    for tweet in new_tweets:
-                        if tweet != None: 
-                            augmented_tweet = augment_tweet(client, tweet, filter)
-                        if augmented_tweet != None:
-                            augmented_results.append(augmented_tweet)
-                    
-                    tweet_count += len(new_tweets)
-                    logger.info(f"{job_id}: Fetched {tweet_count} tweets so far...")
-                   
-                    current_data = KernelPlancksterSourceData(
-                        name=f"tweet_{page}",
-                        protocol=protocol,
-                        relative_path=f"twitter/{tracer_id}/{job_id}/scraped/tweet_{timestamp}_{page}.json",
-                    )
-                    output_data_list.append(current_data)
-                    lfp = f"{work_dir}/twitter/tweet_{timestamp}_{page}.json"
-
-                    save_tweets(new_tweets, lfp)
-                    try:
-                        scraped_data_repository.register_scraped_json(current_data, job_id, lfp )
-                    except Exception as e:
-                        logger.info("could not register file")
-                    last_successful_data = current_data
+        if checkpoint_dir:
+            checkpoint = ScrapeCheckpoint(checkpoint_dir, tracer_id, job_id, interval=checkpoint_interval)
+            timestamp = checkpoint.timestamp
+
+        parquet_file = f"{work_dir}/twitter/augmented_twitter_scrape_{timestamp}.parquet" if "parquet" in augmented_formats else None
+        # formatting, scoring and serialization run in worker processes, so they can use more than one core
+        pool = PostProcessingPool(workers=postprocess_workers)
+        stream = TweetStreamWriter(f"{work_dir}/twitter", timestamp, parquet_file=parquet_file, pool=pool)
+
+        # tweets the dedup stage adds are tagged with the job until it finishes, so that the pages an interrupted run
+        # deduplicated but did not checkpoint are not taken for duplicates of themselves on resume
+        dedup_job = f"{tracer_id}-{job_id}" if checkpoint is not None else None
+        if dedup_index is not None and dedup_job is not None:
+            dedup_index.discard(dedup_job, keep_pages=checkpoint.completed)
+
+        if checkpoint is not None and checkpoint.completed:
+            logger.info(f"{job_id}: Resuming job, skipping {len(checkpoint.completed)} pages completed by an earlier run")
+            for page in checkpoint.iter_pages():
+                stream.write_page(page)
+                if page.source_data is not None:
+                    uploaded_pages[page.page] = page.source_data
+                if dedup_index is not None:
+                    dedup_index.unique(page.tweets)
+
+        def dedup_page(page: ScrapedPage) -> ScrapedPage | None:
+            fetched = len(page.tweets)
+            page.tweets = dedup_index.unique(page.tweets, job=dedup_job, page=page.page)
+            if len(page.tweets) < fetched:
+                logger.info(f"{job_id}: Skipping {fetched - len(page.tweets)} duplicate tweets on page {page.page}")
+            if not page.tweets and shard_buffer is None:
+                # completed without an artifact, so that a resumed job does not fetch it again
+                if checkpoint is not None:
+                    checkpoint.record(page)
+                return None
+            return page
+
+        def augment_page(page: ScrapedPage) -> ScrapedPage:
+            nonlocal tweet_count
+            if not page.tweets:
+                # a page of duplicates, on its way to persist_shard
+                return page
+            with tracer.span("page", page=page.page, tweets=len(page.tweets)) as page_span:
+                try:
+                    page.augmented = augment_tweets(client, page.tweets, filter, batch_size=filter_batch_size, cache=llm_cache, geocoder=geocoder, prefilter=prefilter, pool=pool, tracer=tracer)
+                except RetryBudgetExhausted as e:
+                    with lock:
+                        budget_exhausted.append(e)
+                    raise
+                except Exception as e:
+                    # keep the raw tweets flowing to persist and upload even if augmentation is unavailable
+                    logger.error(f"{job_id}: Could not augment page {page.page}. Error:\n{e}")
+                    metrics.errors.inc(job=job_id, stage="augment")
+                    page_span.error = str(e)
+                page_span.attributes["relevant"] = len(page.augmented)
+
+            metrics.pages.inc(job=job_id)
+            metrics.tweets.inc(len(page.tweets), job=job_id)
+            metrics.relevant_tweets.inc(len(page.augmented), job=job_id)
+            with lock:
+                tweet_count += len(page.tweets)
+                logger.info(f"{job_id}: Fetched {tweet_count} tweets so far...")
+            return page
+
+        def persist_page(page: ScrapedPage) -> ScrapedPage:
+            with tracer.span("persist", page=page.page):
+                page.local_file = f"{work_dir}/twitter/tweet_{timestamp}_{page.page}.json"
+                save_tweets(page.tweets, page.local_file)
+                stream.write_page(page)
+            return page
+
+        def register(register_method, source_data: KernelPlancksterSourceData, local_file: str, on_success=None) -> None:
+            """
+            Register a file inline, or queue it if the repository is in upload-queue mode. Failures are collected for the JobOutput.
+            """
+            span = tracer.start_span("register", source_data=source_data.name, relative_path=source_data.relative_path)
+
+            def failed(error: BaseException) -> None:
+                tracer.end_span(span, error)
+                logger.error(f"{job_id}: Could not register {source_data.relative_path}: {error}")
+                with lock:
+                    errors.append(f"Could not register {source_data.relative_path}: {error}")
+
+            def succeeded() -> None:
+                tracer.end_span(span)
+                metrics.uploads.inc(job=job_id)
+                if on_success is not None:
+                    on_success()
+
+            def done(future: Future) -> None:
+                if future.exception() is not None:
+                    failed(future.exception())
                 else:
-                    logger.error(f"{job_id}: Error: {response.status_code} - {response.text}")
-                    logger.info("No more tweets found for this query. Scraping completed.")
-                
-                    save_tweets(results, f"{work_dir}/twitter/tweet_all_{timestamp}.json")
-                    
-                    final_data = KernelPlancksterSourceData(
-                        name=f"tweet_all",
-                        protocol=protocol,
-                        relative_path=f"twitter/{tracer_id}/{job_id}/scraped/tweet_all_{timestamp}.json",
-                    )
-                    try:
-                        scraped_data_repository.register_scraped_json(final_data, job_id, f"{work_dir}/twitter/tweet_all_{timestamp}.json" )
-                    except Exception as e:
-                        logger.info("could not register file")
-                    # write augmented data to file: --> title, content, extracted_location, lattitude, longitude, month, day, year, disaster_type
-
-                    df = pd.DataFrame(augmented_results, columns=["Title", "Tweet", "Extracted_Location", "Resolved_Latitude", "Resolved_Longitude", "Month", "Day", "Year", "Disaster_Type"])
-                    df.to_json(f"{work_dir}/twitter/augmented_twitter_scrape_{timestamp}.json", orient='index', indent=4)
-
-                    final_augmented_data = KernelPlancksterSourceData(
-                        name=f"tweet_all_augmented",
-                        protocol=protocol,
-                        relative_path=f"twitter/{tracer_id}/{job_id}/augmented/data_{timestamp}.json",
-                    )
-                    try:
-                        scraped_data_repository.register_scraped_json(final_augmented_data, job_id, f"{work_dir}/twitter/augmented_twitter_scrape_{timestamp}.json" )
-                    except Exception as e:
-                        logger.info("could not register file")
-                    break
-            except requests.exceptions.HTTPError as e:
-                job_state = BaseJobState.FAILED
-                logger.error(f"{job_id}: HTTP Error: {e}")
-                continue
-            except requests.exceptions.JSONDecodeError as e:
-                job_state = BaseJobState.FAILED
-                logger.error(f"{job_id}: JSON Decode Error: {e}")
-                logger.info("Retrying request after a short delay...")
-                time.sleep(5)
-                continue
+                    succeeded()
+
+            try:
+                result = register_method(source_data, job_id, local_file)
             except Exception as e:
-                job_state = BaseJobState.FAILED
-                logger.error(f"{job_id}: Unable to scrape data. Error:\n{e}\nJob with tracer_id {job_id} failed.\nLast successful data: {last_successful_data}\nCurrent data: \"{current_data}\", job_state: \"{job_state}\"")
-                continue
+                failed(e)
+                return
+            if isinstance(result, Future):
+                result.add_done_callback(done)
+            else:
+                succeeded()
 
-            page += 1
-            time.sleep(1)
+        def persist_shard(page: ScrapedPage) -> ScrapedShard | None:
+            if not page.tweets:
+                # a page of duplicates completes its part of the range without an artifact
+                if checkpoint is not None:
+                    checkpoint.record(page)
+                shard = shard_buffer.skip(page.page)
+            else:
+                stream.write_page(page)
+                shard = shard_buffer.add(page)
+            if shard is None:
+                return None
+            shard.local_file = f"{work_dir}/twitter/tweet_{timestamp}_{shard.name}.json"
+            save_shard(shard, shard.local_file)
+            return shard
 
-    
+        def upload_shard(shard: ScrapedShard) -> ScrapedShard:
+            nonlocal current_data
+            shard.source_data = KernelPlancksterSourceData(
+                name=f"tweet_{shard.name}",
+                protocol=protocol,
+                relative_path=f"twitter/{tracer_id}/{job_id}/scraped/tweet_{timestamp}_{shard.name}.json",
+            )
+            current_data = shard.source_data
+            with lock:
+                for page in shard.pages:
+                    page.source_data = shard.source_data
+                    uploaded_pages[page.page] = shard.source_data
+
+            def uploaded() -> None:
+                nonlocal last_successful_data
+                if checkpoint is not None:
+                    for page in shard.pages:
+                        checkpoint.record(page)
+                last_successful_data = shard.source_data
+
+            register(scraped_data_repository.register_scraped_json, shard.source_data, shard.local_file, on_success=uploaded)
+            return shard
+
+        def upload_page(page: ScrapedPage) -> ScrapedPage:
+            nonlocal current_data
+            page.source_data = KernelPlancksterSourceData(
+                name=f"tweet_{page.page}",
+                protocol=protocol,
+                relative_path=f"twitter/{tracer_id}/{job_id}/scraped/tweet_{timestamp}_{page.page}.json",
+            )
+            current_data = page.source_data
+            with lock:
+                uploaded_pages[page.page] = page.source_data
+
+            def uploaded() -> None:
+                nonlocal last_successful_data
+                if checkpoint is not None:
+                    checkpoint.record(page)
+                last_successful_data = page.source_data
+
+            register(scraped_data_repository.register_scraped_json, page.source_data, page.local_file, on_success=uploaded)
+            return page
+
+        fetch_kwargs = dict(
+            query=query,
+            scraper_api_key=scraper_api_key,
+            retry_policy=retry_policy,
+            retry_budget=job_retry_budget,
+            quota=quota_manager.get("scraperapi"),
+            metrics=metrics,
+            tracer=tracer,
+        )
+        if partition == "none":
+            pages = fetch_pages(
+                job_id=job_id,
+                start_date=start_date,
+                end_date=end_date,
+                concurrency=fetch_concurrency,
+                skip_pages=set(checkpoint.completed) if checkpoint is not None else None,
+                **fetch_kwargs,
+            )
+        else:
+            if checkpoint is not None and checkpoint.windows is not None:
+                # keep the windows of the first run, which the page keys in the checkpoint refer to
+                windows = [DateWindow.model_validate(window) for window in checkpoint.windows]
+            elif partition == "daily":
+                windows = daily_windows(start_date, end_date)
+            else:
+                def probe(window: DateWindow) -> dict | None:
+                    first_page = fetch_pages(job_id=job_id, start_date=window.start.isoformat(), end_date=window.end.isoformat(), **fetch_kwargs)
+                    try:
+                        return next((data for _, data in first_page), None)
+                    finally:
+                        first_page.close()
+
+                windows = plan_windows(job_id, start_date, end_date, probe, max_pages=partition_max_pages, concurrency=partition_concurrency)
+            if checkpoint is not None and checkpoint.windows is None:
+                checkpoint.record_windows([window.model_dump(mode="json") for window in windows])
+            logger.info(f"{job_id}: Scraping {len(windows)} date windows, {partition_concurrency} at a time")
+            pages = fetch_windows(
+                job_id=job_id,
+                windows=windows,
+                fetch=fetch_pages,
+                concurrency=partition_concurrency,
+                skip_pages=set(checkpoint.completed) if checkpoint is not None else None,
+                page_concurrency=fetch_concurrency,
+                **fetch_kwargs,
+            )
+
+        # the pages completed by an earlier run count towards their shard's range, so the rest of it is not held back
+        shard_buffer = ShardBuffer(shard_pages, done=checkpoint.completed if checkpoint is not None else ()) if shard_pages else None
+
+        stages = [
+            PipelineStage.from_config("augment", augment_page, pipeline_config.augment),
+            PipelineStage.from_config("persist", persist_page if shard_buffer is None else persist_shard, pipeline_config.persist),
+            PipelineStage.from_config("upload", upload_page if shard_buffer is None else upload_shard, pipeline_config.upload),
+        ]
+        if dedup_index is not None:
+            stages.insert(0, PipelineStage.from_config("dedup", dedup_page, pipeline_config.dedup))
+
+        def scraped_pages() -> Iterator[ScrapedPage]:
+            for page, data in pages:
+                if cancel_event is not None and cancel_event.is_set():
+                    # stop fetching; the pages already in the pipeline are still uploaded
+                    pages.close()
+                    return
+                if budget_exhausted:
+                    # the job fails anyway, so do not spend more of the ScraperAPI quota on it
+                    pages.close()
+                    return
+                yield ScrapedPage(page=page, tweets=data['organic_results'])
+
+        pipeline = Pipeline(job_id=job_id, stages=stages)
+        pipeline.run(scraped_pages())
+        if budget_exhausted:
+            raise budget_exhausted[0]
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled(f"Job {job_id} was cancelled")
+
+        if pipeline.errors:
+            logger.error(f"{job_id}: {len(pipeline.errors)} pipeline steps failed.\nLast successful data: {last_successful_data}\nCurrent data: \"{current_data}\"")
+            errors.extend(pipeline.errors)
+
+        if shard_buffer is not None:
+            for last_shard in shard_buffer.drain():
+                last_shard.local_file = f"{work_dir}/twitter/tweet_{timestamp}_{last_shard.name}.json"
+                save_shard(last_shard, last_shard.local_file)
+                upload_shard(last_shard)
+
+            # the relative paths of the shards are final once they are uploaded, e.g. with a compression suffix
+            scraped_data_repository.flush()
+            save_shard_manifest(uploaded_pages, f"{work_dir}/twitter/shards_{timestamp}.json")
+            shard_manifest = KernelPlancksterSourceData(
+                name="tweet_shards",
+                protocol=protocol,
+                relative_path=f"twitter/{tracer_id}/{job_id}/scraped/shards_{timestamp}.json",
+            )
+            register(scraped_data_repository.register_scraped_json, shard_manifest, f"{work_dir}/twitter/shards_{timestamp}.json")
+
+        for page in sorted(uploaded_pages):
+            # in sharding mode, pages share the source data of their shard
+            if uploaded_pages[page] not in output_data_list:
+                output_data_list.append(uploaded_pages[page])
+        if shard_buffer is not None:
+            output_data_list.append(shard_manifest)
+
+        logger.info("No more tweets found for this query. Scraping completed.")
+
+        stream.write_tweet_all(f"{work_dir}/twitter/tweet_all_{timestamp}.json")
+        
+        final_data = KernelPlancksterSourceData(
+            name=f"tweet_all",
+            protocol=protocol,
+            relative_path=f"twitter/{tracer_id}/{job_id}/scraped/tweet_all_{timestamp}.json",
+        )
+        register(scraped_data_repository.register_scraped_json, final_data, f"{work_dir}/twitter/tweet_all_{timestamp}.json")
+        # write augmented data to file: --> title, content, extracted_location, lattitude, longitude, month, day, year, disaster_type
+
+        if "json" in augmented_formats:
+            stream.write_augmented_json(f"{work_dir}/twitter/augmented_twitter_scrape_{timestamp}.json")
+        stream.close()
+
+        if "json" in augmented_formats:
+            final_augmented_data = KernelPlancksterSourceData(
+                name=f"tweet_all_augmented",
+                protocol=protocol,
+                relative_path=f"twitter/{tracer_id}/{job_id}/augmented/data_{timestamp}.json",
+            )
+            register(scraped_data_repository.register_scraped_json, final_augmented_data, f"{work_dir}/twitter/augmented_twitter_scrape_{timestamp}.json")
+
+        if parquet_file is not None:
+            final_augmented_parquet = KernelPlancksterSourceData(
+                name=f"tweet_all_augmented_parquet",
+                protocol=protocol,
+                relative_path=f"twitter/{tracer_id}/{job_id}/augmented/data_{timestamp}.parquet",
+            )
+            register(scraped_data_repository.register_scraped_parquet, final_augmented_parquet, parquet_file)
+
+        if llm_cache is not None:
+            logger.info(f"{job_id}: LLM cache stats: {llm_cache.stats}")
+        if prefilter is not None:
+            logger.info(f"{job_id}: Prefilter bands: {prefilter.counts}")
+        if dedup_index is not None:
+            logger.info(f"{job_id}: Deduplication stats: {dedup_index.stats}")
+
+        # uploads may still be queued, and they need the files in work_dir
+        scraped_data_repository.flush()
+        if errors:
+            logger.error(f"{job_id}: {len(errors)} errors, see the job output")
+
+        if checkpoint is not None:
+            checkpoint.clear()
+        if dedup_index is not None and dedup_job is not None:
+            dedup_index.commit(dedup_job)
 
         job_state = BaseJobState.FINISHED
         logger.info(f"{job_id}: Job finished")
@@ -185,11 +495,44 @@ def scrape(
             job_state=job_state,
             tracer_id=str(job_id),
             source_data_list=output_data_list,
+            errors=errors,
+        )
+
+    except JobCancelled as cancelled:
+        logger.warning(f"{job_id}: {cancelled}")
+        job_error = cancelled
+        if checkpoint is not None:
+            # keep the checkpoint, so that a rerun resumes from here
+            checkpoint.close()
+        try:
+            scraped_data_repository.flush()
+        except Exception as e:
+            logger.error(f"{job_id}: Could not wait for pending uploads: {e}")
+        try:
+            shutil.rmtree(work_dir)
+        except Exception as e:
+            logger.log("Could not delete tmp directory, exiting")
+        for page in sorted(uploaded_pages):
+            if uploaded_pages[page] not in output_data_list:
+                output_data_list.append(uploaded_pages[page])
+        return JobOutput(
+            job_state=BaseJobState.CANCELLED,
+            tracer_id=str(job_id),
+            source_data_list=output_data_list,
+            errors=errors,
         )
 
     except Exception as error:
         logger.error(f"{job_id}: Unable to scrape data. Job with tracer_id {job_id} failed. Error:\n{error}")
         job_state = BaseJobState.FAILED
+        job_error = error
+        if checkpoint is not None:
+            # keep the checkpoint, so that a rerun resumes from here
+            checkpoint.close()
+        try:
+            scraped_data_repository.flush()
+        except Exception as e:
+            logger.error(f"{job_id}: Could not wait for pending uploads: {e}")
         try:
             shutil.rmtree(work_dir)
         except Exception as e:
@@ -198,8 +541,16 @@ def scrape(
             job_state=job_state,
             tracer_id=str(job_id),
             source_data_list=[],
+            errors=errors + [str(error)],
         )
 
+    finally:
+        if pool is not None:
+            pool.close()
+        if root_span is not None:
+            tracer.end_span(root_span, job_error)
+            tracer.flush()
+
 def save_tweets(tweets, file_path):
     os.makedirs(os.path.dirname(file_path), exist_ok=True )
     with open(file_path, 'w+') as f:
@@ -212,95 +563,220 @@ def load_tweets(file_path):
         out = json.load(f)
     return out
 
-def augment_tweet(client:Instructor , tweet: dict, filter: str):
-    if len(tweet) > 5:
-        # extract aspects of the tweet
-            title = tweet["title"]
-            content = tweet["snippet"]
-            link = tweet["link"]
-            
-            formatted_tweet_str = "User " + title + " tweets: " + content.strip("...").strip(",").strip() + "."
-            
-            #relvancy filter with gpt-4 
+def format_tweet(tweet: dict) -> str | None:
+    """
+    Format a tweet as a sentence for the LLM prompts, or return None if the tweet lacks the expected fields.
+    """
+    if tweet is None or len(tweet) <= 5:
+        return None
+    return format_tweet_text(tweet["title"], tweet["snippet"])
+
+def format_tweet_text(title: str, content: str) -> str:
+    return "User " + title + " tweets: " + content.strip("...").strip(",").strip() + "."
+
+def prepare_tweets(fields: list[tuple[str, str] | None], prefilter: KeywordPrefilter | None = None) -> tuple[list[str | None], list[float] | None]:
+    """
+    Format a page of tweets, given as (title, snippet) pairs or None for tweets lacking those fields, and score the
+    formatted ones with the prefilter. This is the CPU-bound part of augmenting a page, run in a PostProcessingPool.
+
+    :return: The formatted tweets, None where a tweet could not be formatted, and the scores of the formatted ones, if there is a prefilter.
+    """
+    formatted = [format_tweet_text(*pair) if pair is not None else None for pair in fields]
+    if prefilter is None:
+        return formatted, None
+    return formatted, [prefilter.score(formatted_tweet_str) for formatted_tweet_str in formatted if formatted_tweet_str is not None]
+
+def filter_tweet(client: Instructor, formatted_tweet_str: str, filter: str, cache: LLMCache | None = None) -> bool:
+    if cache is not None:
+        cached = cache.get("filter", FILTER_MODEL, filter, formatted_tweet_str)
+        if cached is not None:
+            return filterData.model_validate(cached).relevant == True
+
+    #relvancy filter with gpt-4 
+    filter_data = client.chat.completions.create(
+        model=FILTER_MODEL,
+        response_model=filterData,
+        messages=[
+            {
+            "role": "user", 
+            "content": f"Examine this tweet: {formatted_tweet_str}. Is this tweet describing {filter}? "
+            },
+        ]
+    )
+    if cache is not None:
+        cache.put("filter", FILTER_MODEL, filter, formatted_tweet_str, filter_data.model_dump())
+    return filter_data.relevant == True
+
+def filter_tweets(client: Instructor, formatted_tweet_strs: list[str], filter: str, batch_size: int = 20, cache: LLMCache | None = None) -> list[bool]:
+    """
+    Classify the relevance of many tweets, sending up to `batch_size` tweets per LLM request.
+    If a batch response fails to validate or does not hold one answer per tweet, the tweets of that batch are classified one by one.
+    With a cache, only tweets without a cached answer are sent, and every answer is cached per tweet.
+
+    :param formatted_tweet_strs: The tweets, formatted with `format_tweet`.
+    :param filter: The topic the tweets should describe to be relevant.
+    :param batch_size: The maximum number of tweets per request. 1 sends one request per tweet.
+    :param cache: The cache of LLM completions to use, if any.
+    :return: One relevance flag per tweet, in order.
+    """
+    logger = logging.getLogger(__name__)
+    if batch_size <= 1:
+        return [filter_tweet(client, formatted_tweet_str, filter, cache) for formatted_tweet_str in formatted_tweet_strs]
+
+    known: dict[int, bool] = {}
+    if cache is not None:
+        for i, formatted_tweet_str in enumerate(formatted_tweet_strs):
+            cached = cache.get("filter", FILTER_MODEL, filter, formatted_tweet_str)
+            if cached is not None:
+                known[i] = filterData.model_validate(cached).relevant == True
+    uncached = [formatted_tweet_str for i, formatted_tweet_str in enumerate(formatted_tweet_strs) if i not in known]
+
+    relevant: list[bool] = []
+    for start in range(0, len(uncached), batch_size):
+        batch = uncached[start:start + batch_size]
+        numbered_tweets = "\n".join(f"{i + 1}. {formatted_tweet_str}" for i, formatted_tweet_str in enumerate(batch))
+        try:
             filter_data = client.chat.completions.create(
-                model="gpt-4",
-                response_model=filterData,
+                model=FILTER_MODEL,
+                response_model=batchFilterData,
                 messages=[
                     {
-                    "role": "user", 
-                    "content": f"Examine this tweet: {formatted_tweet_str}. Is this tweet describing {filter}? "
+                    "role": "user",
+                    "content": f"Examine these {len(batch)} tweets:\n{numbered_tweets}\nFor each tweet, in the same order, answer whether it is describing {filter}. Give exactly {len(batch)} answers."
                     },
                 ]
             )
-            
-            if filter_data.relevant == True:
-                aug_data = None
-                try:
-                    #location extraction with gpt-3.5
-                    aug_data = client.chat.completions.create(
-                    model="gpt-4-turbo", 
-                    response_model=messageData,
-                    messages=[
-                        {
-                        "role": "user", 
-                        "content": f"Extract: {formatted_tweet_str}"
-                        },
-                    ]
-                    )
-                except Exception as e:
-                    Logger.info("Could not augment tweet, trying with alternate prompt")
-                    #Potential alternate prompting
-                    
-                    # try:
-                    #     #location extraction with gpt-3.5
-                    #     aug_data = client.chat.completions.create(
-                    #     model="gpt-4-turbo", 
-                    #     response_model=messageDataAlternate,
-                    #     messages=[
-                    #         {
-                    #         "role": "user", 
-                    #         "content": f"Extract: {formatted_tweet_str}"
-                    #         },
-                    #     ]
-                    #     )
-                    # except Exception as e2:
-                    return None
-                city = aug_data.city
-                country = aug_data.country
-                extracted_location = city + "," + country 
-                year = aug_data.year
-                month = aug_data.month
-                day = aug_data.day
-                disaster_type = aug_data.disaster_type   
-                
-                # NLP-informed geolocation            
-                try:
-                    coordinates = get_lat_long(extracted_location)
-                except Exception as e:
-                    coordinates = None
-                if coordinates:
-                    lattitude = coordinates[0]
-                    longitude = coordinates[1]
-                else:
-                    lattitude = "no latitude"
-                    longitude = "no longitude"
+            if len(filter_data.relevant) != len(batch):
+                raise ValueError(f"Expected {len(batch)} relevance answers, got {len(filter_data.relevant)}")
+            if cache is not None:
+                for formatted_tweet_str, is_relevant in zip(batch, filter_data.relevant):
+                    cache.put("filter", FILTER_MODEL, filter, formatted_tweet_str, filterData(relevant=is_relevant).model_dump())
+            relevant.extend(filter_data.relevant)
+        except RetryBudgetExhausted:
+            raise
+        except Exception as e:
+            logger.warning(f"Batched relevance filter failed, falling back to one request per tweet. Error: {e}")
+            relevant.extend(filter_tweet(client, formatted_tweet_str, filter, cache) for formatted_tweet_str in batch)
 
-                #TODO: format date
-                
-                return [title, content, extracted_location, lattitude, longitude, month, day, year, disaster_type]
+    fetched = iter(relevant)
+    return [known[i] if i in known else next(fetched) for i in range(len(formatted_tweet_strs))]
 
-# utility function for augmenting tweets with geolocation
-def get_lat_long(location_name):
-    geolocator = Nominatim(user_agent="location_to_lat_long")
+def extract_tweet(client: Instructor, tweet: dict, formatted_tweet_str: str, cache: LLMCache | None = None, geocoder: Geocoder | None = None) -> list | None:
+    title = tweet["title"]
+    content = tweet["snippet"]
+    aug_data = None
+    cached = cache.get("extract", EXTRACTION_MODEL, "", formatted_tweet_str) if cache is not None else None
     try:
-        location = geolocator.geocode(location_name)
-        if location:
-            latitude = location.latitude
-            longitude = location.longitude
-            return latitude, longitude
+        if cached is not None:
+            aug_data = messageData.model_validate(cached)
         else:
-            return None
+            #location extraction with gpt-3.5
+            aug_data = client.chat.completions.create(
+            model=EXTRACTION_MODEL, 
+            response_model=messageData,
+            messages=[
+                {
+                "role": "user", 
+                "content": f"Extract: {formatted_tweet_str}"
+                },
+            ]
+            )
+            if cache is not None:
+                cache.put("extract", EXTRACTION_MODEL, "", formatted_tweet_str, aug_data.model_dump())
+    except RetryBudgetExhausted:
+        # the job has run out of retries, it must fail rather than drop the tweet
+        raise
     except Exception as e:
-        print(f"Error: {e}")
+        logging.getLogger(__name__).info("Could not augment tweet, trying with alternate prompt")
+        #Potential alternate prompting
+        
+        # try:
+        #     #location extraction with gpt-3.5
+        #     aug_data = client.chat.completions.create(
+        #     model="gpt-4-turbo", 
+        #     response_model=messageDataAlternate,
+        #     messages=[
+        #         {
+        #         "role": "user", 
+        #         "content": f"Extract: {formatted_tweet_str}"
+        #         },
+        #     ]
+        #     )
+        # except Exception as e2:
         return None
+    city = aug_data.city
+    country = aug_data.country
+    extracted_location = city + "," + country 
+    year = aug_data.year
+    month = aug_data.month
+    day = aug_data.day
+    disaster_type = aug_data.disaster_type   
     
+    # NLP-informed geolocation            
+    try:
+        coordinates = get_lat_long(extracted_location, geocoder)
+    except Exception as e:
+        coordinates = None
+    if coordinates:
+        lattitude = coordinates[0]
+        longitude = coordinates[1]
+    else:
+        lattitude = "no latitude"
+        longitude = "no longitude"
+
+    #TODO: format date
+    
+    return [title, content, extracted_location, lattitude, longitude, month, day, year, disaster_type]
+
+def augment_tweet(client:Instructor , tweet: dict, filter: str, cache: LLMCache | None = None, geocoder: Geocoder | None = None):
+    formatted_tweet_str = format_tweet(tweet)
+    if formatted_tweet_str is None:
+        return None
+    if filter_tweet(client, formatted_tweet_str, filter, cache):
+        return extract_tweet(client, tweet, formatted_tweet_str, cache, geocoder)
+
+def augment_tweets(client: Instructor, tweets: list[dict], filter: str, batch_size: int = 20, cache: LLMCache | None = None, geocoder: Geocoder | None = None, prefilter: KeywordPrefilter | None = None, pool: PostProcessingPool | None = None, tracer: Tracer | None = None) -> list[list]:
+    """
+    Augment a page of tweets: classify their relevance in batches, then extract and geolocate the relevant ones.
+    With a prefilter, tweets it drops are skipped and tweets it accepts go straight to extraction; only the rest reach the LLM filter.
+    Given a pool, the tweets are formatted and scored in its worker processes, see prepare_tweets.
+    Given a tracer, the relevance filter and the augmentation of each relevant tweet are spans.
+
+    :return: The augmented rows of the relevant tweets, in order.
+    """
+    logger = logging.getLogger(__name__)
+    fields = [(tweet["title"], tweet["snippet"]) if tweet is not None and len(tweet) > 5 else None for tweet in tweets]
+    formatted_tweet_strs, scores = pool.run(prepare_tweets, fields, prefilter) if pool is not None else prepare_tweets(fields, prefilter)
+    formatted = [(tweet, formatted_tweet_str) for tweet, formatted_tweet_str in zip(tweets, formatted_tweet_strs) if formatted_tweet_str is not None]
+
+    if prefilter is None:
+        with traced(tracer, "filter", tweets=len(formatted)):
+            relevant = filter_tweets(client, [formatted_tweet_str for _, formatted_tweet_str in formatted], filter, batch_size, cache)
+    else:
+        bands = [prefilter.band(score) for score in scores]
+        ambiguous = [formatted_tweet_str for (_, formatted_tweet_str), band in zip(formatted, bands) if band == "llm"]
+        with traced(tracer, "filter", tweets=len(ambiguous)):
+            llm_relevant = iter(filter_tweets(client, ambiguous, filter, batch_size, cache))
+        relevant = [band == "accept" or (band == "llm" and next(llm_relevant)) for band in bands]
+
+    augmented = []
+    for (tweet, formatted_tweet_str), is_relevant in zip(formatted, relevant):
+        if not is_relevant:
+            continue
+        try:
+            with traced(tracer, "augment_tweet", link=tweet.get("link")):
+                augmented_tweet = extract_tweet(client, tweet, formatted_tweet_str, cache, geocoder)
+        except RetryBudgetExhausted:
+            raise
+        except Exception as e:
+            logger.error(f"Could not augment tweet {tweet.get('link')}. Error:\n{e}")
+            continue
+        if augmented_tweet != None:
+            augmented.append(augmented_tweet)
+    return augmented
+
+# utility function for augmenting tweets with geolocation
+def get_lat_long(location_name, geocoder: Geocoder | None = None):
+    if geocoder is None:
+        geocoder = get_default_geocoder()
+    return geocoder.geocode(location_name)
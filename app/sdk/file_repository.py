@@ -1,19 +1,59 @@
+import asyncio
+import gzip
+import hashlib
+import json
 import logging
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, Dict
 
+import httpx
 import requests
-from app.sdk.models import KernelPlancksterSourceData, ProtocolEnum
+from app.sdk.models import CompressionEnum, KernelPlancksterSourceData, ProtocolEnum
+
+
+COMPRESSION_CHUNK_SIZE = 1024 * 1024
 
 
 class FileRepository:
+    """
+    Stores files locally or uploads them to signed urls.
+
+    With a `compression` other than NONE, files stored or uploaded with `compress=True` are compressed first, streaming in
+    chunks of COMPRESSION_CHUNK_SIZE, at `compression_level` (the library default if not set). The relative path of their
+    source data should end in `compression.suffix`, see `compressed_relative_path`. Zstandard needs the `zstandard` package.
+
+    Files larger than `chunked_upload_threshold` bytes can be uploaded in parts instead, see `chunked_upload`.
+    """
+
     def __init__(
             self,
             protocol: ProtocolEnum,
             data_dir: str = "data",  # can be used for config
+            compression: CompressionEnum = CompressionEnum.NONE,
+            compression_level: int | None = None,
+            chunked_upload_threshold: int | None = None,
+            part_size: int = 8 * 1024 * 1024,
+            upload_parallelism: int = 4,
+            part_retries: int = 3,
+            part_retry_delay: float = 1.0,
     ) -> None:
+        if part_size < 1:
+            raise ValueError(f"part_size must be positive, got {part_size}")
+        if upload_parallelism < 1:
+            raise ValueError(f"upload_parallelism must be at least 1, got {upload_parallelism}")
         self._protocol = protocol
         self._data_dir = data_dir
+        self._compression = compression
+        self._compression_level = compression_level
+        self._chunked_upload_threshold = chunked_upload_threshold
+        self._part_size = part_size
+        self._upload_parallelism = upload_parallelism
+        self._part_retries = part_retries
+        self._part_retry_delay = part_retry_delay
         self._logger = logging.getLogger(__name__)
 
     @property
@@ -24,9 +64,54 @@ class FileRepository:
     def data_dir(self) -> str:
         return self._data_dir
     
+    @property
+    def compression(self) -> CompressionEnum:
+        return self._compression
+
     @property
     def logger(self) -> logging.Logger:
         return self._logger
+
+    def compressed_relative_path(self, relative_path: str) -> str:
+        """
+        The relative path with the suffix of the configured compression, unless it already ends with it.
+        """
+        suffix = self.compression.suffix
+        if not suffix or relative_path.endswith(suffix):
+            return relative_path
+        return f"{relative_path}{suffix}"
+
+    def compress_to(self, file_path: str, destination: str) -> str:
+        """
+        Compress a file with the configured compression, streaming it in chunks.
+
+        :param file_path: The path to the file to compress.
+        :param destination: The path to write the compressed file to.
+        :return: The destination.
+        """
+        with open(file_path, "rb") as source, open(destination, "wb") as target:
+            self._compress_stream(source, target)
+        return destination
+
+    def _compress_stream(self, source: BinaryIO, target: BinaryIO) -> None:
+        match self.compression:
+
+            case CompressionEnum.GZIP:
+                level = 6 if self._compression_level is None else self._compression_level
+                # mtime=0 keeps the output deterministic
+                with gzip.GzipFile(fileobj=target, mode="wb", compresslevel=level, mtime=0) as compressed:
+                    shutil.copyfileobj(source, compressed, COMPRESSION_CHUNK_SIZE)
+
+            case CompressionEnum.ZSTD:
+                try:
+                    import zstandard
+                except ImportError as error:
+                    raise ImportError("zstd compression needs zstandard, install it with `pip install zstandard`") from error
+                level = 3 if self._compression_level is None else self._compression_level
+                zstandard.ZstdCompressor(level=level).copy_stream(source, target, read_size=COMPRESSION_CHUNK_SIZE, write_size=COMPRESSION_CHUNK_SIZE)
+
+            case CompressionEnum.NONE:
+                shutil.copyfileobj(source, target, COMPRESSION_CHUNK_SIZE)
     
     def file_name_to_pfn(self, file_name: str) -> str:
         return f"{self.protocol}://{file_name}"
@@ -37,20 +122,24 @@ class FileRepository:
     def source_data_to_file_name(self, source_data: KernelPlancksterSourceData) -> str:
         return f"{self.data_dir}/{source_data.relative_path}"
 
-    def save_file_locally(self, file_to_save: str, source_data: KernelPlancksterSourceData, file_type: str) -> str:
+    def save_file_locally(self, file_to_save: str, source_data: KernelPlancksterSourceData, file_type: str, compress: bool = False) -> str:
         """
         Save a file to a local directory.
 
         :param file_to_save: The path to the file to save.
         :param source_data: The source data to save.
         :param file_type: The type of file to save.
+        :param compress: Whether to save the file with the configured compression.
         """
         
         file_name = self.source_data_to_file_name(source_data)
         self.logger.info(f"Saving {file_type} '{source_data}' to '{file_name}'.")
 
         os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        shutil.copy(file_to_save, file_name)
+        if compress and self.compression != CompressionEnum.NONE:
+            self.compress_to(file_to_save, file_name)
+        else:
+            shutil.copy(file_to_save, file_name)
 
         self.logger.info(f"Saved {file_type} '{source_data}' to '{file_name}'.")
 
@@ -59,16 +148,180 @@ class FileRepository:
         return pfn
 
         
-    def public_upload(self, signed_url: str, file_path: str) -> None:
+    def public_upload(self, signed_url: str, file_path: str, compress: bool = False) -> None:
         """
         Upload a file to a signed url.
 
         :param signed_url: The signed url to upload to.
         :param file_path: The path to the file to upload.
+        :param compress: Whether to upload the file with the configured compression.
         """
 
+        if compress and self.compression != CompressionEnum.NONE:
+            # compressed into a file next to the original rather than streamed, because signed urls need a Content-Length
+            compressed_path = self.compress_to(file_path, f"{file_path}{self.compression.suffix}")
+            try:
+                self.public_upload(signed_url, compressed_path)
+            finally:
+                os.remove(compressed_path)
+            return
+
         with open(file_path, "rb") as f:
             upload_res = requests.put(signed_url, data=f, verify=False)
 
         if upload_res.status_code != 200:
             raise ValueError(f"Failed to upload file to signed url: {upload_res.text}")
+
+    async def public_upload_async(self, signed_url: str, file_path: str, client: httpx.AsyncClient | None = None, chunk_size: int = 1024 * 1024, compress: bool = False) -> None:
+        """
+        Upload a file to a signed url without blocking the event loop. The file is streamed in chunks with an explicit
+        Content-Length, since presigned object store URLs do not accept chunked transfer encoding.
+
+        :param signed_url: The signed url to upload to.
+        :param file_path: The path to the file to upload.
+        :param client: The client to upload with, e.g. to share its connection pool. A new client is used if not given.
+        :param compress: Whether to upload the file with the configured compression.
+        """
+
+        if compress and self.compression != CompressionEnum.NONE:
+            compressed_path = await asyncio.to_thread(self.compress_to, file_path, f"{file_path}{self.compression.suffix}")
+            try:
+                await self.public_upload_async(signed_url, compressed_path, client=client, chunk_size=chunk_size)
+            finally:
+                os.remove(compressed_path)
+            return
+
+        async def read_chunks() -> AsyncIterator[bytes]:
+            with open(file_path, "rb") as f:
+                while chunk := await asyncio.to_thread(f.read, chunk_size):
+                    yield chunk
+
+        headers = {"Content-Length": str(os.path.getsize(file_path))}
+
+        if client is None:
+            async with httpx.AsyncClient(verify=False) as own_client:
+                upload_res = await own_client.put(signed_url, content=read_chunks(), headers=headers)
+        else:
+            upload_res = await client.put(signed_url, content=read_chunks(), headers=headers)
+
+        if upload_res.status_code != 200:
+            raise ValueError(f"Failed to upload file to signed url: {upload_res.text}")
+
+    def use_chunked_upload(self, file_path: str) -> bool:
+        """
+        Whether a file is large enough to be uploaded with `chunked_upload`.
+        """
+        return self._chunked_upload_threshold is not None and os.path.getsize(file_path) > self._chunked_upload_threshold
+
+    def chunked_upload(self, file_path: str, relative_path: str, sign_url: Callable[[str], str], compress: bool = False) -> str:
+        """
+        Upload a file in parts of `part_size` bytes, `upload_parallelism` at a time, each to its own signed url at
+        `{relative_path}.part-00000`, `{relative_path}.part-00001`, ... Then upload a JSON manifest of the parts, with their
+        sizes and SHA-256 digests, to `{relative_path}.manifest.json`. Readers concatenate the parts in manifest order.
+
+        A failed part is retried up to `part_retries` times. Completed parts are journaled next to the file, in
+        `{file_path}.upload.json`, so that calling this again after an interruption only uploads the missing parts. The
+        journal is deleted once the manifest is uploaded.
+
+        :param file_path: The path to the file to upload.
+        :param relative_path: The relative path of the uploaded file, which the part and manifest paths are derived from.
+        :param sign_url: Returns a signed upload url for a relative path.
+        :param compress: Whether to upload the file with the configured compression.
+        :return: The relative path of the manifest.
+        """
+        if compress and self.compression != CompressionEnum.NONE:
+            # the compression is deterministic, so the journal of an earlier attempt still matches
+            compressed_path = self.compress_to(file_path, f"{file_path}{self.compression.suffix}")
+            try:
+                return self._chunked_upload(compressed_path, f"{file_path}.upload.json", relative_path, sign_url)
+            finally:
+                os.remove(compressed_path)
+        return self._chunked_upload(file_path, f"{file_path}.upload.json", relative_path, sign_url)
+
+    def _chunked_upload(self, file_path: str, journal_path: str, relative_path: str, sign_url: Callable[[str], str]) -> str:
+        size = os.path.getsize(file_path)
+        digest = _sha256_file(file_path)
+        part_count = max(1, -(-size // self._part_size))
+
+        identity = {"relative_path": relative_path, "size": size, "sha256": digest, "part_size": self._part_size}
+        journal = _read_journal(journal_path)
+        if journal.get("identity") != identity:
+            journal = {"identity": identity, "parts": {}}
+        completed: Dict[str, dict] = journal["parts"]
+        if completed:
+            self.logger.info(f"Resuming upload of {relative_path}: {len(completed)} of {part_count} parts already uploaded")
+
+        lock = threading.Lock()
+
+        def upload_part(index: int) -> None:
+            with open(file_path, "rb") as f:
+                f.seek(index * self._part_size)
+                data = f.read(self._part_size)
+            part = {"relative_path": f"{relative_path}.part-{index:05d}", "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+            attempt = 0
+            while True:
+                try:
+                    self._put(sign_url(part["relative_path"]), data)
+                    break
+                except Exception as error:
+                    if attempt >= self._part_retries:
+                        raise
+                    delay = self._part_retry_delay * 2 ** attempt
+                    self.logger.warning(f"Upload of {part['relative_path']} failed, retrying in {delay:.1f}s: {error}")
+                    time.sleep(delay)
+                    attempt += 1
+            with lock:
+                completed[str(index)] = part
+                _write_journal(journal_path, journal)
+
+        missing = [index for index in range(part_count) if str(index) not in completed]
+        errors = []
+        with ThreadPoolExecutor(max_workers=self._upload_parallelism, thread_name_prefix="upload-part") as executor:
+            for future in [executor.submit(upload_part, index) for index in missing]:
+                try:
+                    future.result()
+                except Exception as error:
+                    errors.append(error)
+        if errors:
+            raise ValueError(f"Failed to upload {len(errors)} of {part_count} parts of {relative_path}, call again to resume: {errors[0]}")
+
+        manifest = {
+            "relative_path": relative_path,
+            "size": size,
+            "sha256": digest,
+            "part_size": self._part_size,
+            "parts": [completed[str(index)] for index in range(part_count)],
+        }
+        manifest_path = f"{relative_path}.manifest.json"
+        self._put(sign_url(manifest_path), json.dumps(manifest, indent=2).encode())
+        os.remove(journal_path)
+        self.logger.info(f"Uploaded {relative_path} in {part_count} parts")
+        return manifest_path
+
+    def _put(self, signed_url: str, data: bytes) -> None:
+        upload_res = requests.put(signed_url, data=data, verify=False)
+        if upload_res.status_code != 200:
+            raise ValueError(f"Failed to upload file to signed url: {upload_res.text}")
+
+
+def _sha256_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(COMPRESSION_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_journal(journal_path: str) -> dict:
+    try:
+        with open(journal_path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _write_journal(journal_path: str, journal: dict) -> None:
+    # write and rename, so that an interruption never leaves a half-written journal
+    with open(f"{journal_path}.tmp", "w") as f:
+        json.dump(journal, f)
+    os.replace(f"{journal_path}.tmp", journal_path)
@@ -0,0 +1,212 @@
+import inspect
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Literal
+
+from app.sdk.models import BaseJob, BaseJobState, JobOutput
+
+
+def process_context() -> multiprocessing.context.BaseContext:
+    """
+    The multiprocessing context to start worker processes with. Workers are started lazily, from a process whose other
+    threads, e.g. of the pipeline or the web server, may hold locks such as the logging locks, which a forked worker
+    would inherit held forever. So they are started from a fresh interpreter instead: by a fork server where there is
+    one, spawned otherwise.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class JobCancelled(Exception):
+    """
+    Raised by a worker that stopped early because its job was cancelled.
+    """
+
+
+class _QueuedJob:
+    def __init__(self, job: BaseJob, worker: Callable[..., Any], kwargs: Dict[str, Any], cancel_event: Any) -> None:
+        self.job = job
+        self.worker = worker
+        self.kwargs = kwargs
+        self.cancel_event = cancel_event
+        self.future: Future = Future()
+
+
+class JobExecutor:
+    """
+    Runs jobs on a fixed number of workers, taking them from a queue by priority and, within a priority, in the order
+    they were submitted. The state of each job is recorded on `BaseJob.state`: QUEUED when submitted, RUNNING while a
+    worker runs it, and then the state of the worker's JobOutput, FINISHED if it returns something else, FAILED if it
+    raises, or CANCELLED.
+
+    Workers accepting a `cancel_event` keyword get an event that is set when their job is cancelled, and are expected
+    to stop early. Queued jobs that are cancelled never run.
+
+    :param max_workers: The number of jobs that run at once.
+    :param mode: "thread" runs the jobs in threads of this process, "process" in worker processes, which keeps CPU-bound
+        jobs from slowing down the web server. Workers and their arguments must be picklable in process mode, and
+        process-wide state, like the upstream quotas and the metrics, is per worker process.
+    :param on_update: Called with a job whenever its state changes, e.g. to persist it.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        mode: Literal["thread", "process"] = "thread",
+        on_update: Callable[[BaseJob], None] | None = None,
+    ) -> None:
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}")
+        if mode not in ("thread", "process"):
+            raise ValueError(f"mode must be 'thread' or 'process', got '{mode}'")
+        self._mode = mode
+        self.on_update = on_update
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._queued: Dict[int, _QueuedJob] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._logger = logging.getLogger(__name__)
+        # events shared with worker processes go through a manager process; neither is forked from the web server
+        context = process_context() if mode == "process" else None
+        self._manager = context.Manager() if context is not None else None
+        self._processes = ProcessPoolExecutor(max_workers=max_workers, mp_context=context) if context is not None else None
+        self._threads = [
+            threading.Thread(target=self._run, name=f"job-executor-{i}", daemon=True) for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of jobs that are queued or running.
+        """
+        with self._lock:
+            return len(self._queued)
+
+    def submit(self, job: BaseJob, worker: Callable[..., Any], priority: int = 0, **kwargs: Any) -> Future:
+        """
+        Queue a job to be run as `worker(job=job, **kwargs)`.
+
+        :param priority: Jobs with a higher priority run first.
+        :return: A future of the worker's result. It is cancelled if the job is cancelled before it runs.
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("The job executor is shut down")
+            if job.id in self._queued:
+                raise ValueError(f"Job {job.id} is already queued or running")
+            cancel_event = self._manager.Event() if self._manager is not None else threading.Event()
+            queued = _QueuedJob(job, worker, kwargs, cancel_event)
+            self._queued[job.id] = queued
+            self._update(job, BaseJobState.QUEUED)
+        self._queue.put((-priority, next(self._sequence), queued))
+        return queued.future
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued or running job. Returns False if the job is neither.
+        """
+        with self._lock:
+            queued = self._queued.get(job_id)
+            if queued is None:
+                return False
+            queued.cancel_event.set()
+            if queued.future.cancel():
+                # not started yet, so it is skipped when its turn comes
+                self._update(queued.job, BaseJobState.CANCELLED)
+        return True
+
+    def shutdown(self, cancel_running: bool = False) -> None:
+        """
+        Cancel the queued jobs and wait for the running ones, which are cancelled as well with `cancel_running`.
+        """
+        with self._lock:
+            self._closed = True
+            jobs = list(self._queued)
+        for job_id in jobs:
+            with self._lock:
+                queued = self._queued.get(job_id)
+            if queued is not None and (cancel_running or not queued.future.running()):
+                self.cancel(job_id)
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._sequence), None))
+        for thread in self._threads:
+            thread.join()
+        if self._processes is not None:
+            self._processes.shutdown()
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    def _run(self) -> None:
+        while True:
+            _, _, queued = self._queue.get()
+            if queued is None:
+                return
+            try:
+                if queued.future.set_running_or_notify_cancel():
+                    self._execute(queued)
+            finally:
+                with self._lock:
+                    self._queued.pop(queued.job.id, None)
+
+    def _execute(self, queued: _QueuedJob) -> None:
+        job = queued.job
+        kwargs = dict(queued.kwargs)
+        if _accepts(queued.worker, "cancel_event"):
+            kwargs["cancel_event"] = queued.cancel_event
+
+        self._update(job, BaseJobState.RUNNING)
+        self.logger.info(f"{job.id}: Job started")
+        try:
+            if self._processes is not None:
+                result = self._processes.submit(queued.worker, job=job, **kwargs).result()
+            else:
+                result = queued.worker(job=job, **kwargs)
+        except JobCancelled:
+            self._update(job, BaseJobState.CANCELLED)
+            queued.future.set_result(None)
+        except Exception as error:
+            self.logger.error(f"{job.id}: Job failed. Error:\n{error}")
+            job.messages.append(str(error))
+            self._update(job, BaseJobState.FAILED)
+            queued.future.set_exception(error)
+        else:
+            if isinstance(result, JobOutput):
+                job.messages.extend(result.errors)
+                job.output_source_data_list = result.source_data_list or []
+                state = result.job_state
+            elif queued.cancel_event.is_set():
+                state = BaseJobState.CANCELLED
+            else:
+                state = BaseJobState.FINISHED
+            self._update(job, state)
+            queued.future.set_result(result)
+        self.logger.info(f"{job.id}: Job {job.state.value}")
+
+    def _update(self, job: BaseJob, state: BaseJobState) -> None:
+        job.state = state
+        job.touch()
+        if self.on_update is not None:
+            try:
+                self.on_update(job)
+            except Exception as error:
+                self.logger.error(f"{job.id}: Could not record the job's state {state.value}. Error:\n{error}")
+
+
+def _accepts(func: Callable[..., Any], keyword: str) -> bool:
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(p.name == keyword or p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters)
@@ -1,43 +1,80 @@
-from typing import Any, Dict, List
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
 import os
 
+from app.sdk.job_executor import JobExecutor
+from app.sdk.job_store import JobFilter, JobPage, JobStore, SQLiteJobStore
 from app.sdk.models import BaseJob
 
 
 class BaseJobManager:
-    def __init__(self) -> None:
-        self._jobs: Dict[int, BaseJob] = {}
-        self._nonce = 0
+    """
+    Keeps the jobs of the server in a job store, by default a SQLite database at JOB_STORE_PATH (default: .cache/jobs.sqlite),
+    and runs them on a JobExecutor with JOB_WORKERS workers (default: 4), in threads or, with JOB_EXECUTOR_MODE=process,
+    in worker processes.
+    """
+
+    def __init__(self, executor: JobExecutor | None = None, store: JobStore | None = None) -> None:
+        self._store = store if store is not None else SQLiteJobStore(os.getenv("JOB_STORE_PATH", ".cache/jobs.sqlite"))
+        self._executor = executor
+        if executor is not None and executor.on_update is None:
+            executor.on_update = self._store.save
 
     @property
     def name(self) -> str:
         return os.getenv("JOB_MANAGER_NAME", "default")
 
+    @property
+    def store(self) -> JobStore:
+        return self._store
+
     @property
     def jobs(self) -> Dict[int, BaseJob]:
-        return self._jobs
+        """
+        NOTE: deprecated, loads every job; use `list_jobs` with a filter and pagination.
+        """
+        jobs: Dict[int, BaseJob] = {}
+        page = self._store.list(limit=1000)
+        while True:
+            jobs.update((job.id, job) for job in page.jobs)
+            if page.next_cursor is None:
+                return jobs
+            page = self._store.list(limit=1000, cursor=page.next_cursor)
 
     @property
-    def nonce(self) -> int:
-        self._nonce = self._nonce + 1
-        return self._nonce
+    def executor(self) -> JobExecutor:
+        if self._executor is None:
+            self._executor = JobExecutor(
+                max_workers=int(os.getenv("JOB_WORKERS", "4")),
+                mode=os.getenv("JOB_EXECUTOR_MODE", "thread"),  # type: ignore
+                on_update=self._store.save,
+            )
+        return self._executor
 
     def create_job(
         self, tracer_id: str, job_args: Dict[str, Any], *args: Any, **kwargs: Any
     ) -> BaseJob:
-        id = self.nonce
-        job = BaseJob(
-            id=id,
-            name=f"{self.name}-{id}",
-            tracer_id=tracer_id,
-            args=job_args,
-        )
-
-        self.jobs[job.id] = job  # type: ignore
-        return job
+        return self._store.create(tracer_id, self.name, job_args)
 
     def get_job(self, job_id: int) -> BaseJob:
-        return self.jobs[job_id]
+        return self._store.get(job_id)
+
+    def list_jobs(self, filter: JobFilter | None = None, limit: int = 50, cursor: int | None = None) -> JobPage:
+        """
+        List the jobs matching `filter`, newest first, `limit` at a time. Pass the `next_cursor` of a page as `cursor`
+        to get the next one.
+        """
+        return self._store.list(filter, limit=limit, cursor=cursor)
+
+    def start_job(self, job_id: int, worker: Callable[..., Any], priority: int = 0, **kwargs: Any) -> Future:
+        """
+        Queue a job to be run by `worker(job=job, **kwargs)`; jobs with a higher priority run first.
+        """
+        return self.executor.submit(self.get_job(job_id), worker, priority=priority, **kwargs)
 
-    def list_jobs(self) -> List[BaseJob]:
-        return list(self._jobs.values())
\ No newline at end of file
+    def cancel_job(self, job_id: int) -> bool:
+        """
+        Cancel a queued or running job. Returns False if it is neither.
+        """
+        self.get_job(job_id)
+        return self.executor.cancel(job_id)
@@ -1,11 +1,16 @@
 import os
+from datetime import datetime
 from typing import Any, Callable, Dict, List, TypedDict
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+from app.metrics import get_metrics
+from app.quota import get_quota_manager
 from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
 from app.sdk.file_repository import MinIORepository
 
-from app.sdk.models import KernelPlancksterSourceData, ProtocolEnum
+from app.sdk.job_store import JobFilter
+from app.sdk.models import BaseJobState, KernelPlancksterSourceData, ProtocolEnum
 
 
 class JobManagerFastAPIRouter:
@@ -58,9 +63,17 @@ class JobManagerFastAPIRouter:
 
     def register_endpoints(self):
         @self.router.get("/job")
-        def list_all_jobs():
+        def list_all_jobs(
+            state: BaseJobState | None = None,
+            tracer_id: str | None = None,
+            created_after: datetime | None = None,
+            created_before: datetime | None = None,
+            limit: int = Query(50, ge=1, le=1000),
+            cursor: int | None = None,
+        ):
             job_manager = self.app.job_manager  # type: ignore
-            return job_manager.list_jobs()
+            filter = JobFilter(state=state, tracer_id=tracer_id, created_after=created_after, created_before=created_before)
+            return job_manager.list_jobs(filter, limit=limit, cursor=cursor)
 
         @self.router.post("/job")
         def create_job(
@@ -75,11 +88,28 @@ class JobManagerFastAPIRouter:
         @self.router.get("/job/{job_id}")
         def get_job(job_id: int):
             job_manager = self.app.job_manager  # type: ignore
-            job = job_manager.get_job(job_id)
+            try:
+                job = job_manager.get_job(job_id)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
             return job
 
+        @self.router.get("/quota")
+        def quota_stats():
+            """
+            How long the jobs of this process waited for the ScraperAPI, OpenAI and Nominatim quotas.
+            """
+            return get_quota_manager().stats()
+
+        @self.router.get("/metrics", response_class=PlainTextResponse)
+        def metrics():
+            """
+            Stage latencies, throughput and errors of the jobs of this process, in the Prometheus text format.
+            """
+            return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
         @self.router.get("/job/{job_id}/start")
-        def start_job(job_id: int, background_tasks: BackgroundTasks):
+        def start_job(job_id: int, priority: int = 0):
             job_manager = self.app.job_manager
             try:
                 job = job_manager.get_job(job_id)
@@ -98,9 +128,25 @@ class JobManagerFastAPIRouter:
                 raise HTTPException(
                     status_code=500, detail="Failed to connect to Kernel Plankster"
                 )
-            background_tasks.add_task(
-                self.worker,
-                job=job,
-                kernel_planckster=self.kernel_plankster_gateway,
-                minio_repository=self.minio_repository,
-            )
\ No newline at end of file
+            try:
+                job_manager.start_job(
+                    job_id,
+                    self.worker,
+                    priority=priority,
+                    kernel_planckster=self.kernel_plankster_gateway,
+                    minio_repository=self.minio_repository,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            return job
+
+        @self.router.get("/job/{job_id}/cancel")
+        def cancel_job(job_id: int):
+            job_manager = self.app.job_manager
+            try:
+                cancelled = job_manager.cancel_job(job_id)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+            if not cancelled:
+                raise HTTPException(status_code=409, detail=f"Job {job_id} is neither queued nor running")
+            return job_manager.get_job(job_id)
\ No newline at end of file
@@ -0,0 +1,276 @@
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Protocol
+
+from pydantic import BaseModel
+
+from app.sdk.models import BaseJob, BaseJobState
+
+
+class JobFilter(BaseModel):
+    """
+    Which jobs to list.
+
+    Attributes:
+    - state: only jobs in this state
+    - tracer_id: only jobs with this tracer id
+    - created_after: only jobs created at or after this time
+    - created_before: only jobs created before this time
+    """
+    state: BaseJobState | None = None
+    tracer_id: str | None = None
+    created_after: datetime | None = None
+    created_before: datetime | None = None
+
+    def matches(self, job: BaseJob) -> bool:
+        return (
+            (self.state is None or job.state == self.state)
+            and (self.tracer_id is None or job.tracer_id == self.tracer_id)
+            and (self.created_after is None or job.created_at >= self.created_after)
+            and (self.created_before is None or job.created_at < self.created_before)
+        )
+
+
+class JobPage(BaseModel):
+    """
+    A page of jobs, newest first.
+
+    Attributes:
+    - jobs: the jobs of the page
+    - next_cursor: pass as `cursor` to get the next page, None on the last page
+    """
+    jobs: List[BaseJob]
+    next_cursor: int | None = None
+
+
+class JobStore(Protocol):
+    def create(self, tracer_id: str, name_prefix: str, args: Dict[str, Any]) -> BaseJob:
+        """
+        Allocate the next job id and store a new job named `{name_prefix}-{id}`.
+        """
+        ...
+
+    def save(self, job: BaseJob) -> None:
+        ...
+
+    def get(self, job_id: int) -> BaseJob:
+        """
+        :raises KeyError: If there is no such job.
+        """
+        ...
+
+    def list(self, filter: JobFilter | None = None, limit: int = 50, cursor: int | None = None) -> JobPage:
+        """
+        List the jobs matching `filter`, newest first, `limit` at a time, starting after the job id `cursor`.
+        """
+        ...
+
+
+class InMemoryJobStore:
+    """
+    Keeps jobs in a dict, for tests and throwaway servers; they are lost on restart.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: Dict[int, BaseJob] = {}
+        self._nonce = 0
+        self._lock = threading.Lock()
+
+    def create(self, tracer_id: str, name_prefix: str, args: Dict[str, Any]) -> BaseJob:
+        with self._lock:
+            self._nonce += 1
+            now = datetime.now()
+            job = BaseJob(id=self._nonce, name=f"{name_prefix}-{self._nonce}", tracer_id=tracer_id, args=args, created_at=now, heartbeat=now)
+            self._jobs[job.id] = job
+            return job
+
+    def save(self, job: BaseJob) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: int) -> BaseJob:
+        return self._jobs[job_id]
+
+    def list(self, filter: JobFilter | None = None, limit: int = 50, cursor: int | None = None) -> JobPage:
+        filter = filter or JobFilter()
+        with self._lock:
+            ids = sorted((job_id for job_id in self._jobs if cursor is None or job_id < cursor), reverse=True)
+            jobs = [self._jobs[job_id] for job_id in ids if filter.matches(self._jobs[job_id])]
+        return JobPage(jobs=jobs[:limit], next_cursor=jobs[limit - 1].id if len(jobs) > limit else None)
+
+
+class SQLiteJobStore:
+    """
+    Keeps jobs in a SQLite database, so that they survive restarts.
+
+    Jobs are listed by keyset pagination on their id, which grows with their creation time, and the filters are
+    indexed together with the id, so listing a page costs the same with tens of thousands of jobs as with a few.
+
+    Several server processes may share a database. Queued and running jobs are owned by the store that saved them, which
+    refreshes their heartbeat every `heartbeat_interval` seconds. Jobs whose heartbeat is older than `stale_after`
+    seconds, as their process stopped without finishing them, are marked as failed on startup and by the heartbeat of the
+    other stores. Closing a store fails the jobs it still owns, as no worker is left to finish them.
+
+    :param stale_after: The seconds without a heartbeat after which a queued or running job is taken for interrupted.
+    :param heartbeat_interval: The seconds between heartbeats, a quarter of `stale_after` by default.
+    """
+
+    ACTIVE_STATES = (BaseJobState.QUEUED, BaseJobState.RUNNING)
+
+    def __init__(self, path: str = ".cache/jobs.sqlite", stale_after: float = 60.0, heartbeat_interval: float | None = None) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._path = path
+        self._lock = threading.Lock()
+        self._owner = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(4)}"
+        self._stale_after = stale_after
+        self._heartbeat_interval = heartbeat_interval if heartbeat_interval is not None else stale_after / 4
+        self._closed = threading.Event()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, tracer_id TEXT NOT NULL, state TEXT NOT NULL, created_at TEXT NOT NULL, data TEXT NOT NULL, "
+            "owner TEXT, heartbeat REAL)"
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            # stores created before jobs had owners; their active jobs have no heartbeat, so they are taken for interrupted
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_tracer_id ON jobs (tracer_id, id)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+        self._fail_interrupted_jobs()
+        self._heartbeat = threading.Thread(target=self._beat, name="job-store-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def owner(self) -> str:
+        """
+        The id of this store, unique across processes and hosts, recorded on the queued and running jobs it saves.
+        """
+        return self._owner
+
+    def _beat(self) -> None:
+        while not self._closed.wait(self._heartbeat_interval):
+            try:
+                with self._lock:
+                    self._connection.execute(
+                        f"UPDATE jobs SET heartbeat = ? WHERE owner = ? AND state IN ({', '.join('?' * len(self.ACTIVE_STATES))})",
+                        (time.time(), self._owner, *(state.value for state in self.ACTIVE_STATES)),
+                    )
+                self._fail_interrupted_jobs()
+            except sqlite3.ProgrammingError:
+                # closed meanwhile
+                return
+
+    def _fail_interrupted_jobs(self, owner: str | None = None) -> None:
+        """
+        Mark the queued and running jobs of `owner` as failed, or without an owner, those whose heartbeat is stale.
+        """
+        states = tuple(state.value for state in self.ACTIVE_STATES)
+        placeholders = ", ".join("?" * len(states))
+        with self._lock:
+            if owner is not None:
+                rows = self._connection.execute(f"SELECT data FROM jobs WHERE owner = ? AND state IN ({placeholders})", (owner, *states)).fetchall()
+            else:
+                rows = self._connection.execute(
+                    f"SELECT data FROM jobs WHERE state IN ({placeholders}) AND (heartbeat IS NULL OR heartbeat < ?)",
+                    (*states, time.time() - self._stale_after),
+                ).fetchall()
+        for row in rows:
+            job = self._load(row[0])
+            state = job.state
+            job.state = BaseJobState.FAILED
+            job.messages.append(f"Interrupted while {state.value}, as the server running it stopped or restarted")
+            self.save(job)
+
+    @staticmethod
+    def _load(data: str) -> BaseJob:
+        # `state` is typed as a bare Enum on BaseJob, which pydantic cannot validate from its value
+        fields = json.loads(data)
+        state = BaseJobState(fields.pop("state"))
+        job = BaseJob.model_validate(fields)
+        job.state = state
+        return job
+
+    def create(self, tracer_id: str, name_prefix: str, args: Dict[str, Any]) -> BaseJob:
+        now = datetime.now()
+        with self._lock:
+            # the id is allocated and the job stored in one transaction, so that ids are unique across processes
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._connection.execute(
+                    "INSERT INTO jobs (tracer_id, state, created_at, data) VALUES (?, ?, ?, '{}')",
+                    (tracer_id, BaseJobState.CREATED.value, now.isoformat()),
+                )
+                job_id = cursor.lastrowid
+                assert job_id is not None
+                job = BaseJob(id=job_id, name=f"{name_prefix}-{job_id}", tracer_id=tracer_id, args=args, created_at=now, heartbeat=now)
+                self._connection.execute("UPDATE jobs SET data = ? WHERE id = ?", (job.model_dump_json(), job_id))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return job
+
+    def save(self, job: BaseJob) -> None:
+        owner = self._owner if job.state in self.ACTIVE_STATES else None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO jobs (id, tracer_id, state, created_at, data, owner, heartbeat) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.tracer_id, job.state.value, job.created_at.isoformat(), job.model_dump_json(), owner, time.time()),
+            )
+
+    def get(self, job_id: int) -> BaseJob:
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return self._load(row[0])
+
+    def list(self, filter: JobFilter | None = None, limit: int = 50, cursor: int | None = None) -> JobPage:
+        filter = filter or JobFilter()
+        conditions: List[str] = []
+        params: List[Any] = []
+        if filter.state is not None:
+            conditions.append("state = ?")
+            params.append(filter.state.value)
+        if filter.tracer_id is not None:
+            conditions.append("tracer_id = ?")
+            params.append(filter.tracer_id)
+        if filter.created_after is not None:
+            conditions.append("created_at >= ?")
+            params.append(filter.created_after.isoformat())
+        if filter.created_before is not None:
+            conditions.append("created_at < ?")
+            params.append(filter.created_before.isoformat())
+        if cursor is not None:
+            conditions.append("id < ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT id, data FROM jobs {where} ORDER BY id DESC LIMIT ?", (*params, limit + 1),
+            ).fetchall()
+        jobs = [self._load(data) for _, data in rows[:limit]]
+        return JobPage(jobs=jobs, next_cursor=jobs[-1].id if len(rows) > limit else None)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._fail_interrupted_jobs(owner=self._owner)
+        with self._lock:
+            self._connection.close()
@@ -1,39 +1,66 @@
 import logging
 import json
+import threading
+import time
+from typing import Any, Dict
 import httpx
 
 from app.sdk.models import KernelPlancksterSourceData
 
 
 
-class KernelPlancksterGateway:
-    def __init__(self, host: str, port: str, auth_token: str, scheme: str) -> None:
+class _KernelPlancksterGatewayBase:
+    """
+    The parts of the Kernel Planckster API client shared by the sync and async gateways: configuration, the ping cache,
+    and building the requests and checking the responses of each endpoint.
+    """
+
+    def __init__(self, host: str, port: str, auth_token: str, scheme: str, ping_ttl: float) -> None:
         self._host = host
         self._port = port
         self._client_id = 1  # NOTE: this should match the default client for this project
         self._auth_token = auth_token
         self._scheme = scheme
+        self._ping_ttl = ping_ttl
+        self._last_ping: float | None = None
+        self._ping_lock = threading.Lock()
         self._logger = logging.getLogger(__name__)
 
     @property
     def url(self) -> str:
         return f"{self._scheme}://{self._host}:{self._port}"
 
-    @property   
+    @property
     def logger(self) -> logging.Logger:
         return self._logger
 
-    def ping(self) -> bool:
-        self.logger.info(f"Pinging Kernel Plankster Gateway at {self.url}")
-        res = httpx.get(f"{self.url}/ping")
-        self.logger.info(f"Ping response: {res.text}")
-        return res.status_code == 200
+    def _ping_is_fresh(self) -> bool:
+        with self._ping_lock:
+            return self._last_ping is not None and time.monotonic() - self._last_ping < self._ping_ttl
 
-    def generate_signed_url(self, source_data: KernelPlancksterSourceData) -> str:
-        if not self.ping():
-            self.logger.error(f"Failed to ping Kernel Plankster Gateway at {self.url}")
-            raise Exception("Failed to ping Kernel Plankster Gateway")
+    def _record_ping(self, res: httpx.Response) -> bool:
+        self.logger.info(f"Ping response: {res.text}")
+        ok = res.status_code == 200
+        with self._ping_lock:
+            self._last_ping = time.monotonic() if ok else None
+        return ok
+
+    def _invalidate_ping(self) -> None:
+        # the gateway may be gone, do not trust the cached ping anymore
+        with self._ping_lock:
+            self._last_ping = None
+
+    def _ping_failed(self) -> Exception:
+        self.logger.error(f"Failed to ping Kernel Plankster Gateway at {self.url}")
+        return Exception("Failed to ping Kernel Plankster Gateway")
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "x-auth-token": self._auth_token,
+            }
 
+    def _signed_url_request(self, source_data: KernelPlancksterSourceData) -> Dict[str, Any]:
         self.logger.info(f"Generating signed url for {source_data.relative_path}")
 
         endpoint = f"{self.url}/client/{self._client_id}/upload-credentials"
@@ -43,17 +70,9 @@ class KernelPlancksterGateway:
             "relative_path": source_data.relative_path,
         }
 
-        headers = {
-            "Content-Type": "application/json",
-            "x-auth-token": self._auth_token,
-            }
-
-        res = httpx.get(
-            url=endpoint,
-            params=params,
-            headers=headers,
-        )
+        return {"url": endpoint, "params": params, "headers": self._headers()}
 
+    def _signed_url_from_response(self, res: httpx.Response) -> str:
         self.logger.info(f"Generate signed url response: {res.text}")
         if res.status_code != 200:
             raise ValueError(f"Failed to generate signed url: {res.text}")
@@ -66,20 +85,8 @@ class KernelPlancksterGateway:
             raise ValueError(f"Failed to generate signed url. Signed URL not found in response. Dumping raw response:\n{res_json}")
 
         return signed_url
-        
-
-    def register_new_source_data(self, source_data: KernelPlancksterSourceData) -> dict[str, str]:
-        """
-        Registers new source data with Kernel Plankster Gateway.
-        
-        Args:
-        - source_data: KernelPlancksterSourceData
-
-        """
-        if not self.ping():
-            self.logger.error(f"Failed to ping Kernel Plankster Gateway at {self.url}")
-            raise Exception("Failed to ping Kernel Plankster Gateway")
 
+    def _register_request(self, source_data: KernelPlancksterSourceData) -> Dict[str, Any]:
         self.logger.info(f"Registering new data with Kernel Plankster Gateway at {self.url}")
 
         params = {
@@ -90,17 +97,9 @@ class KernelPlancksterGateway:
 
         endpoint = f"{self.url}/client/{self._client_id}/source"
 
-        headers = {
-            "Content-Type": "application/json",
-            "x-auth-token": self._auth_token,
-            }
-
-        res = httpx.post(
-            url=endpoint,
-            params=params,
-            headers=headers,
-        )
+        return {"url": endpoint, "params": params, "headers": self._headers()}
 
+    def _source_data_from_response(self, res: httpx.Response, source_data: KernelPlancksterSourceData) -> dict[str, str]:
         self.logger.info(f"Register new data response: {res.text}")
         if res.status_code != 200:
             raise ValueError(
@@ -121,4 +120,155 @@ class KernelPlancksterGateway:
 
         assert res_name == source_data.name
 
-        return kp_source_data
\ No newline at end of file
+        return kp_source_data
+
+
+class KernelPlancksterGateway(_KernelPlancksterGatewayBase):
+    """
+    Client of the Kernel Planckster API.
+
+    Requests go through a single `httpx.Client`, so connections are pooled and kept alive across calls. A successful ping
+    is trusted for `ping_ttl` seconds before the gateway is pinged again; connection errors invalidate it. Set `ping_ttl`
+    to 0 to ping before every call.
+
+    The gateway can be pickled, e.g. to hand it to a job run in a worker process, see JobExecutor. The copy opens its own
+    connection pool, configured like the original's; a `client` passed in is not carried over.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: str,
+        auth_token: str,
+        scheme: str,
+        ping_ttl: float = 30.0,
+        timeout: float = 30.0,
+        max_connections: int = 10,
+        client: httpx.Client | None = None,
+    ) -> None:
+        super().__init__(host, port, auth_token, scheme, ping_ttl)
+        self._timeout = timeout
+        self._max_connections = max_connections
+        self._client = client or self._new_client()
+
+    def _new_client(self) -> httpx.Client:
+        return httpx.Client(
+            timeout=self._timeout,
+            limits=httpx.Limits(max_connections=self._max_connections, max_keepalive_connections=self._max_connections),
+        )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # connections, locks and the monotonic time of the last ping do not carry over to another process
+        state = self.__dict__.copy()
+        del state["_client"], state["_ping_lock"], state["_logger"]
+        state["_last_ping"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._ping_lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        self._client = self._new_client()
+
+    def close(self) -> None:
+        self._client.close()
+
+    def __enter__(self) -> "KernelPlancksterGateway":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def ping(self) -> bool:
+        self.logger.info(f"Pinging Kernel Plankster Gateway at {self.url}")
+        return self._record_ping(self._request("GET", f"{self.url}/ping"))
+
+    def _ensure_reachable(self) -> None:
+        if not self._ping_is_fresh() and not self.ping():
+            raise self._ping_failed()
+
+    def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        try:
+            return self._client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            self._invalidate_ping()
+            raise
+
+    def generate_signed_url(self, source_data: KernelPlancksterSourceData) -> str:
+        self._ensure_reachable()
+        res = self._request("GET", **self._signed_url_request(source_data))
+        return self._signed_url_from_response(res)
+
+
+    def register_new_source_data(self, source_data: KernelPlancksterSourceData) -> dict[str, str]:
+        """
+        Registers new source data with Kernel Plankster Gateway.
+
+        Args:
+        - source_data: KernelPlancksterSourceData
+
+        """
+        self._ensure_reachable()
+        res = self._request("POST", **self._register_request(source_data))
+        return self._source_data_from_response(res, source_data)
+
+
+class AsyncKernelPlancksterGateway(_KernelPlancksterGatewayBase):
+    """
+    The asyncio counterpart of KernelPlancksterGateway, built on a pooled `httpx.AsyncClient`, so that many artifacts can be
+    registered concurrently from one event loop. Pings are cached in the same way.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: str,
+        auth_token: str,
+        scheme: str,
+        ping_ttl: float = 30.0,
+        timeout: float = 30.0,
+        max_connections: int = 10,
+        client: httpx.AsyncClient | None = None,
+    ) -> None:
+        super().__init__(host, port, auth_token, scheme, ping_ttl)
+        self._client = client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "AsyncKernelPlancksterGateway":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def ping(self) -> bool:
+        self.logger.info(f"Pinging Kernel Plankster Gateway at {self.url}")
+        return self._record_ping(await self._request("GET", f"{self.url}/ping"))
+
+    async def _ensure_reachable(self) -> None:
+        if not self._ping_is_fresh() and not await self.ping():
+            raise self._ping_failed()
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        try:
+            return await self._client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            self._invalidate_ping()
+            raise
+
+    async def generate_signed_url(self, source_data: KernelPlancksterSourceData) -> str:
+        await self._ensure_reachable()
+        res = await self._request("GET", **self._signed_url_request(source_data))
+        return self._signed_url_from_response(res)
+
+    async def register_new_source_data(self, source_data: KernelPlancksterSourceData) -> dict[str, str]:
+        """
+        Registers new source data with Kernel Plankster Gateway.
+        """
+        await self._ensure_reachable()
+        res = await self._request("POST", **self._register_request(source_data))
+        return self._source_data_from_response(res, source_data)
@@ -6,9 +6,11 @@ from datetime import datetime
 
 class BaseJobState(Enum):
     CREATED = "created"
+    QUEUED = "queued"
     RUNNING = "running"
     FINISHED = "finished"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 class ProtocolEnum(Enum):
     """
@@ -22,6 +24,24 @@ class ProtocolEnum(Enum):
     LOCAL = "local"
 
 
+class CompressionEnum(Enum):
+    """
+    The compression to apply to a file before it is stored.
+
+    Attributes:
+    - NONE: store the file as is
+    - GZIP: gzip, with the `.gz` suffix
+    - ZSTD: Zstandard, with the `.zst` suffix
+    """
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+    @property
+    def suffix(self) -> str:
+        return {"none": "", "gzip": ".gz", "zstd": ".zst"}[self.value]
+
+
 class KernelPlancksterSourceData(BaseModel):
     """
     Synchronize this with Kernel Planckster's SourceData model, so that this client generates valid requests.
@@ -83,8 +103,10 @@ class JobOutput(BaseModel):
     - job_state: BaseJobState
     - trace_id: str
     - source_data_list: List[KernelPlancksterSourceData] | None
+    - errors: List[str], the uploads and registrations that failed, and other errors the job recovered from
     """
 
     job_state: BaseJobState
     tracer_id: str
     source_data_list: List[KernelPlancksterSourceData] | None
+    errors: List[str] = []
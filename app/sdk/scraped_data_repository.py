@@ -1,21 +1,70 @@
+import asyncio
+import functools
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Set
+import httpx
+from app.metrics import ScrapeMetrics, get_metrics
 from app.sdk.file_repository import FileRepository
-from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
+from app.sdk.kernel_plackster_gateway import AsyncKernelPlancksterGateway, KernelPlancksterGateway
 from app.sdk.models import KernelPlancksterSourceData, ProtocolEnum
 
 
+def _queueable(register: Callable[..., KernelPlancksterSourceData]) -> Callable[..., KernelPlancksterSourceData | Future]:
+    """
+    Runs a register method inline, or in upload-queue mode submits it to the repository's upload pool and returns a Future.
+    """
+
+    @functools.wraps(register)
+    def wrapper(self: "ScrapedDataRepository", source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str):
+        if self._executor is None:
+            return register(self, source_data, job_id, local_file_name)
+        return self._submit(register, source_data, job_id, local_file_name)
+
+    return wrapper
+
 
 class ScrapedDataRepository:
+    """
+    Uploads scraped files and registers them with Kernel Planckster.
+
+    With `upload_workers` > 0 the repository runs in upload-queue mode: the `register_scraped_*` methods return a Future
+    right away, and a pool of `upload_workers` threads performs the uploads, retrying each up to `upload_retries` times with
+    exponential backoff from `retry_delay` seconds. At most `max_pending_uploads` uploads wait in the queue; further
+    register calls block until one completes. Call `flush` to wait for all pending uploads; failed uploads are collected
+    in `upload_errors`.
+
+    Uploads and registrations are timed as the "upload" and "register" stages in `metrics`, the process-wide
+    ScrapeMetrics by default.
+    """
+
     def __init__(
             self,
             protocol: ProtocolEnum,
             kernel_planckster: KernelPlancksterGateway,
             file_repository: FileRepository,
+            upload_workers: int = 0,
+            upload_retries: int = 3,
+            retry_delay: float = 1.0,
+            max_pending_uploads: int | None = None,
+            metrics: ScrapeMetrics | None = None,
     ) -> None:
+        if upload_workers < 0:
+            raise ValueError(f"upload_workers must not be negative, got {upload_workers}")
         self.protocol = protocol
         self.kernel_planckster = kernel_planckster
         self.file_repository = file_repository
+        self._upload_retries = upload_retries
+        self._retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="upload") if upload_workers else None
+        self._pending_slots = threading.BoundedSemaphore(max_pending_uploads or 4 * max(upload_workers, 1))
+        self._pending: Set[Future] = set()
+        self._upload_errors: List[str] = []
+        self._lock = threading.Lock()
         self._logger = logging.getLogger(__name__)
+        self.metrics = metrics or get_metrics()
 
     @property
     def log_level(self) -> str:
@@ -26,24 +75,119 @@ class ScrapedDataRepository:
 
         return self._logger
 
+    @property
+    def upload_errors(self) -> List[str]:
+        return self._upload_errors
+
+    def flush(self) -> List[str]:
+        """
+        Wait until every pending upload has completed or failed. A no-op unless in upload-queue mode.
+
+        :return: The errors of the uploads that failed, so far.
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return list(self._upload_errors)
+            for future in pending:
+                try:
+                    future.result()
+                except Exception:
+                    # already recorded in upload_errors
+                    pass
+
+    def close(self) -> None:
+        """
+        Flush pending uploads and stop the upload pool.
+        """
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _submit(self, register: Callable[..., KernelPlancksterSourceData], source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> Future:
+        self._pending_slots.acquire()
+        future = self._executor.submit(self._register_with_retries, register, source_data, job_id, local_file_name)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._upload_done)
+        return future
+
+    def _upload_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        self._pending_slots.release()
+
+    def _register_with_retries(self, register: Callable[..., KernelPlancksterSourceData], source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+        attempt = 0
+        while True:
+            try:
+                return register(self, source_data, job_id, local_file_name)
+            except Exception as error:
+                if attempt >= self._upload_retries:
+                    message = f"{job_id}: Could not upload {source_data.relative_path} after {attempt + 1} attempts: {error}"
+                    self.logger.error(message)
+                    with self._lock:
+                        self._upload_errors.append(message)
+                    raise
+                delay = self._retry_delay * 2 ** attempt
+                self.logger.warning(f"{job_id}: Upload of {source_data.relative_path} failed, retrying in {delay:.1f}s: {error}")
+                time.sleep(delay)
+                attempt += 1
+
+
+    def _upload(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str, file_type: str, compress: bool = False) -> KernelPlancksterSourceData:
+        """
+        Upload a file to the object store. Large files are uploaded in parts.
+
+        `source_data` is left as is, so that a retry uploads to the same paths.
+
+        :return: The source data to register: `source_data`, or a copy pointing to the manifest of the parts.
+        """
+
+        if self.file_repository.use_chunked_upload(local_file_name):
+            self.logger.info(f"{job_id}: Uploading {file_type} to object store in parts")
+
+            def sign_url(relative_path: str) -> str:
+                return self.kernel_planckster.generate_signed_url(source_data=source_data.model_copy(update={"relative_path": relative_path}))
+
+            manifest_path = self.file_repository.chunked_upload(local_file_name, source_data.relative_path, sign_url, compress=compress)
+
+            self.logger.info(f"{job_id}: Uploaded {file_type} to {manifest_path}")
+            return source_data.model_copy(update={"relative_path": manifest_path})
+
+        signed_url = self.kernel_planckster.generate_signed_url(source_data=source_data) 
+
+        self.logger.info(f"{job_id}: Uploading {file_type} to object store")
+
+        self.file_repository.public_upload(signed_url, local_file_name, compress=compress)
+
+        self.logger.info(
+        f"{job_id}: Uploaded {file_type} to {signed_url}"
+        )
+        return source_data
+
 
-    def register_scraped_photo(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+    @_queueable
+    def register_scraped_photo(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData | Future:
 
         match self.protocol:
 
             case ProtocolEnum.S3:
 
-                signed_url = self.kernel_planckster.generate_signed_url(source_data=source_data) 
-                
-                self.logger.info(f"{job_id}: Uploading photo to object store")
+                with self.metrics.timed("upload", job_id):
+                    signed_url = self.kernel_planckster.generate_signed_url(source_data=source_data)
+
+                    self.logger.info(f"{job_id}: Uploading photo to object store")
 
-                self.file_repository.public_upload(signed_url, local_file_name)
+                    self.file_repository.public_upload(signed_url, local_file_name)
                 
                 self.logger.info(
                 f"{job_id}: Uploaded photo to {signed_url}"
                 )
 
-                self.kernel_planckster.register_new_source_data(source_data=source_data)
+                with self.metrics.timed("register", job_id):
+                    self.kernel_planckster.register_new_source_data(source_data=source_data)
 
 
             case ProtocolEnum.LOCAL:
@@ -58,23 +202,26 @@ class ScrapedDataRepository:
         return source_data
 
 
-    def register_scraped_video_or_document(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+    @_queueable
+    def register_scraped_video_or_document(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData | Future:
 
         match self.protocol:
 
             case ProtocolEnum.S3:
 
-                signed_url = self.kernel_planckster.generate_signed_url(source_data=source_data) 
-                
-                self.logger.info(f"{job_id}: Uploading video to object store")
+                with self.metrics.timed("upload", job_id):
+                    signed_url = self.kernel_planckster.generate_signed_url(source_data=source_data)
+
+                    self.logger.info(f"{job_id}: Uploading video to object store")
 
-                self.file_repository.public_upload(signed_url, local_file_name)
+                    self.file_repository.public_upload(signed_url, local_file_name)
                 
                 self.logger.info(
                 f"{job_id}: Uploaded video to {signed_url}"
                 )
 
-                self.kernel_planckster.register_new_source_data(source_data=source_data)
+                with self.metrics.timed("register", job_id):
+                    self.kernel_planckster.register_new_source_data(source_data=source_data)
 
             case ProtocolEnum.LOCAL:
                 # If local, then we don't use kernel planckster at all
@@ -88,23 +235,28 @@ class ScrapedDataRepository:
         return source_data
     
 
-    def register_scraped_json(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+    @_queueable
+    def register_scraped_json(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData | Future:
+        """
+        Uploads and registers a json file, compressed if the file repository has a compression configured. The relative
+        path of `source_data` is updated with the compression suffix, and once registered, to the manifest of the parts if
+        the file was uploaded in parts.
+        """
+
+        source_data.relative_path = self.file_repository.compressed_relative_path(source_data.relative_path)
 
         match self.protocol:
 
             case ProtocolEnum.S3:
 
-                signed_url = self.kernel_planckster.generate_signed_url(source_data=source_data) 
-                
-                self.logger.info(f"{job_id}: Uploading json to object store")
+                with self.metrics.timed("upload", job_id):
+                    uploaded = self._upload(source_data, job_id, local_file_name, "json", compress=True)
 
-                self.file_repository.public_upload(signed_url, local_file_name)
-                
-                self.logger.info(
-                f"{job_id}: Uploaded json to {signed_url}"
-                )
+                with self.metrics.timed("register", job_id):
+                    self.kernel_planckster.register_new_source_data(source_data=uploaded)
 
-                self.kernel_planckster.register_new_source_data(source_data=source_data)
+                # only once registered, so that a retry after a failed registration starts from the same path
+                source_data.relative_path = uploaded.relative_path
 
             case ProtocolEnum.LOCAL:
                 # If local, then we don't use kernel planckster at all
@@ -113,6 +265,131 @@ class ScrapedDataRepository:
                 file_to_save=local_file_name,
                 source_data=source_data,
                 file_type="json",
+                compress=True,
+                )
+
+        return source_data
+
+
+    @_queueable
+    def register_scraped_parquet(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData | Future:
+
+        match self.protocol:
+
+            case ProtocolEnum.S3:
+
+                with self.metrics.timed("upload", job_id):
+                    uploaded = self._upload(source_data, job_id, local_file_name, "parquet")
+
+                with self.metrics.timed("register", job_id):
+                    self.kernel_planckster.register_new_source_data(source_data=uploaded)
+
+                # only once registered, so that a retry after a failed registration starts from the same path
+                source_data.relative_path = uploaded.relative_path
+
+            case ProtocolEnum.LOCAL:
+                # If local, then we don't use kernel planckster at all
+                # NOTE: local is deprecated
+                self.file_repository.save_file_locally(
+                file_to_save=local_file_name,
+                source_data=source_data,
+                file_type="parquet",
                 )
 
-        return source_data
\ No newline at end of file
+        return source_data
+
+
+class AsyncScrapedDataRepository:
+    """
+    The asyncio counterpart of ScrapedDataRepository: many artifacts can be uploaded and registered concurrently, e.g. with
+    `asyncio.gather`. Uploads share one pooled `httpx.AsyncClient`.
+    """
+
+    def __init__(
+            self,
+            protocol: ProtocolEnum,
+            kernel_planckster: AsyncKernelPlancksterGateway,
+            file_repository: FileRepository,
+            upload_client: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.protocol = protocol
+        self.kernel_planckster = kernel_planckster
+        self.file_repository = file_repository
+        self._upload_client = upload_client or httpx.AsyncClient(verify=False, timeout=None)
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    async def aclose(self) -> None:
+        await self._upload_client.aclose()
+
+    async def __aenter__(self) -> "AsyncScrapedDataRepository":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def register_scraped_photo(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+        return await self._register(source_data, job_id, local_file_name, "photo")
+
+    async def register_scraped_video_or_document(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+        return await self._register(source_data, job_id, local_file_name, "video")
+
+    async def register_scraped_json(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+        source_data.relative_path = self.file_repository.compressed_relative_path(source_data.relative_path)
+        return await self._register(source_data, job_id, local_file_name, "json", compress=True)
+
+    async def register_scraped_parquet(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str) -> KernelPlancksterSourceData:
+        return await self._register(source_data, job_id, local_file_name, "parquet")
+
+    async def _register(self, source_data: KernelPlancksterSourceData, job_id: int, local_file_name: str, file_type: str, compress: bool = False) -> KernelPlancksterSourceData:
+
+        match self.protocol:
+
+            case ProtocolEnum.S3:
+
+                if self.file_repository.use_chunked_upload(local_file_name):
+                    self.logger.info(f"{job_id}: Uploading {file_type} to object store in parts")
+
+                    loop = asyncio.get_running_loop()
+
+                    def sign_url(relative_path: str) -> str:
+                        coroutine = self.kernel_planckster.generate_signed_url(source_data=source_data.model_copy(update={"relative_path": relative_path}))
+                        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+                    manifest_path = await asyncio.to_thread(
+                        self.file_repository.chunked_upload, local_file_name, source_data.relative_path, sign_url, compress=compress,
+                    )
+                    uploaded = source_data.model_copy(update={"relative_path": manifest_path})
+
+                    self.logger.info(f"{job_id}: Uploaded {file_type} to {manifest_path}")
+
+                else:
+                    signed_url = await self.kernel_planckster.generate_signed_url(source_data=source_data)
+
+                    self.logger.info(f"{job_id}: Uploading {file_type} to object store")
+
+                    await self.file_repository.public_upload_async(signed_url, local_file_name, client=self._upload_client, compress=compress)
+
+                    self.logger.info(
+                    f"{job_id}: Uploaded {file_type} to {signed_url}"
+                    )
+                    uploaded = source_data
+
+                await self.kernel_planckster.register_new_source_data(source_data=uploaded)
+                source_data.relative_path = uploaded.relative_path
+
+            case ProtocolEnum.LOCAL:
+                # If local, then we don't use kernel planckster at all
+                # NOTE: local is deprecated
+                await asyncio.to_thread(
+                    self.file_repository.save_file_locally,
+                    file_to_save=local_file_name,
+                    source_data=source_data,
+                    file_type=file_type,
+                    compress=compress,
+                )
+
+        return source_data
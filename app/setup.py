@@ -4,7 +4,7 @@ from typing import Tuple
 from dotenv import load_dotenv
 from app.sdk.file_repository import FileRepository
 from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
-from app.sdk.models import ProtocolEnum
+from app.sdk.models import CompressionEnum, ProtocolEnum
 
 
 def _setup_kernel_planckster(
@@ -41,6 +41,11 @@ def _setup_file_repository(
     job_id: int,
     storage_protocol: ProtocolEnum,
     logger: Logger,
+    compression: CompressionEnum = CompressionEnum.NONE,
+    compression_level: int | None = None,
+    chunked_upload_threshold: int | None = None,
+    part_size: int = 8 * 1024 * 1024,
+    upload_parallelism: int = 4,
 ) -> FileRepository:
         
     try:
@@ -52,6 +57,11 @@ def _setup_file_repository(
 
         file_repository = FileRepository(
             protocol=storage_protocol,
+            compression=compression,
+            compression_level=compression_level,
+            chunked_upload_threshold=chunked_upload_threshold,
+            part_size=part_size,
+            upload_parallelism=upload_parallelism,
         )
 
         logger.info(f"{job_id}: File Repository setup successfully.")
@@ -70,10 +80,17 @@ def setup(
     kp_auth_token=str,
     kp_host=str,
     kp_port=int,
-    kp_scheme=str
+    kp_scheme=str,
+    compression: CompressionEnum = CompressionEnum.NONE,
+    compression_level: int | None = None,
+    chunked_upload_threshold: int | None = None,
+    part_size: int = 8 * 1024 * 1024,
+    upload_parallelism: int = 4,
 ) -> Tuple[KernelPlancksterGateway, ProtocolEnum, FileRepository]:
     """
     Setup the Kernel Planckster Gateway, the storage protocol and the file repository.
+    The file repository compresses scraped json files with `compression` at `compression_level`, and uploads files larger
+    than `chunked_upload_threshold` bytes in parts of `part_size` bytes, `upload_parallelism` at a time.
 
     """
 
@@ -94,7 +111,9 @@ def setup(
         logger.info(f"{job_id}: Storage protocol: {protocol}")
 
 
-        file_repository = _setup_file_repository(job_id, protocol, logger)
+        file_repository = _setup_file_repository(
+            job_id, protocol, logger, compression, compression_level, chunked_upload_threshold, part_size, upload_parallelism,
+        )
 
 
         return kernel_planckster, protocol, file_repository
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from pydantic import BaseModel
+
+from app.partitioning import WINDOW_PAGE_STRIDE
+from app.pipeline import ScrapedPage
+from app.sdk.models import KernelPlancksterSourceData
+
+
+class ScrapedShard(BaseModel):
+    """
+    The pages of one fixed range of page keys, rolled up into a single artifact, in page order.
+
+    @attr pages: the pages of the shard
+    @attr local_file: the local file the raw tweets of the pages were persisted to
+    @attr source_data: the source data the shard was registered as
+    """
+    pages: List[ScrapedPage]
+    local_file: str | None = None
+    source_data: KernelPlancksterSourceData | None = None
+
+    @property
+    def name(self) -> str:
+        """
+        A name derived from the pages of the shard's range that it holds, so that it is the same for every run of a job that
+        scraped the same pages: "pages_00005-00008", prefixed with the window of a partitioned job from its second window on,
+        e.g. "window_00003_pages_00005-00008". The parts of a range scraped by different runs of a resumed job hold disjoint
+        pages, so their names never collide.
+        """
+        window, first = divmod(min(page.page for page in self.pages), WINDOW_PAGE_STRIDE)
+        last = max(page.page for page in self.pages) % WINDOW_PAGE_STRIDE
+        name = f"pages_{first:05d}-{last:05d}"
+        return f"window_{window:05d}_{name}" if window else name
+
+
+class ShardBuffer:
+    """
+    Rolls completed pages up into shards of fixed ranges of `pages_per_shard` pages: pages 1 to `pages_per_shard` of a
+    window, then the next `pages_per_shard`, and so on. A shard is handed out once every page of its range has completed,
+    whatever order the pages complete in; the ranges left incomplete, e.g. the last one, are handed out by `drain`.
+
+    :param pages_per_shard: The number of pages in a range.
+    :param done: Page keys completed before, e.g. by an earlier run of a resumed job, which count towards their range.
+    """
+
+    def __init__(self, pages_per_shard: int, done: Iterable[int] = ()) -> None:
+        if pages_per_shard < 1:
+            raise ValueError(f"pages_per_shard must be at least 1, got {pages_per_shard}")
+        self._pages_per_shard = pages_per_shard
+        self._pages: Dict[Tuple[int, int], List[ScrapedPage]] = {}
+        self._done: Dict[Tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+        for page in done:
+            self._done[self._range(page)] = self._done.get(self._range(page), 0) + 1
+
+    def add(self, page: ScrapedPage) -> ScrapedShard | None:
+        """
+        Add a page, and return the shard it completes, if any.
+        """
+        key = self._range(page.page)
+        with self._lock:
+            pages = self._pages.setdefault(key, [])
+            pages.append(page)
+            if len(pages) + self._done.get(key, 0) >= self._pages_per_shard:
+                return self._take(key)
+        return None
+
+    def skip(self, page: int) -> ScrapedShard | None:
+        """
+        Count a page that has nothing to add towards its range, e.g. one whose tweets were all duplicates, and return the
+        shard it completes, if any.
+        """
+        key = self._range(page)
+        with self._lock:
+            self._done[key] = self._done.get(key, 0) + 1
+            if key in self._pages and len(self._pages[key]) + self._done[key] >= self._pages_per_shard:
+                return self._take(key)
+        return None
+
+    def drain(self) -> List[ScrapedShard]:
+        """
+        Return the pages left over as the shards of their incomplete ranges, in page order.
+        """
+        with self._lock:
+            return [self._take(key) for key in sorted(self._pages)]
+
+    def _range(self, page: int) -> Tuple[int, int]:
+        window, number = divmod(page, WINDOW_PAGE_STRIDE)
+        return window, (number - 1) // self._pages_per_shard
+
+    def _take(self, key: Tuple[int, int]) -> ScrapedShard:
+        return ScrapedShard(pages=sorted(self._pages.pop(key), key=lambda page: page.page))
+
+
+def save_shard(shard: ScrapedShard, file_path: str) -> None:
+    """
+    Write the raw tweets of a shard like `save_tweets` does for a page, with the page of each tweet.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        json.dump(
+            [{"page": page.page, "tweet": tweet, "tweet_number": i + 1} for page in shard.pages for i, tweet in enumerate(page.tweets)],
+            f,
+        )
+
+
+def save_shard_manifest(pages: Dict[int, KernelPlancksterSourceData], file_path: str) -> None:
+    """
+    Write the manifest of a sharded job: its shards with their pages, and the shard of every page.
+
+    :param pages: The source data of the shard of each page.
+    """
+    shards: Dict[str, List[int]] = {}
+    pages = {page: source_data for page, source_data in pages.items() if source_data is not None}
+    for page in sorted(pages):
+        shards.setdefault(pages[page].relative_path, []).append(page)
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        json.dump(
+            {
+                "shards": [{"relative_path": relative_path, "pages": shard_pages} for relative_path, shard_pages in shards.items()],
+                "pages": {str(page): pages[page].relative_path for page in sorted(pages)},
+            },
+            f,
+            indent=4,
+        )
@@ -0,0 +1,311 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Protocol
+
+import requests
+from pydantic import BaseModel, Field
+
+from app.geocoding import Coordinates, Geocoder, get_default_geocoder
+from app.utils import safe_file_name
+
+
+class Span(BaseModel):
+    """
+    A timed operation of a job, e.g. a page, a tweet augmentation or an upload.
+
+    @attr trace_id: the tracer id of the job; all spans of a job share it
+    @attr span_id: a random id of the span
+    @attr parent_id: the id of the span this one is part of, None for the root span of the job
+    @attr name: the kind of operation, e.g. "page" or "geocode"
+    @attr start: when the span started, in seconds since the epoch
+    @attr duration: how long it took, in seconds, None while it runs
+    @attr attributes: what the operation was about, e.g. the page number
+    @attr error: the error the operation failed with, if any
+    """
+    trace_id: str
+    span_id: str = Field(default_factory=lambda: secrets.token_hex(8))
+    parent_id: str | None = None
+    name: str
+    start: float = Field(default_factory=time.time)
+    duration: float | None = None
+    attributes: Dict[str, Any] = {}
+    error: str | None = None
+    # perf_counter at the start, for the duration
+    _started: float = 0.0
+
+
+class SpanExporter(Protocol):
+    def export(self, spans: List[Span]) -> None:
+        ...
+
+
+class JsonlSpanExporter:
+    """
+    Appends spans to `{directory}/{trace_id}.jsonl`, one JSON object per line, so that the spans of a job are in one file
+    named by its tracer id. Tracer ids come from the clients of the API, so they are made safe to use as file names, see
+    `safe_file_name`.
+    """
+
+    def __init__(self, directory: str = ".cache/traces") -> None:
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._lock = threading.Lock()
+
+    def path(self, trace_id: str) -> str:
+        return os.path.join(self._directory, f"{safe_file_name(trace_id)}.jsonl")
+
+    def export(self, spans: List[Span]) -> None:
+        by_trace: Dict[str, List[Span]] = {}
+        for span in spans:
+            by_trace.setdefault(span.trace_id, []).append(span)
+        with self._lock:
+            for trace_id, trace_spans in by_trace.items():
+                with open(self.path(trace_id), "a", encoding="utf-8") as f:
+                    f.write("".join(span.model_dump_json() + "\n" for span in trace_spans))
+
+
+def otlp_trace_id(trace_id: str) -> str:
+    """
+    The 16-byte hex trace id OTLP expects, derived from a tracer id, so that the spans of a job share it.
+    """
+    return hashlib.md5(trace_id.encode()).hexdigest()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpSpanExporter:
+    """
+    Sends spans to an OpenTelemetry collector, as OTLP/HTTP JSON posted to `{endpoint}/v1/traces`.
+    The tracer id is kept as the `tracer_id` attribute of every span. Spans that cannot be sent are logged and dropped.
+    """
+
+    def __init__(self, endpoint: str, headers: Dict[str, str] | None = None, service_name: str = "twitter-scraper", timeout: float = 10) -> None:
+        self._url = endpoint.rstrip("/") + "/v1/traces"
+        self._headers = {"Content-Type": "application/json", **(headers or {})}
+        self._service_name = service_name
+        self._timeout = timeout
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    def _span(self, span: Span) -> Dict[str, Any]:
+        start = int(span.start * 1e9)
+        otlp_span: Dict[str, Any] = {
+            "traceId": otlp_trace_id(span.trace_id),
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int((span.duration or 0) * 1e9)),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in {"tracer_id": span.trace_id, **span.attributes}.items()
+                if value is not None
+            ],
+            # 1 is OK, 2 is ERROR
+            "status": {"code": 2, "message": span.error} if span.error is not None else {"code": 1},
+        }
+        if span.parent_id is not None:
+            otlp_span["parentSpanId"] = span.parent_id
+        return otlp_span
+
+    def export(self, spans: List[Span]) -> None:
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self._service_name}}]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [self._span(span) for span in spans]}],
+            }],
+        }
+        try:
+            response = requests.post(self._url, data=json.dumps(body), headers=self._headers, timeout=self._timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as error:
+            self.logger.warning(f"Could not send {len(spans)} spans to {self._url}: {error}")
+
+
+class Tracer:
+    """
+    Records the spans of a job, under the tracer id of the job, and exports them in batches of `batch_size` as they end.
+
+    The first span started without a parent is the root span of the job. Spans started without a parent are part of
+    the innermost span open in the same thread, opened with `span`, or of the root span in threads without one, so
+    spans of the pipeline stages and worker threads end up under the root span.
+    """
+
+    def __init__(self, trace_id: str, exporter: SpanExporter | None = None, batch_size: int = 100) -> None:
+        self.trace_id = trace_id
+        self._exporter = exporter
+        self._batch_size = batch_size
+        self._root: Span | None = None
+        self._ended: List[Span] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def root(self) -> Span | None:
+        return self._root
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def start_span(self, name: str, parent: Span | None = None, **attributes: Any) -> Span:
+        """
+        Start a span, which is exported once it is ended with `end_span`.
+        """
+        if parent is None:
+            stack = self._stack()
+            parent = stack[-1] if stack else self._root
+        span = Span(trace_id=self.trace_id, parent_id=parent.span_id if parent is not None else None, name=name, attributes=attributes)
+        span._started = time.perf_counter()
+        with self._lock:
+            if self._root is None and parent is None:
+                self._root = span
+        return span
+
+    def end_span(self, span: Span, error: BaseException | str | None = None) -> None:
+        span.duration = time.perf_counter() - span._started
+        if error is not None:
+            span.error = str(error) or type(error).__name__
+        with self._lock:
+            self._ended.append(span)
+            batch = self._ended if len(self._ended) >= self._batch_size else None
+            if batch is not None:
+                self._ended = []
+        if batch is not None:
+            self._export(batch)
+
+    @contextlib.contextmanager
+    def span(self, name: str, parent: Span | None = None, **attributes: Any) -> Iterator[Span]:
+        """
+        Run the block as a span, the parent of the spans started in it by the same thread. Errors raised by the block end
+        the span as failed.
+        """
+        span = self.start_span(name, parent, **attributes)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as error:
+            self.end_span(span, error)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            stack.pop()
+
+    def flush(self) -> None:
+        """
+        Export the spans that ended since the last batch.
+        """
+        with self._lock:
+            batch, self._ended = self._ended, []
+        if batch:
+            self._export(batch)
+
+    def _export(self, spans: List[Span]) -> None:
+        if self._exporter is None:
+            return
+        try:
+            self._exporter.export(spans)
+        except Exception as error:
+            # tracing never fails a job
+            self.logger.warning(f"{self.trace_id}: Could not export {len(spans)} spans: {error}")
+
+
+def traced(tracer: Tracer | None, name: str, **attributes: Any) -> contextlib.AbstractContextManager:
+    """
+    `tracer.span(name, **attributes)`, or a block that is not traced if there is no tracer.
+    """
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, **attributes)
+
+
+class TracedChatClient:
+    """
+    Wraps an instructor client, so that every `chat.completions.create` is a span named "llm".
+    """
+
+    def __init__(self, client: Any, tracer: Tracer) -> None:
+        self._client = client
+        self._tracer = tracer
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs: Any) -> Any:
+        response_model = kwargs.get("response_model")
+        with self._tracer.span("llm", model=kwargs.get("model"), response_model=getattr(response_model, "__name__", None)):
+            return self._client.chat.completions.create(**kwargs)
+
+
+class TracedGeocoder:
+    """
+    Wraps a geocoder, so that every lookup is a span named "geocode".
+
+    :param geocoder: The geocoder to trace, the process-wide default geocoder if None, which is created on first use.
+    """
+
+    def __init__(self, geocoder: Geocoder | None, tracer: Tracer) -> None:
+        self._geocoder = geocoder
+        self._tracer = tracer
+
+    def geocode(self, location_name: str) -> Coordinates | None:
+        geocoder = self._geocoder if self._geocoder is not None else get_default_geocoder()
+        with self._tracer.span("geocode", location=location_name) as span:
+            coordinates = geocoder.geocode(location_name)
+            span.attributes["found"] = coordinates is not None
+            return coordinates
+
+
+def span_exporter_from_env() -> SpanExporter:
+    """
+    Read where to export spans from the environment:
+    - OTEL_EXPORTER_OTLP_ENDPOINT, the OTLP/HTTP collector to send them to, with the headers in
+      OTEL_EXPORTER_OTLP_HEADERS, e.g. "authorization=Bearer abc,x-team=sda"
+    - otherwise TRACE_DIR, the directory of the JSONL files, .cache/traces by default
+    """
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if endpoint:
+        headers = dict(
+            header.split("=", 1) for header in os.getenv("OTEL_EXPORTER_OTLP_HEADERS", "").split(",") if "=" in header
+        )
+        return OtlpSpanExporter(endpoint, headers={key.strip(): value.strip() for key, value in headers.items()})
+    return JsonlSpanExporter(os.getenv("TRACE_DIR", ".cache/traces"))
+
+
+_default_span_exporter: SpanExporter | None = None
+_default_span_exporter_lock = threading.Lock()
+
+
+def get_span_exporter() -> SpanExporter:
+    """
+    Return the process-wide span exporter, read from the environment on first use.
+    """
+    global _default_span_exporter
+    with _default_span_exporter_lock:
+        if _default_span_exporter is None:
+            _default_span_exporter = span_exporter_from_env()
+        return _default_span_exporter
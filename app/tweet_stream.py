@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Iterator, List, Sequence, Tuple
+
+from app.pipeline import ScrapedPage
+from app.postprocess import PostProcessingPool, chunked
+
+
+AUGMENTED_COLUMNS = ["Title", "Tweet", "Extracted_Location", "Resolved_Latitude", "Resolved_Longitude", "Month", "Day", "Year", "Disaster_Type"]
+
+
+class TweetStreamWriter:
+    """
+    Appends the raw tweets and augmented rows of each page to NDJSON files as pages complete, and produces the final
+    `tweet_all` and augmented JSON artifacts from those files line by line, so memory use does not grow with the result set.
+
+    Records are written in the order pages complete, which is page order unless pages are processed concurrently.
+    Both files are truncated when the writer is created, so a resumed job replays its checkpointed pages into fresh files.
+
+    Given a `parquet_file`, augmented rows are also written there as they arrive, see AugmentedParquetWriter.
+
+    Given a `pool` with workers, pages are serialized and the final artifacts formatted `chunk_size` records at a time
+    in its worker processes; the files are the same either way.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        timestamp: str,
+        parquet_file: str | None = None,
+        pool: PostProcessingPool | None = None,
+        chunk_size: int = 200,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self._raw_path = os.path.join(directory, f"tweets_{timestamp}.ndjson")
+        self._augmented_path = os.path.join(directory, f"augmented_{timestamp}.ndjson")
+        self._raw_file = open(self._raw_path, "w", encoding="utf-8")
+        self._augmented_file = open(self._augmented_path, "w", encoding="utf-8")
+        self._tweet_count = 0
+        self._augmented_count = 0
+        self._parquet_writer = AugmentedParquetWriter(parquet_file) if parquet_file else None
+        self._pool = pool or PostProcessingPool()
+        self._chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def logger(self) -> logging.Logger:
+        return self._logger
+
+    @property
+    def raw_path(self) -> str:
+        return self._raw_path
+
+    @property
+    def augmented_path(self) -> str:
+        return self._augmented_path
+
+    @property
+    def tweet_count(self) -> int:
+        return self._tweet_count
+
+    @property
+    def augmented_count(self) -> int:
+        return self._augmented_count
+
+    def write_page(self, page: ScrapedPage) -> None:
+        raw_lines, augmented_lines = self._pool.run(serialize_page, page.page, page.tweets, page.augmented)
+        with self._lock:
+            self._raw_file.write(raw_lines)
+            self._augmented_file.write(augmented_lines)
+            self._tweet_count += len(page.tweets)
+            self._augmented_count += len(page.augmented)
+            if self._parquet_writer is not None:
+                self._parquet_writer.write_rows(page.augmented)
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._raw_file, self._augmented_file):
+                if not f.closed:
+                    f.close()
+            if self._parquet_writer is not None:
+                self._parquet_writer.close()
+
+    def iter_tweets(self) -> Iterator[dict]:
+        self._flush()
+        for record in _read_ndjson(self._raw_path):
+            yield record["tweet"]
+
+    def iter_augmented_rows(self) -> Iterator[List[Any]]:
+        self._flush()
+        for record in _read_ndjson(self._augmented_path):
+            yield record["row"]
+
+    def write_tweet_all(self, file_path: str) -> int:
+        """
+        Write all raw tweets in the format of `save_tweets`: a JSON list of {"tweet": ..., "tweet_number": ...}.
+
+        :return: The number of tweets written.
+        """
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        count = 0
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for chunk_count, text in self._pool.map(_format_tweet_all_chunk, self._line_chunks(self._raw_path)):
+                if count:
+                    f.write(", ")
+                f.write(text)
+                count += chunk_count
+            f.write("]")
+        return count
+
+    def write_augmented_json(self, file_path: str) -> int:
+        """
+        Write all augmented rows as a JSON object of row number -> {column: value}, the layout of pandas' `to_json(orient='index')`.
+
+        :return: The number of rows written.
+        """
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        count = 0
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("{")
+            for chunk_count, text in self._pool.map(_format_augmented_chunk, self._line_chunks(self._augmented_path)):
+                f.write(text)
+                count += chunk_count
+            f.write("\n}" if count else "}")
+        return count
+
+    def _line_chunks(self, file_path: str) -> Iterator[Tuple[int, List[str]]]:
+        """
+        The NDJSON lines of a file, `chunk_size` at a time, with the index of the first record of each chunk.
+        """
+        self._flush()
+        start = 0
+        with open(file_path, "r", encoding="utf-8") as f:
+            for chunk in chunked((line for line in f if line.strip()), self._chunk_size):
+                yield start, chunk
+                start += len(chunk)
+
+    def _flush(self) -> None:
+        with self._lock:
+            for f in (self._raw_file, self._augmented_file):
+                if not f.closed:
+                    f.flush()
+
+
+def serialize_page(page_number: int, tweets: List[dict], rows: List[list]) -> Tuple[str, str]:
+    """
+    The NDJSON lines of the raw tweets and augmented rows of a page.
+    """
+    raw_lines = "".join(json.dumps({"page": page_number, "tweet": tweet}) + "\n" for tweet in tweets)
+    augmented_lines = "".join(json.dumps({"page": page_number, "row": row}) + "\n" for row in rows)
+    return raw_lines, augmented_lines
+
+
+def _format_tweet_all_chunk(chunk: Tuple[int, List[str]]) -> Tuple[int, str]:
+    start, lines = chunk
+    text = ", ".join(
+        json.dumps({"tweet": json.loads(line)["tweet"], "tweet_number": number})
+        for number, line in enumerate(lines, start + 1)
+    )
+    return len(lines), text
+
+
+def _format_augmented_chunk(chunk: Tuple[int, List[str]]) -> Tuple[int, str]:
+    start, lines = chunk
+    parts = []
+    for number, line in enumerate(lines, start):
+        record = json.dumps(dict(zip(AUGMENTED_COLUMNS, json.loads(line)["row"])), indent=4).replace("\n", "\n    ")
+        parts.append(f"{',' if number else ''}\n    \"{number}\": {record}")
+    return len(lines), "".join(parts)
+
+
+def _to_float(value: Any) -> float | None:
+    # geocoding misses are recorded as "no latitude" / "no longitude" in the JSON rows
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _to_int(value: Any) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AugmentedParquetWriter:
+    """
+    Writes augmented rows to a Parquet file with a typed schema, one row group per `row_group_size` rows, as they arrive.
+    Coordinates are float64, with nulls where geocoding failed, and the year is an int32.
+
+    Needs pyarrow.
+    """
+
+    def __init__(self, file_path: str, row_group_size: int = 10_000) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise ImportError("Parquet output needs pyarrow, install it with `pip install pyarrow`") from error
+
+        self._pa = pa
+        self.schema = pa.schema([
+            ("Title", pa.string()),
+            ("Tweet", pa.string()),
+            ("Extracted_Location", pa.string()),
+            ("Resolved_Latitude", pa.float64()),
+            ("Resolved_Longitude", pa.float64()),
+            ("Month", pa.string()),
+            ("Day", pa.string()),
+            ("Year", pa.int32()),
+            ("Disaster_Type", pa.string()),
+        ])
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self._file_path = file_path
+        self._row_group_size = row_group_size
+        self._buffer: List[Sequence[Any]] = []
+        self._row_count = 0
+        self._writer = pq.ParquetWriter(file_path, self.schema, compression="zstd")
+
+    @property
+    def file_path(self) -> str:
+        return self._file_path
+
+    @property
+    def row_count(self) -> int:
+        return self._row_count
+
+    def write_rows(self, rows: List[Sequence[Any]]) -> None:
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self._row_group_size:
+            self._write_row_group(self._buffer[:self._row_group_size])
+            self._buffer = self._buffer[self._row_group_size:]
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        if self._buffer:
+            self._write_row_group(self._buffer)
+            self._buffer = []
+        self._writer.close()
+        self._writer = None
+
+    def _write_row_group(self, rows: List[Sequence[Any]]) -> None:
+        columns = list(zip(*rows))
+        arrays = [
+            [str(value) if value is not None else None for value in columns[0]],
+            [str(value) if value is not None else None for value in columns[1]],
+            [str(value) if value is not None else None for value in columns[2]],
+            [_to_float(value) for value in columns[3]],
+            [_to_float(value) for value in columns[4]],
+            [str(value) if value is not None else None for value in columns[5]],
+            [str(value) if value is not None else None for value in columns[6]],
+            [_to_int(value) for value in columns[7]],
+            [str(value) if value is not None else None for value in columns[8]],
+        ]
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(values, type=field.type) for values, field in zip(arrays, self.schema)],
+            schema=self.schema,
+        )
+        self._writer.write_table(table, row_group_size=len(rows))
+        self._row_count += len(rows)
+
+
+def _read_ndjson(file_path: str) -> Iterator[dict]:
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
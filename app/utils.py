@@ -0,0 +1,25 @@
+import hashlib
+import re
+import unicodedata
+
+
+def normalize_words(text: str) -> str:
+    """
+    Normalize text for matching word by word: accents stripped, case folded, punctuation removed, whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def safe_file_name(name: str) -> str:
+    """
+    A file name for a user-given id, such as a tracer id, that stays in the directory it is joined to: characters other
+    than letters, digits, ".", "-" and "_" are replaced, and a hash of the id is appended if any were, so that ids that
+    differ only in those characters do not share a file.
+    """
+    safe = re.sub(r"[^\w.-]", "_", name).lstrip(".")
+    if safe == name:
+        return name
+    return f"{safe}-{hashlib.md5(name.encode()).hexdigest()[:8]}"
@@ -0,0 +1,307 @@
+"""
+Local stand-ins for the upstream services the scraper talks to, so tests and benchmarks can run without network access.
+"""
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from app.scraper import batchFilterData, filterData, messageData
+
+
+def make_tweet(page: int, position: int) -> dict:
+    return {
+        "position": position,
+        "title": f"Maui Fire Watch (@mauifire{page}_{position})",
+        "snippet": f"Page {page}, tweet {position}: the wildfire near Lahaina keeps spreading, evacuations ordered...",
+        "highlighted_keywords": ["wildfire"],
+        "link": f"https://twitter.com/mauifire/status/{page:04d}{position:03d}",
+        "displayed_link": "https://twitter.com/mauifire",
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops connections when many clients connect at once, which costs them a 1s SYN retransmit
+    request_queue_size = 128
+
+
+class StandInServer:
+    """
+    Runs a ThreadingHTTPServer on a free local port in a background thread. Use as a context manager.
+    """
+
+    def __init__(self, handler_class: type[BaseHTTPRequestHandler]) -> None:
+        self._server = _Server(("127.0.0.1", 0), handler_class)
+        self._server.stand_in = self  # type: ignore
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.requests: list[str] = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _ScraperAPIHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        stand_in: ScraperAPIStandIn = self.server.stand_in  # type: ignore
+        params = parse_qs(urlparse(self.path).query)
+        page = int(params.get("page", ["1"])[0])
+        pages = stand_in.pages_between(params["date_range_start"][0], params["date_range_end"][0]) if stand_in.pages_per_day is not None else stand_in.pages
+        with stand_in.lock:
+            stand_in.requests.append(self.path)
+            scripted = stand_in.script.pop(0) if stand_in.script else None
+
+        time.sleep(stand_in.latency)
+
+        if scripted is not None:
+            status, retry_after = scripted if isinstance(scripted, tuple) else (scripted, None)
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if page <= pages:
+            body = {"organic_results": [make_tweet(page, i) for i in range(1, stand_in.tweets_per_page + 1)]}
+            if stand_in.pages_per_day is not None and stand_in.report_totals:
+                body["search_information"] = {"total_results": pages * stand_in.tweets_per_page}
+        else:
+            body = {"search_information": {"total_results": 0}}
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class ScraperAPIStandIn(StandInServer):
+    """
+    Serves `structured/twitter/search`: pages 1..`pages` return `tweets_per_page` tweets each, later pages return no `organic_results`.
+    Every request takes `latency` seconds, to emulate the upstream round trip. The first requests are answered from `script`
+    instead, in order: a status code, or a (status code, Retry-After) tuple, with an empty body.
+
+    With `pages_per_day`, the number of pages depends on the date range of the query instead: the sum of the pages of its
+    days, the end date excluded. Its total number of results is then reported in `search_information`, unless
+    `report_totals` is off.
+    """
+
+    def __init__(
+        self,
+        pages: int = 10,
+        tweets_per_page: int = 20,
+        latency: float = 0.0,
+        script: list[int | tuple[int, str | int]] | None = None,
+        pages_per_day: dict[str, int] | None = None,
+        report_totals: bool = True,
+    ) -> None:
+        super().__init__(_ScraperAPIHandler)
+        self.pages = pages
+        self.tweets_per_page = tweets_per_page
+        self.latency = latency
+        self.script = list(script or [])
+        self.pages_per_day = pages_per_day
+        self.report_totals = report_totals
+
+    def pages_between(self, start_date: str, end_date: str) -> int:
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        days = ((start + timedelta(days=i)).isoformat() for i in range((end - start).days))
+        return sum((self.pages_per_day or {}).get(day, 0) for day in days)
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.url}/structured/twitter/search"
+
+
+class _KernelPlancksterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # send each response in one segment, so keep-alive connections do not stall on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        stand_in: KernelPlancksterStandIn = self.server.stand_in  # type: ignore
+        with stand_in.lock:
+            stand_in.connections += 1
+        # paid once per connection, like a TCP + TLS handshake
+        time.sleep(stand_in.connect_latency)
+
+    def _respond(self, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _record(self) -> tuple[str, dict]:
+        stand_in: KernelPlancksterStandIn = self.server.stand_in  # type: ignore
+        parsed = urlparse(self.path)
+        with stand_in.lock:
+            stand_in.requests.append(parsed.path)
+        time.sleep(stand_in.latency)
+        return parsed.path, {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+    def do_GET(self) -> None:
+        stand_in: KernelPlancksterStandIn = self.server.stand_in  # type: ignore
+        path, params = self._record()
+        if path == "/ping":
+            self._respond({"ping": "pong"})
+        else:
+            self._respond({"signed_url": f"{stand_in.url}/object-store/{params.get('relative_path')}"})
+
+    def do_PUT(self) -> None:
+        stand_in: KernelPlancksterStandIn = self.server.stand_in  # type: ignore
+        path, _ = self._record()
+        if "Content-Length" not in self.headers:
+            # like S3 presigned URLs, which reject chunked uploads
+            self.send_response(411)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if stand_in.bandwidth:
+            time.sleep(len(body) / stand_in.bandwidth)
+        with stand_in.lock:
+            failing = stand_in.failing_uploads > 0
+            if failing:
+                stand_in.failing_uploads -= 1
+            else:
+                stand_in.uploads[path.removeprefix("/object-store/")] = body
+        if failing:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._respond({})
+
+    def do_POST(self) -> None:
+        stand_in: KernelPlancksterStandIn = self.server.stand_in  # type: ignore
+        _, params = self._record()
+        with stand_in.lock:
+            failing = stand_in.failing_registrations > 0
+            if failing:
+                stand_in.failing_registrations -= 1
+            else:
+                stand_in.registered.append(params.get("source_data_relative_path"))
+        if failing:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._respond({"source_data": {
+            "name": params.get("source_data_name"),
+            "protocol": params.get("source_data_protocol"),
+            "relative_path": params.get("source_data_relative_path"),
+        }})
+
+
+class KernelPlancksterStandIn(StandInServer):
+    """
+    Serves the Kernel Planckster endpoints used by the gateway: `/ping`, `upload-credentials` and `source`, over keep-alive
+    HTTP/1.1 connections, and an object store the signed urls point to, which keeps uploads in `uploads` by relative path.
+    Every new connection takes `connect_latency` seconds, to emulate the handshake with a remote server, and every request
+    takes `latency` seconds. The first `failing_uploads` uploads and the first `failing_registrations` registrations fail
+    with a 500; the relative paths of the successful registrations are kept in `registered`. With a `bandwidth` in bytes
+    per second, uploads take as long as they would over a link of that speed.
+    """
+
+    def __init__(self, connect_latency: float = 0.0, latency: float = 0.0, failing_uploads: int = 0, bandwidth: float | None = None, failing_registrations: int = 0) -> None:
+        super().__init__(_KernelPlancksterHandler)
+        self.bandwidth = bandwidth
+        self.connect_latency = connect_latency
+        self.latency = latency
+        self.failing_uploads = failing_uploads
+        self.failing_registrations = failing_registrations
+        self.connections = 0
+        self.uploads: dict[str, bytes] = {}
+        self.registered: list[str] = []
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+
+class _OTLPCollectorHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        stand_in: OTLPCollectorStandIn = self.server.stand_in  # type: ignore
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with stand_in.lock:
+            stand_in.requests.append(self.path)
+            stand_in.headers.append(dict(self.headers))
+            stand_in.spans.extend(
+                span for resource in body["resourceSpans"] for scope in resource["scopeSpans"] for span in scope["spans"]
+            )
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class OTLPCollectorStandIn(StandInServer):
+    """
+    Accepts OTLP/HTTP JSON trace exports on `/v1/traces`, and keeps the spans they hold in `spans`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(_OTLPCollectorHandler)
+        self.spans: list[dict] = []
+        self.headers: list[dict] = []
+
+
+class FakeInstructorClient:
+    """
+    Stands in for an instructor-patched OpenAI client: `chat.completions.create` answers with `responder(response_model, prompt)`
+    and records every request.
+    """
+
+    def __init__(self, responder) -> None:
+        self.responder = responder
+        self.requests: list[tuple[str, type, str]] = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, model: str, response_model: type, messages: list[dict], **kwargs):
+        prompt = messages[-1]["content"]
+        self.requests.append((model, response_model, prompt))
+        return self.responder(response_model, prompt)
+
+
+def wildfire_responder(response_model, prompt):
+    """
+    Answers relevance requests by looking for "wildfire" in the tweets, and extraction requests with a fixed Lahaina wildfire.
+    """
+    if response_model is batchFilterData:
+        tweets = [line for line in prompt.splitlines() if line[:1].isdigit()]
+        return batchFilterData(relevant=["wildfire" in line for line in tweets])
+    if response_model is filterData:
+        return filterData(relevant="wildfire" in prompt.split("Is this tweet describing")[0])
+    return messageData(city="Lahaina", country="USA", year=2023, month="August", day="09", disaster_type="Wildfire")
@@ -0,0 +1,208 @@
+import functools
+import json
+import os
+
+import app.scraper
+from app.checkpoint import ScrapeCheckpoint
+from app.dedup import DedupIndex
+from app.fetcher import fetch_pages
+from app.pipeline import ScrapedPage
+from app.sdk.file_repository import FileRepository
+from app.sdk.models import BaseJobState, KernelPlancksterSourceData, ProtocolEnum
+from app.sdk.scraped_data_repository import ScrapedDataRepository
+from tests.stand_ins import ScraperAPIStandIn, make_tweet
+
+
+def _page(page: int) -> ScrapedPage:
+    return ScrapedPage(
+        page=page,
+        tweets=[make_tweet(page, 1)],
+        augmented=[["title", "tweet", "Lahaina,USA", 20.87, -156.67, "August", "09", 2023, "Wildfire"]],
+        source_data=KernelPlancksterSourceData(name=f"tweet_{page}", protocol=ProtocolEnum.LOCAL, relative_path=f"tweet_{page}.json"),
+    )
+
+
+def test_checkpoint_roundtrip_and_torn_lines(tmp_path) -> None:
+
+    checkpoint = ScrapeCheckpoint(str(tmp_path), "tracer", 1, interval=2)
+    for page in (1, 2, 3):
+        checkpoint.record(_page(page))
+    checkpoint.close()
+
+    with open(checkpoint.path, "a") as f:
+        f.write('{"type": "page", "data": {"pa')
+
+    resumed = ScrapeCheckpoint(str(tmp_path), "tracer", 1)
+    assert resumed.timestamp == checkpoint.timestamp
+    assert sorted(resumed.completed) == [1, 2, 3]
+    assert resumed.completed[2] == _page(2).source_data
+    assert list(resumed.iter_pages()) == [_page(1), _page(2), _page(3)]
+
+    # records appended after a torn line stay readable
+    resumed.record(_page(4))
+    assert [page.page for page in resumed.iter_pages()] == [1, 2, 3, 4]
+
+    resumed.clear()
+    assert not os.path.exists(resumed.path)
+
+
+def test_checkpoints_stay_in_the_checkpoint_directory(tmp_path) -> None:
+
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "checkpoints"), "../../tracer", 1)
+    checkpoint.record(_page(1))
+    checkpoint.close()
+
+    assert os.path.dirname(checkpoint.path) == str(tmp_path / "checkpoints")
+    assert os.listdir(tmp_path) == ["checkpoints"]
+    assert sorted(ScrapeCheckpoint(str(tmp_path / "checkpoints"), "../../tracer", 1).completed) == [1]
+    assert ScrapeCheckpoint(str(tmp_path / "checkpoints"), "tracer", 1).path == str(tmp_path / "checkpoints" / "tracer-1.ndjson")
+
+
+def test_scrape_resumes_from_checkpoint(tmp_path, monkeypatch) -> None:
+
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "checkpoints"), "tracer", 1)
+    for page in (1, 2):
+        checkpoint.record(_page(page))
+    checkpoint.close()
+
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+    repository = ScrapedDataRepository(
+        protocol=ProtocolEnum.LOCAL,
+        kernel_planckster=None,
+        file_repository=FileRepository(ProtocolEnum.LOCAL, data_dir=str(tmp_path / "data")),
+    )
+
+    with ScraperAPIStandIn(pages=4, tweets_per_page=2) as stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=stand_in.search_url, page_delay=0))
+        output = app.scraper.scrape(
+            job_id=1,
+            tracer_id="tracer",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=repository,
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+            checkpoint_dir=str(tmp_path / "checkpoints"),
+        )
+        requested = {int(path.split("page=")[1].split("&")[0]) for path in stand_in.requests}
+
+    assert output.job_state == BaseJobState.FINISHED
+    assert [source_data.name for source_data in output.source_data_list] == ["tweet_1", "tweet_2", "tweet_3", "tweet_4"]
+    assert requested == {3, 4, 5}
+    assert os.path.exists(tmp_path / "data" / "twitter" / "tracer" / "1" / "scraped" / f"tweet_all_{checkpoint.timestamp}.json")
+    assert not os.path.exists(checkpoint.path)
+    with open(tmp_path / "data" / "twitter" / "tracer" / "1" / "scraped" / f"tweet_all_{checkpoint.timestamp}.json") as f:
+        tweet_all = json.load(f)
+    assert [record["tweet"]["link"] for record in tweet_all][:2] == [make_tweet(1, 1)["link"], make_tweet(2, 1)["link"]]
+    assert len(tweet_all) == 6
+
+
+def test_resume_with_a_persistent_dedup_index(tmp_path, monkeypatch) -> None:
+
+    # the earlier run checkpointed pages 1 and 2, and deduplicated pages 3 and 4 before it crashed
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "checkpoints"), "tracer", 1)
+    dedup_index = DedupIndex(path=str(tmp_path / "dedup.sqlite"))
+    for page in (1, 2):
+        checkpoint.record(_page(page))
+    for page in (1, 2, 3, 4):
+        dedup_index.unique([make_tweet(page, 1), make_tweet(page, 2)], job="tracer-1", page=page)
+    checkpoint.close()
+    dedup_index.close()
+
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+    repository = ScrapedDataRepository(
+        protocol=ProtocolEnum.LOCAL,
+        kernel_planckster=None,
+        file_repository=FileRepository(ProtocolEnum.LOCAL, data_dir=str(tmp_path / "data")),
+    )
+
+    with ScraperAPIStandIn(pages=4, tweets_per_page=2) as stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=stand_in.search_url, page_delay=0))
+        output = app.scraper.scrape(
+            job_id=1,
+            tracer_id="tracer",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=repository,
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+            checkpoint_dir=str(tmp_path / "checkpoints"),
+            dedup_index=DedupIndex(path=str(tmp_path / "dedup.sqlite")),
+        )
+
+    assert output.job_state == BaseJobState.FINISHED
+    assert [source_data.name for source_data in output.source_data_list] == ["tweet_1", "tweet_2", "tweet_3", "tweet_4"]
+    with open(tmp_path / "data" / "twitter" / "tracer" / "1" / "scraped" / f"tweet_all_{checkpoint.timestamp}.json") as f:
+        assert len(json.load(f)) == 6
+
+    # once the job finished, its tweets deduplicate later jobs
+    later_job = DedupIndex(path=str(tmp_path / "dedup.sqlite"))
+    assert later_job.discard("tracer-1") == 0
+    assert later_job.unique([make_tweet(3, 1), make_tweet(4, 2)]) == []
+
+
+def test_pages_of_duplicates_are_checkpointed(tmp_path, monkeypatch) -> None:
+
+    recorded: dict[int, KernelPlancksterSourceData | None] = {}
+    record = ScrapeCheckpoint.record
+
+    def spy(self, page: ScrapedPage) -> None:
+        recorded[page.page] = page.source_data
+        record(self, page)
+
+    monkeypatch.setattr(ScrapeCheckpoint, "record", spy)
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+    repository = ScrapedDataRepository(
+        protocol=ProtocolEnum.LOCAL,
+        kernel_planckster=None,
+        file_repository=FileRepository(ProtocolEnum.LOCAL, data_dir=str(tmp_path / "data")),
+    )
+
+    def scrape(**kwargs):
+        # page 2 was scraped by an earlier job
+        dedup_index = DedupIndex()
+        dedup_index.unique([make_tweet(2, 1), make_tweet(2, 2)])
+        with ScraperAPIStandIn(pages=3, tweets_per_page=2) as stand_in:
+            monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=stand_in.search_url, page_delay=0))
+            output = app.scraper.scrape(
+                job_id=1,
+                tracer_id="tracer",
+                query="Maui Wildfires",
+                start_date="2023-08-08",
+                end_date="2023-08-30",
+                scraped_data_repository=repository,
+                work_dir=str(tmp_path / "work"),
+                log_level="WARNING",
+                scraper_api_key="test",
+                openai_api_key="test",
+                checkpoint_dir=str(tmp_path / "checkpoints"),
+                dedup_index=dedup_index,
+                **kwargs,
+            )
+            return output, {int(path.split("page=")[1].split("&")[0]) for path in stand_in.requests}
+
+    output, _ = scrape()
+    assert output.job_state == BaseJobState.FINISHED
+    assert recorded[2] is None
+    assert sorted(recorded) == [1, 2, 3]
+    assert [source_data.name for source_data in output.source_data_list] == ["tweet_1", "tweet_3"]
+
+    recorded.clear()
+    output, _ = scrape(shard_pages=3)
+    assert recorded[2] is None
+    assert [source_data.name for source_data in output.source_data_list] == ["tweet_pages_00001-00003", "tweet_shards"]
+
+    # a resumed job does not fetch the page again
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "checkpoints"), "tracer", 1)
+    checkpoint.record(_page(1))
+    checkpoint.record(ScrapedPage(page=2, tweets=[]))
+    checkpoint.close()
+    output, requested = scrape()
+    assert requested == {3, 4}
+    assert [source_data.name for source_data in output.source_data_list] == ["tweet_1", "tweet_3"]
@@ -0,0 +1,61 @@
+from app.dedup import DedupIndex, normalize_link, shingles
+from tests.stand_ins import make_tweet
+
+
+def _tweet(link: str, snippet: str) -> dict:
+    return {"title": "User (@user)", "snippet": snippet, "link": link}
+
+
+TEXT = "Evacuations ordered in Lahaina as the wildfire jumps the highway and spreads toward the harbor, residents urged to leave now"
+
+
+def test_normalize_link_and_shingles() -> None:
+
+    assert normalize_link("https://x.com/user/status/1?s=20") == normalize_link("https://twitter.com/user/status/1/")
+    assert shingles("RT @someone: Fire near the town") == shingles("Fire near the town @other https://t.co/abc")
+
+
+def test_exact_and_near_duplicates_are_skipped() -> None:
+
+    index = DedupIndex()
+
+    assert not index.seen(_tweet("https://twitter.com/a/status/1", TEXT))
+    assert index.seen(_tweet("https://x.com/a/status/1?s=20", "something else entirely"))
+    assert index.seen(_tweet("https://twitter.com/b/status/2", f"RT @a: {TEXT}"))
+    assert index.seen(_tweet("https://twitter.com/c/status/3", TEXT.replace("now", "immediately")))
+    assert not index.seen(_tweet("https://twitter.com/d/status/4", "Sunny day at the beach with friends, the water is perfect and the waves are small"))
+    assert index.stats == {"unique": 2, "duplicate_links": 1, "near_duplicates": 2}
+
+
+def test_unique_keeps_order_within_a_page() -> None:
+
+    tweets = [make_tweet(1, i) for i in range(1, 4)]
+    index = DedupIndex()
+
+    assert index.unique(tweets + [dict(tweets[0])]) == tweets
+    assert index.unique(tweets) == []
+
+
+def test_persistent_index_deduplicates_across_jobs(tmp_path) -> None:
+
+    path = str(tmp_path / "dedup.sqlite")
+    first_job = DedupIndex(path=path)
+    assert not first_job.seen(_tweet("https://twitter.com/a/status/1", TEXT))
+    first_job.close()
+
+    second_job = DedupIndex(path=path)
+    assert second_job.seen(_tweet("https://twitter.com/z/status/9", TEXT))
+
+
+def test_texts_without_words_are_only_checked_by_their_link() -> None:
+
+    index = DedupIndex()
+    tweets = [
+        _tweet("https://twitter.com/a/status/1", "🔥🔥🔥"),
+        _tweet("https://twitter.com/b/status/2", "https://t.co/abc"),
+        _tweet("https://twitter.com/c/status/3", "@someone"),
+    ]
+
+    assert index.unique(tweets) == tweets
+    assert index.seen(_tweet("https://x.com/a/status/1", "🔥"))
+    assert index.stats == {"unique": 3, "duplicate_links": 1, "near_duplicates": 0}
@@ -0,0 +1,68 @@
+import time
+
+from app.fetcher import fetch_pages
+from tests.stand_ins import ScraperAPIStandIn
+
+
+def _fetch_all(search_url: str, concurrency: int) -> list[int]:
+    return [
+        page
+        for page, data in fetch_pages(
+            job_id=1,
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraper_api_key="test",
+            concurrency=concurrency,
+            page_delay=0,
+            search_url=search_url,
+        )
+    ]
+
+
+def test_fetch_pages_in_order_and_stops_at_first_empty_page() -> None:
+
+    with ScraperAPIStandIn(pages=7, tweets_per_page=3) as stand_in:
+        pages = _fetch_all(stand_in.search_url, concurrency=4)
+
+    assert pages == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_concurrent_fetch_throughput() -> None:
+
+    with ScraperAPIStandIn(pages=16, latency=0.05) as stand_in:
+        start = time.perf_counter()
+        sequential_pages = _fetch_all(stand_in.search_url, concurrency=1)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent_pages = _fetch_all(stand_in.search_url, concurrency=8)
+        concurrent_time = time.perf_counter() - start
+
+    print(f"sequential: {sequential_time:.3f}s, concurrent (8): {concurrent_time:.3f}s, speedup: {sequential_time / concurrent_time:.1f}x")
+
+    assert sequential_pages == concurrent_pages == list(range(1, 17))
+    assert concurrent_time < sequential_time / 2
+
+
+def test_fetch_pages_skips_completed_pages() -> None:
+
+    with ScraperAPIStandIn(pages=6, tweets_per_page=1) as stand_in:
+        pages = [
+            page
+            for page, _ in fetch_pages(
+                job_id=1,
+                query="Maui Wildfires",
+                start_date="2023-08-08",
+                end_date="2023-08-30",
+                scraper_api_key="test",
+                concurrency=2,
+                page_delay=0,
+                search_url=stand_in.search_url,
+                skip_pages={1, 2, 4},
+            )
+        ]
+        requested = sorted(int(path.split("page=")[1].split("&")[0]) for path in stand_in.requests)
+
+    assert pages == [3, 5, 6]
+    assert 1 not in requested and 2 not in requested and 4 not in requested
@@ -1,10 +1,20 @@
+import gzip
+import io
+import json
 import os
+import random
 import tempfile
+import time
 import uuid
 
+import pytest
+import zstandard
+
+from app.scraper import save_tweets
 from app.sdk.file_repository import FileRepository
 from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
-from app.sdk.models import KernelPlancksterSourceData, ProtocolEnum
+from app.sdk.models import CompressionEnum, KernelPlancksterSourceData, ProtocolEnum
+from tests.stand_ins import KernelPlancksterStandIn
 
 
 def test_file_name_to_pfn_and_back(
@@ -80,4 +90,137 @@ def test_public_upload(
     file_repository.public_upload(
         signed_url=signed_url,
         file_path=tmp_file,
-    )
\ No newline at end of file
+    )
+
+_WORDS = (
+    "wildfire fire smoke evacuation lahaina maui kula hawaii county crews containment acres wind winds red flag warning "
+    "shelter residents homes destroyed burning road closed highway update officials emergency power outage water "
+    "please share stay safe praying for everyone donate relief help families lost everything tonight morning"
+).split()
+
+
+def _tweet(rng: random.Random, number: int) -> dict:
+    handle = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789_") for _ in range(rng.randint(5, 14)))
+    return {
+        "position": number % 20 + 1,
+        "title": f"{handle.title()} (@{handle})",
+        "snippet": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(12, 40))) + f" #{rng.choice(_WORDS)}",
+        "highlighted_keywords": rng.sample(_WORDS[:8], 2),
+        "link": f"https://twitter.com/{handle}/status/{rng.randrange(10 ** 18, 10 ** 19)}",
+        "displayed_link": f"https://twitter.com/{handle}",
+    }
+
+
+def _tweet_page_file(directory, tweets: int) -> str:
+    rng = random.Random(42)
+    file_path = os.path.join(directory, "tweets.json")
+    save_tweets([_tweet(rng, number) for number in range(tweets)], file_path)
+    return file_path
+
+
+def _decompress(data: bytes, compression: CompressionEnum) -> bytes:
+    if compression == CompressionEnum.GZIP:
+        return gzip.decompress(data)
+    return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+
+
+@pytest.mark.parametrize("compression", [CompressionEnum.GZIP, CompressionEnum.ZSTD])
+def test_save_file_locally_compressed(tmp_path, compression: CompressionEnum) -> None:
+
+    file_repository = FileRepository(ProtocolEnum.LOCAL, data_dir=str(tmp_path / "data"), compression=compression)
+    file_path = _tweet_page_file(tmp_path, 200)
+    source_data = KernelPlancksterSourceData(
+        name="tweet_1",
+        protocol=ProtocolEnum.LOCAL,
+        relative_path=file_repository.compressed_relative_path("twitter/tweet_1.json"),
+    )
+
+    pfn = file_repository.save_file_locally(file_path, source_data, "json", compress=True)
+
+    assert source_data.relative_path == f"twitter/tweet_1.json{compression.suffix}"
+    assert file_repository.compressed_relative_path(source_data.relative_path) == source_data.relative_path
+    with open(file_repository.pfn_to_file_name(pfn), "rb") as f, open(file_path, "rb") as original:
+        assert _decompress(f.read(), compression) == original.read()
+
+
+def test_compressed_upload_size_and_time(tmp_path) -> None:
+
+    file_path = _tweet_page_file(tmp_path, 5000)
+    source_data = KernelPlancksterSourceData(name="tweet_all", protocol=ProtocolEnum.S3, relative_path="twitter/tweet_all.json")
+    results = {}
+
+    # a 5 MB/s link to the object store
+    with KernelPlancksterStandIn(bandwidth=5 * 1024 * 1024) as stand_in:
+        kernel_planckster = KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http")
+        for compression in CompressionEnum:
+            file_repository = FileRepository(ProtocolEnum.S3, compression=compression)
+            relative_path = file_repository.compressed_relative_path(source_data.relative_path)
+            signed_url = kernel_planckster.generate_signed_url(source_data.model_copy(update={"relative_path": relative_path}))
+            start = time.perf_counter()
+            file_repository.public_upload(signed_url, file_path, compress=True)
+            results[compression] = (time.perf_counter() - start, len(stand_in.uploads[relative_path]))
+
+    for compression, (upload_time, size) in results.items():
+        print(f"{compression.value}: {size / 1024:.0f} KiB in {upload_time * 1000:.0f}ms")
+
+    original_size = os.path.getsize(file_path)
+    assert results[CompressionEnum.NONE][1] == original_size
+    assert not os.path.exists(f"{file_path}.gz") and not os.path.exists(f"{file_path}.zst")
+    for compression in (CompressionEnum.GZIP, CompressionEnum.ZSTD):
+        upload_time, size = results[compression]
+        assert size < original_size / 2
+        assert upload_time < results[CompressionEnum.NONE][0]
+        assert _decompress(stand_in.uploads[f"twitter/tweet_all.json{compression.suffix}"], compression) == open(file_path, "rb").read()
+
+
+def _reassemble(stand_in: KernelPlancksterStandIn, manifest_path: str) -> bytes:
+    manifest = json.loads(stand_in.uploads[manifest_path])
+    return b"".join(stand_in.uploads[part["relative_path"]] for part in manifest["parts"])
+
+
+def _part_uploads(stand_in: KernelPlancksterStandIn) -> list[str]:
+    return [path for path in stand_in.requests if ".part-" in path and path.startswith("/object-store/")]
+
+
+def test_chunked_upload_retries_failed_parts(tmp_path) -> None:
+
+    file_path = _tweet_page_file(tmp_path, 500)
+    file_repository = FileRepository(ProtocolEnum.S3, part_size=16 * 1024, upload_parallelism=4, part_retry_delay=0)
+
+    with KernelPlancksterStandIn(failing_uploads=2) as stand_in:
+        kernel_planckster = KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http")
+        sign_url = lambda relative_path: kernel_planckster.generate_signed_url(
+            KernelPlancksterSourceData(name="tweet_all", protocol=ProtocolEnum.S3, relative_path=relative_path)
+        )
+        manifest_path = file_repository.chunked_upload(file_path, "twitter/tweet_all.json", sign_url)
+
+    part_count = -(-os.path.getsize(file_path) // (16 * 1024))
+    assert manifest_path == "twitter/tweet_all.json.manifest.json"
+    assert len(json.loads(stand_in.uploads[manifest_path])["parts"]) == part_count
+    assert len(_part_uploads(stand_in)) == part_count + 2
+    assert _reassemble(stand_in, manifest_path) == open(file_path, "rb").read()
+    assert not os.path.exists(f"{file_path}.upload.json")
+
+
+def test_chunked_upload_resumes_after_interruption(tmp_path) -> None:
+
+    file_path = _tweet_page_file(tmp_path, 500)
+    file_repository = FileRepository(
+        ProtocolEnum.S3, compression=CompressionEnum.GZIP, part_size=4 * 1024, upload_parallelism=2, part_retries=0,
+    )
+
+    with KernelPlancksterStandIn(failing_uploads=3) as stand_in:
+        kernel_planckster = KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http")
+        sign_url = lambda relative_path: kernel_planckster.generate_signed_url(
+            KernelPlancksterSourceData(name="tweet_all", protocol=ProtocolEnum.S3, relative_path=relative_path)
+        )
+        with pytest.raises(ValueError, match="3 of"):
+            file_repository.chunked_upload(file_path, "twitter/tweet_all.json.gz", sign_url, compress=True)
+        assert os.path.exists(f"{file_path}.upload.json")
+        first_attempt = len(_part_uploads(stand_in))
+
+        manifest_path = file_repository.chunked_upload(file_path, "twitter/tweet_all.json.gz", sign_url, compress=True)
+
+    assert len(_part_uploads(stand_in)) == first_attempt + 3
+    assert gzip.decompress(_reassemble(stand_in, manifest_path)) == open(file_path, "rb").read()
+    assert not os.path.exists(f"{file_path}.upload.json")
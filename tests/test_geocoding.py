@@ -0,0 +1,165 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.geocoding import FallbackGeocoder, GazetteerGeocoder, GeocodeCache, NominatimGeocoder, RateLimiter, create_geocoder
+
+
+class CountingGeolocator:
+    def __init__(self, known: dict) -> None:
+        self.known = known
+        self.calls: list[str] = []
+
+    def geocode(self, location_name: str):
+        self.calls.append(location_name)
+        coordinates = self.known.get(location_name)
+        return SimpleNamespace(latitude=coordinates[0], longitude=coordinates[1]) if coordinates else None
+
+
+def test_geocoder_caches_positive_and_negative_results(tmp_path) -> None:
+
+    geolocator = CountingGeolocator({"Maui,USA": (20.8, -156.3)})
+    geocoder = NominatimGeocoder(min_interval=0, cache=GeocodeCache(cache_dir=str(tmp_path)), geolocator=geolocator)
+
+    for _ in range(3):
+        assert geocoder.geocode("Maui,USA") == (20.8, -156.3)
+        assert geocoder.geocode("Atlantis,Nowhere") is None
+
+    assert geolocator.calls == ["Maui,USA", "Atlantis,Nowhere"]
+
+    # a new process reuses the persisted cache
+    restarted = NominatimGeocoder(min_interval=0, cache=GeocodeCache(cache_dir=str(tmp_path)), geolocator=geolocator)
+    assert restarted.geocode("maui,usa") == (20.8, -156.3)
+    assert restarted.geocode("Atlantis,Nowhere") is None
+    assert len(geolocator.calls) == 2
+
+
+def test_negative_results_expire_in_memory(tmp_path, monkeypatch) -> None:
+
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    geolocator = CountingGeolocator({"Maui,USA": (20.8, -156.3)})
+    geocoder = NominatimGeocoder(min_interval=0, cache=GeocodeCache(cache_dir=str(tmp_path), negative_ttl=60), geolocator=geolocator)
+
+    assert geocoder.geocode("Atlantis,Nowhere") is None
+    assert geocoder.geocode("Maui,USA") == (20.8, -156.3)
+    now[0] += 30
+    assert geocoder.geocode("Atlantis,Nowhere") is None
+    assert geolocator.calls == ["Atlantis,Nowhere", "Maui,USA"]
+
+    # past the TTL, the same cache instance looks the negative result up again; positive results do not expire
+    now[0] += 31
+    assert geocoder.geocode("Atlantis,Nowhere") is None
+    assert geocoder.geocode("Maui,USA") == (20.8, -156.3)
+    assert geolocator.calls == ["Atlantis,Nowhere", "Maui,USA", "Atlantis,Nowhere"]
+
+
+def test_geocoder_does_not_cache_errors(tmp_path) -> None:
+
+    class FailingGeolocator:
+        calls = 0
+
+        def geocode(self, location_name: str):
+            self.calls += 1
+            raise TimeoutError("Nominatim timed out")
+
+    geolocator = FailingGeolocator()
+    geocoder = NominatimGeocoder(min_interval=0, cache=GeocodeCache(cache_dir=str(tmp_path)), geolocator=geolocator)
+
+    assert geocoder.geocode("Maui,USA") is None
+    assert geocoder.geocode("Maui,USA") is None
+    assert geolocator.calls == 2
+
+
+def test_geocoder_rate_limits_concurrent_lookups(tmp_path) -> None:
+
+    geolocator = CountingGeolocator({f"City {i},USA": (float(i), 0.0) for i in range(4)})
+    geocoder = NominatimGeocoder(min_interval=0.1, cache=GeocodeCache(cache_dir=str(tmp_path)), geolocator=geolocator)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=geocoder.geocode, args=(f"City {i % 4},USA",)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    assert sorted(geolocator.calls) == [f"City {i},USA" for i in range(4)]
+    assert elapsed >= 0.3
+
+
+def test_rate_limiter_spaces_calls() -> None:
+
+    limiter = RateLimiter(min_interval=0.05)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.wait()
+    assert time.perf_counter() - start >= 0.2
+
+
+def _geonames_row(geonameid, name, asciiname, alternatenames, latitude, longitude, country_code, population) -> str:
+    columns = [geonameid, name, asciiname, alternatenames, latitude, longitude, "P", "PPL", country_code, "", "", "", "", "", population, "", "5", "Pacific/Honolulu", "2023-08-10"]
+    return "\t".join(str(column) for column in columns)
+
+
+def _write_gazetteer(tmp_path) -> tuple[str, str]:
+    gazetteer = tmp_path / "cities1000.txt"
+    gazetteer.write_text("\n".join([
+        _geonames_row(5849996, "Lahaina", "Lahaina", "Lahaina,Lāhainā", 20.87429, -156.67663, "US", 12702),
+        _geonames_row(5856195, "Kahului", "Kahului", "", 20.88953, -156.47432, "US", 26337),
+        _geonames_row(2523920, "Paris", "Paris", "", 48.85341, 2.3488, "FR", 2138551),
+        _geonames_row(4717560, "Paris", "Paris", "", 33.66094, -95.55551, "US", 24782),
+        _geonames_row(2267057, "São Miguel", "Sao Miguel", "", 37.78, -25.5, "PT", 5000),
+    ]) + "\n", encoding="utf-8")
+    country_info = tmp_path / "countryInfo.txt"
+    country_info.write_text("#ISO\tISO3\tISO-Numeric\tfips\tCountry\n"
+                            "US\tUSA\t840\tUS\tUnited States\n"
+                            "FR\tFRA\t250\tFR\tFrance\n", encoding="utf-8")
+    return str(gazetteer), str(country_info)
+
+
+def test_gazetteer_geocoder_lookups(tmp_path) -> None:
+
+    gazetteer_path, country_info_path = _write_gazetteer(tmp_path)
+    geocoder = GazetteerGeocoder(gazetteer_path, country_info_path=country_info_path)
+
+    assert len(geocoder) == 5
+    assert geocoder.geocode("Lahaina,USA") == (20.87429, -156.67663)
+    assert geocoder.geocode("  LAHAINA , United States") == (20.87429, -156.67663)
+    assert geocoder.geocode("Paris,France") == (48.85341, 2.3488)
+    assert geocoder.geocode("Paris,US") == (33.66094, -95.55551)
+    assert geocoder.geocode("Paris") == (48.85341, 2.3488)
+    assert geocoder.geocode("Sao Miguel,Portugal") == (37.78, -25.5)
+    # fuzzy match on a misspelling
+    assert geocoder.geocode("Kahalui,USA") == (20.88953, -156.47432)
+    assert geocoder.geocode("Atlantis,Nowhere") is None
+
+
+def test_gazetteer_simple_layout(tmp_path) -> None:
+
+    gazetteer = tmp_path / "gazetteer.tsv"
+    gazetteer.write_text("name\tcountry\tlatitude\tlongitude\nLahaina\tUSA\t20.87\t-156.67\n", encoding="utf-8")
+
+    assert GazetteerGeocoder(str(gazetteer)).geocode("Lahaina,USA") == (20.87, -156.67)
+
+
+def test_fallback_geocoder_only_calls_fallback_on_a_miss(tmp_path) -> None:
+
+    gazetteer_path, _ = _write_gazetteer(tmp_path)
+    geolocator = CountingGeolocator({"Atlantis,Nowhere": (1.0, 2.0)})
+    geocoder = FallbackGeocoder(GazetteerGeocoder(gazetteer_path), NominatimGeocoder(min_interval=0, geolocator=geolocator))
+
+    assert geocoder.geocode("Lahaina,USA") == (20.87429, -156.67663)
+    assert geocoder.geocode("Atlantis,Nowhere") == (1.0, 2.0)
+    assert geolocator.calls == ["Atlantis,Nowhere"]
+
+
+def test_create_offline_geocoder(tmp_path) -> None:
+
+    gazetteer_path, _ = _write_gazetteer(tmp_path)
+
+    assert isinstance(create_geocoder("offline", gazetteer_path), GazetteerGeocoder)
+    with pytest.raises(ValueError):
+        create_geocoder("offline")
@@ -0,0 +1,182 @@
+import functools
+import threading
+import time
+
+import pytest
+
+import app.scraper
+from app.fetcher import fetch_pages
+from app.sdk.file_repository import FileRepository
+from app.sdk.job_executor import JobExecutor
+from app.sdk.job_manager import BaseJobManager
+from app.sdk.job_store import SQLiteJobStore
+from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
+from app.sdk.models import BaseJob, BaseJobState, JobOutput, KernelPlancksterSourceData, ProtocolEnum
+from app.sdk.scraped_data_repository import ScrapedDataRepository
+from tests.stand_ins import KernelPlancksterStandIn, ScraperAPIStandIn
+
+
+def _job(job_id: int) -> BaseJob:
+    return BaseJob(id=job_id, tracer_id=f"tracer-{job_id}", name=f"test-{job_id}")
+
+
+def _sleep(job: BaseJob, seconds: float) -> int:
+    time.sleep(seconds)
+    return job.id
+
+
+def _upload(job: BaseJob, kernel_planckster: KernelPlancksterGateway, local_file: str) -> str:
+    scraped_data_repository = ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3))
+    source_data = KernelPlancksterSourceData(name=f"tweet_{job.id}", protocol=ProtocolEnum.S3, relative_path=f"twitter/tweet_{job.id}.json")
+    return scraped_data_repository.register_scraped_json(source_data, job.id, local_file).relative_path
+
+
+def test_jobs_run_on_a_bounded_number_of_workers() -> None:
+
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def worker(job: BaseJob) -> None:
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    executor = JobExecutor(max_workers=3)
+    jobs = [_job(i) for i in range(10)]
+    futures = [executor.submit(job, worker) for job in jobs]
+    assert all(job.state in (BaseJobState.QUEUED, BaseJobState.RUNNING) for job in jobs)
+    for future in futures:
+        future.result(timeout=5)
+    executor.shutdown()
+
+    assert peak == 3
+    assert all(job.state == BaseJobState.FINISHED for job in jobs)
+
+
+def test_higher_priorities_run_first_and_equal_ones_in_order() -> None:
+
+    started: list[int] = []
+    gate = threading.Event()
+
+    def worker(job: BaseJob) -> None:
+        started.append(job.id)
+        gate.wait()
+
+    executor = JobExecutor(max_workers=1)
+    futures = [executor.submit(_job(0), worker)]
+    time.sleep(0.05)
+    futures += [executor.submit(_job(job_id), worker, priority=priority) for job_id, priority in [(1, 0), (2, 5), (3, 0), (4, 5)]]
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+    executor.shutdown()
+
+    assert started == [0, 2, 4, 1, 3]
+
+
+def test_cancelled_jobs_stop_or_never_run() -> None:
+
+    def worker(job: BaseJob, cancel_event: threading.Event) -> JobOutput:
+        cancel_event.wait(5)
+        return JobOutput(job_state=BaseJobState.CANCELLED, tracer_id=job.tracer_id, source_data_list=[])
+
+    executor = JobExecutor(max_workers=1)
+    running, queued = _job(1), _job(2)
+    running_future = executor.submit(running, worker)
+    queued_future = executor.submit(queued, worker)
+    time.sleep(0.05)
+
+    assert executor.cancel(queued.id)
+    assert executor.cancel(running.id)
+    running_future.result(timeout=5)
+    executor.shutdown()
+
+    assert queued_future.cancelled()
+    assert running.state == queued.state == BaseJobState.CANCELLED
+    assert not executor.cancel(running.id)
+
+
+def test_failed_jobs_record_their_error() -> None:
+
+    def worker(job: BaseJob) -> None:
+        raise RuntimeError("upstream down")
+
+    executor = JobExecutor(max_workers=1)
+    job = _job(1)
+    future = executor.submit(job, worker)
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    executor.shutdown()
+
+    assert job.state == BaseJobState.FAILED
+    assert job.messages == ["upstream down"]
+
+
+def test_jobs_run_in_worker_processes(tmp_path) -> None:
+
+    manager = BaseJobManager(executor=JobExecutor(max_workers=2, mode="process"), store=SQLiteJobStore(str(tmp_path / "jobs.sqlite")))
+    jobs = [manager.create_job(f"tracer-{i}", {}) for i in range(4)]
+    futures = [manager.start_job(job.id, _sleep, seconds=0.01) for job in jobs]
+
+    assert [future.result(timeout=30) for future in futures] == [job.id for job in jobs]
+    assert all(job.state == BaseJobState.FINISHED for job in manager.list_jobs().jobs)
+    manager.executor.shutdown()
+
+
+def test_jobs_in_worker_processes_get_their_own_gateway(tmp_path) -> None:
+
+    local_file = tmp_path / "tweets.json"
+    local_file.write_text('[{"tweet": 1}]')
+    manager = BaseJobManager(executor=JobExecutor(max_workers=1, mode="process"), store=SQLiteJobStore(str(tmp_path / "jobs.sqlite")))
+    job = manager.create_job("tracer", {})
+
+    with KernelPlancksterStandIn() as stand_in:
+        with KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http") as kernel_planckster:
+            assert kernel_planckster.ping()
+            future = manager.start_job(job.id, _upload, kernel_planckster=kernel_planckster, local_file=str(local_file))
+            assert future.result(timeout=60) == f"twitter/tweet_{job.id}.json"
+    manager.executor.shutdown()
+
+    assert stand_in.registered == [f"twitter/tweet_{job.id}.json"]
+    assert stand_in.uploads == {f"twitter/tweet_{job.id}.json": b'[{"tweet": 1}]'}
+
+
+def test_cancelling_a_scrape_keeps_what_it_uploaded(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+    executor = JobExecutor(max_workers=1)
+
+    with KernelPlancksterStandIn() as kernel_planckster_stand_in, ScraperAPIStandIn(pages=1000, tweets_per_page=1, latency=0.01) as scraper_api_stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+        kernel_planckster = KernelPlancksterGateway(host=kernel_planckster_stand_in.host, port=kernel_planckster_stand_in.port, auth_token="test", scheme="http")
+
+        def worker(job: BaseJob, cancel_event: threading.Event) -> JobOutput:
+            return app.scraper.scrape(
+                job_id=job.id,
+                tracer_id=job.tracer_id,
+                query="Maui Wildfires",
+                start_date="2023-08-08",
+                end_date="2023-08-30",
+                scraped_data_repository=ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3)),
+                work_dir=str(tmp_path / "work"),
+                log_level="WARNING",
+                scraper_api_key="test",
+                openai_api_key="test",
+                cancel_event=cancel_event,
+            )
+
+        job = _job(1)
+        future = executor.submit(job, worker)
+        time.sleep(0.3)
+        executor.cancel(job.id)
+        output = future.result(timeout=10)
+        executor.shutdown()
+
+    assert job.state == output.job_state == BaseJobState.CANCELLED
+    assert 0 < len(output.source_data_list) < 1000
+    assert job.output_source_data_list == output.source_data_list
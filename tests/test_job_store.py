@@ -0,0 +1,139 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.sdk.job_executor import JobExecutor
+from app.sdk.job_manager import BaseJobManager
+from app.sdk.job_store import InMemoryJobStore, JobFilter, SQLiteJobStore
+from app.sdk.models import BaseJob, BaseJobState
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteJobStore(str(tmp_path / "jobs.sqlite"))
+    return InMemoryJobStore()
+
+
+def test_jobs_are_listed_newest_first_by_page_and_filter(store) -> None:
+
+    jobs = [store.create(f"tracer-{i % 3}", "test", {"i": i}) for i in range(10)]
+    for job in jobs[::2]:
+        job.state = BaseJobState.FINISHED
+        store.save(job)
+
+    first = store.list(limit=4)
+    second = store.list(limit=4, cursor=first.next_cursor)
+    last = store.list(limit=4, cursor=second.next_cursor)
+    assert [job.id for job in first.jobs + second.jobs + last.jobs] == [job.id for job in reversed(jobs)]
+    assert last.next_cursor is None
+
+    finished = store.list(JobFilter(state=BaseJobState.FINISHED, tracer_id="tracer-0"))
+    assert [job.args["i"] for job in finished.jobs] == [6, 0]
+    assert store.get(jobs[0].id).state == BaseJobState.FINISHED
+    assert store.list(JobFilter(created_after=datetime.now() + timedelta(seconds=1))).jobs == []
+    with pytest.raises(KeyError):
+        store.get(1000)
+
+
+def test_jobs_survive_a_restart_and_interrupted_ones_fail(tmp_path) -> None:
+
+    path = str(tmp_path / "jobs.sqlite")
+    store = SQLiteJobStore(path)
+    finished, running = store.create("tracer", "test", {}), store.create("tracer", "test", {})
+    finished.state = BaseJobState.FINISHED
+    running.state = BaseJobState.RUNNING
+    store.save(finished)
+    store.save(running)
+    store.close()
+
+    restarted = SQLiteJobStore(path)
+
+    assert restarted.get(finished.id).state == BaseJobState.FINISHED
+    assert restarted.get(running.id).state == BaseJobState.FAILED
+    assert "restart" in restarted.get(running.id).messages[-1]
+    assert restarted.create("tracer", "test", {}).id == running.id + 1
+
+
+def test_a_second_server_does_not_fail_the_jobs_of_a_live_one(tmp_path) -> None:
+
+    path = str(tmp_path / "jobs.sqlite")
+    live = SQLiteJobStore(path, heartbeat_interval=0.05)
+    crashed = SQLiteJobStore(path, heartbeat_interval=3600)
+    jobs = {}
+    for store in (live, crashed):
+        job = store.create("tracer", "test", {})
+        job.state = BaseJobState.RUNNING
+        store.save(job)
+        jobs[store.owner] = job
+
+    second = SQLiteJobStore(path)
+    assert second.get(jobs[live.owner].id).state == BaseJobState.RUNNING
+    assert second.get(jobs[crashed.owner].id).state == BaseJobState.RUNNING
+
+    # the crashed server stopped beating, the live one keeps its job fresh
+    time.sleep(1.0)
+    third = SQLiteJobStore(path, stale_after=0.5)
+    assert third.get(jobs[live.owner].id).state == BaseJobState.RUNNING
+    assert third.get(jobs[crashed.owner].id).state == BaseJobState.FAILED
+
+    live.close()
+    assert third.get(jobs[live.owner].id).state == BaseJobState.FAILED
+
+
+def test_job_ids_are_unique_across_threads_and_stores(tmp_path) -> None:
+
+    stores = [SQLiteJobStore(str(tmp_path / "jobs.sqlite")) for _ in range(2)]
+    ids: list[int] = []
+    lock = threading.Lock()
+
+    def create(store: SQLiteJobStore) -> None:
+        for _ in range(50):
+            job = store.create("tracer", "test", {})
+            with lock:
+                ids.append(job.id)
+
+    threads = [threading.Thread(target=create, args=(stores[i % 2],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(ids) == list(range(1, 201))
+
+
+def test_listing_many_jobs_uses_an_index(tmp_path) -> None:
+
+    store = SQLiteJobStore(str(tmp_path / "jobs.sqlite"))
+    rows = []
+    for job_id in range(1, 30_001):
+        job = BaseJob(id=job_id, name=f"test-{job_id}", tracer_id=f"tracer-{job_id % 100}", state=BaseJobState.FINISHED if job_id % 10 else BaseJobState.FAILED)
+        rows.append((job.id, job.tracer_id, job.state.value, job.created_at.isoformat(), job.model_dump_json()))
+    store._connection.execute("BEGIN")
+    store._connection.executemany("INSERT INTO jobs (id, tracer_id, state, created_at, data) VALUES (?, ?, ?, ?, ?)", rows)
+    store._connection.execute("COMMIT")
+
+    start = time.perf_counter()
+    page = store.list(JobFilter(state=BaseJobState.FAILED, tracer_id="tracer-90"), limit=3)
+    print(f"filtered page of 3 out of 30000 jobs in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    assert [job.id for job in page.jobs] == [29_990, 29_890, 29_790]
+    assert page.next_cursor == 29_790
+    # the page is read through an index rather than by scanning every job
+    plan = " ".join(row[-1] for row in store._connection.execute(
+        "EXPLAIN QUERY PLAN SELECT id, data FROM jobs WHERE state = ? AND tracer_id = ? ORDER BY id DESC LIMIT 4", ("failed", "tracer-90"),
+    ))
+    assert "USING INDEX" in plan
+
+
+def test_job_manager_persists_state_transitions(tmp_path) -> None:
+
+    path = str(tmp_path / "jobs.sqlite")
+    manager = BaseJobManager(executor=JobExecutor(max_workers=1), store=SQLiteJobStore(path))
+    job = manager.create_job("tracer", {"query": "Maui Wildfires"})
+    manager.start_job(job.id, lambda job: None).result(timeout=5)
+    manager.executor.shutdown()
+
+    assert BaseJobManager(store=SQLiteJobStore(path)).get_job(job.id).state == BaseJobState.FINISHED
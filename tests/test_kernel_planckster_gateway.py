@@ -1,9 +1,13 @@
 import os
 import tempfile
+import time
 import uuid
+import httpx
+import pytest
 import requests
 from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
 from app.sdk.models import KernelPlancksterSourceData, ProtocolEnum
+from tests.stand_ins import KernelPlancksterStandIn
 
 
 def test_generate_signed_url(
@@ -63,4 +67,90 @@ def test_register_new_source_data(
     assert kp_sd["name"] == test_media_sd.name
 
     # Clean up
-    os.remove(tmp_file)
\ No newline at end of file
+    os.remove(tmp_file)
+
+def _register(kernel_planckster: KernelPlancksterGateway, index: int) -> None:
+    source_data = KernelPlancksterSourceData(name=f"tweet_{index}", protocol=ProtocolEnum.S3, relative_path=f"twitter/tweet_{index}.json")
+    kernel_planckster.generate_signed_url(source_data)
+    kernel_planckster.register_new_source_data(source_data)
+
+
+def test_pooled_client_reuses_connections_and_caches_pings() -> None:
+
+    with KernelPlancksterStandIn() as stand_in:
+        with KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http") as kernel_planckster:
+            for index in range(10):
+                _register(kernel_planckster, index)
+
+    assert stand_in.connections == 1
+    assert stand_in.requests.count("/ping") == 1
+    assert len(stand_in.requests) == 21
+
+
+def test_ping_cache_expires_and_is_invalidated_by_connection_errors() -> None:
+
+    requests_seen: list[str] = []
+    down = False
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if down:
+            raise httpx.ConnectError("connection refused", request=request)
+        requests_seen.append(request.url.path)
+        if request.url.path == "/ping":
+            return httpx.Response(200, json={"ping": "pong"})
+        if request.method == "GET":
+            return httpx.Response(200, json={"signed_url": "http://object-store.invalid/file"})
+        params = request.url.params
+        return httpx.Response(200, json={"source_data": {
+            "name": params["source_data_name"], "protocol": params["source_data_protocol"], "relative_path": params["source_data_relative_path"],
+        }})
+
+    def gateway(ping_ttl: float) -> KernelPlancksterGateway:
+        return KernelPlancksterGateway(
+            host="kp", port="8000", auth_token="test", scheme="http", ping_ttl=ping_ttl, client=httpx.Client(transport=httpx.MockTransport(handler)),
+        )
+
+    _register(gateway(ping_ttl=0), 1)
+    assert requests_seen.count("/ping") == 2
+
+    requests_seen.clear()
+    kernel_planckster = gateway(ping_ttl=60)
+    _register(kernel_planckster, 1)
+    _register(kernel_planckster, 2)
+    assert requests_seen.count("/ping") == 1
+
+    down = True
+    with pytest.raises(httpx.ConnectError):
+        kernel_planckster.register_new_source_data(KernelPlancksterSourceData(name="x", protocol=ProtocolEnum.S3, relative_path="x"))
+
+    down = False
+    requests_seen.clear()
+    _register(kernel_planckster, 3)
+    assert requests_seen[0] == "/ping"
+
+
+def test_registration_latency_with_pooled_client() -> None:
+
+    registrations = 20
+
+    with KernelPlancksterStandIn(connect_latency=0.01) as stand_in:
+        # the previous behaviour: a new connection and a ping for every request
+        unpooled = KernelPlancksterGateway(
+            host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http", ping_ttl=0,
+            client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=0)),
+        )
+        start = time.perf_counter()
+        for index in range(registrations):
+            _register(unpooled, index)
+        unpooled_latency = (time.perf_counter() - start) / registrations
+        unpooled.close()
+
+        with KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http") as pooled:
+            start = time.perf_counter()
+            for index in range(registrations):
+                _register(pooled, index)
+            pooled_latency = (time.perf_counter() - start) / registrations
+
+    print(f"per registration: unpooled {unpooled_latency * 1000:.1f}ms, pooled {pooled_latency * 1000:.1f}ms")
+
+    assert pooled_latency < unpooled_latency / 3
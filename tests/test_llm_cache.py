@@ -0,0 +1,59 @@
+import time
+
+import app.scraper
+from app.llm_cache import LLMCache
+from app.scraper import augment_tweets
+from tests.stand_ins import FakeInstructorClient, make_tweet, wildfire_responder
+
+
+def test_cache_hits_misses_and_normalization(tmp_path) -> None:
+
+    cache = LLMCache(cache_dir=str(tmp_path))
+
+    assert cache.get("filter", "gpt-4", "forest wildfire", "User A tweets: Fire!") is None
+    cache.put("filter", "gpt-4", "forest wildfire", "User A tweets: Fire!", {"relevant": True})
+
+    assert cache.get("filter", "gpt-4", "forest wildfire", "  user a   TWEETS: fire! ") == {"relevant": True}
+    assert cache.get("filter", "gpt-4", "flood", "User A tweets: Fire!") is None
+    assert cache.get("filter", "gpt-4-turbo", "forest wildfire", "User A tweets: Fire!") is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_cache_persists_across_instances(tmp_path) -> None:
+
+    LLMCache(cache_dir=str(tmp_path)).put("extract", "gpt-4-turbo", "", "tweet", {"city": "Lahaina"})
+
+    assert LLMCache(cache_dir=str(tmp_path)).get("extract", "gpt-4-turbo", "", "tweet") == {"city": "Lahaina"}
+
+
+def test_cache_ttl_and_size_eviction(tmp_path) -> None:
+
+    cache = LLMCache(cache_dir=str(tmp_path), ttl=0.05)
+    cache.put("filter", "gpt-4", "topic", "tweet", {"relevant": False})
+    time.sleep(0.1)
+    assert cache.get("filter", "gpt-4", "topic", "tweet") is None
+
+    cache = LLMCache(cache_dir=str(tmp_path / "small"), max_entries=10, memory_entries=0)
+    for i in range(11):
+        cache.put("filter", "gpt-4", "topic", f"tweet {i}", {"relevant": True})
+
+    assert cache.stats["entries"] <= 10
+    assert cache.get("filter", "gpt-4", "topic", "tweet 10") == {"relevant": True}
+    assert cache.get("filter", "gpt-4", "topic", "tweet 0") is None
+
+
+def test_augment_tweets_reuses_cached_completions(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "get_lat_long", lambda location, geocoder=None: (20.87, -156.67))
+    cache = LLMCache(cache_dir=str(tmp_path))
+    tweets = [make_tweet(1, i) for i in range(1, 6)]
+
+    first_client = FakeInstructorClient(wildfire_responder)
+    first = augment_tweets(first_client, tweets, "forest wildfire", cache=cache)
+
+    second_client = FakeInstructorClient(wildfire_responder)
+    second = augment_tweets(second_client, tweets, "forest wildfire", cache=cache)
+
+    assert len(first_client.requests) == 6
+    assert second_client.requests == []
+    assert first == second
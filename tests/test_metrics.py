@@ -0,0 +1,99 @@
+import functools
+
+import pytest
+
+import app.scraper
+from app.fetcher import fetch_pages
+from app.metrics import Counter, Histogram, ScrapeMetrics
+from app.sdk.file_repository import FileRepository
+from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
+from app.sdk.models import BaseJobState, ProtocolEnum
+from app.sdk.scraped_data_repository import ScrapedDataRepository
+from tests.stand_ins import FakeInstructorClient, KernelPlancksterStandIn, ScraperAPIStandIn, wildfire_responder
+
+
+class _Geocoder:
+    def geocode(self, location_name: str):
+        if location_name == "Atlantis,Nowhere":
+            raise RuntimeError("Nominatim is down")
+        return (20.87, -156.67)
+
+
+def test_metrics_render_in_the_prometheus_text_format() -> None:
+
+    histogram = Histogram("duration_seconds", "How long it took", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="fetch")
+    counter = Counter("pages_total", "Pages", ("job",))
+    counter.inc(job=1)
+    counter.inc(2, job=1)
+    counter.inc(job='say "hi"')
+
+    assert histogram.render() == [
+        "# HELP duration_seconds How long it took",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{stage="fetch",le="0.1"} 2',
+        'duration_seconds_bucket{stage="fetch",le="1.0"} 3',
+        'duration_seconds_bucket{stage="fetch",le="+Inf"} 4',
+        'duration_seconds_sum{stage="fetch"} 3.65',
+        'duration_seconds_count{stage="fetch"} 4',
+    ]
+    assert counter.render()[2:] == ['pages_total{job="1"} 3.0', 'pages_total{job="say \\"hi\\""} 1.0']
+    with pytest.raises(ValueError):
+        counter.inc(stage="fetch")
+    with pytest.raises(ValueError):
+        counter.inc(-1, job=1)
+
+
+def test_scrape_records_stage_latencies_throughput_and_errors(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper.instructor, "from_openai", lambda openai_client: FakeInstructorClient(wildfire_responder))
+    metrics = ScrapeMetrics()
+
+    with KernelPlancksterStandIn() as kernel_planckster_stand_in, ScraperAPIStandIn(pages=3, tweets_per_page=4) as scraper_api_stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+        kernel_planckster = KernelPlancksterGateway(host=kernel_planckster_stand_in.host, port=kernel_planckster_stand_in.port, auth_token="test", scheme="http")
+        output = app.scraper.scrape(
+            job_id=7,
+            tracer_id="tracer",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3), metrics=metrics),
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+            geocoder=_Geocoder(),
+            metrics=metrics,
+        )
+        fetch_requests = len(scraper_api_stand_in.requests)
+
+    assert output.job_state == BaseJobState.FINISHED
+    assert metrics.pages.value(job=7) == 3
+    assert metrics.tweets.value(job=7) == metrics.relevant_tweets.value(job=7) == 12
+    # 3 pages, tweet_all and the augmented JSON
+    assert metrics.uploads.value(job=7) == 5
+
+    duration = metrics.stage_duration
+    assert duration.count(job=7, stage="fetch") == fetch_requests == 4
+    assert duration.count(job=7, stage="llm_filter") == 3
+    assert duration.count(job=7, stage="llm_extract") == duration.count(job=7, stage="geocode") == 12
+    assert duration.count(job=7, stage="upload") == duration.count(job=7, stage="register") == 5
+    assert metrics.errors.value(job=7, stage="geocode") == 0
+
+    rendered = metrics.render()
+    assert 'scraper_pages_total{job="7"} 3.0' in rendered
+    assert 'scraper_stage_duration_seconds_count{job="7",stage="llm_extract"} 12' in rendered
+
+
+def test_failed_calls_are_counted_as_errors_of_their_stage() -> None:
+
+    metrics = ScrapeMetrics()
+
+    with pytest.raises(RuntimeError):
+        with metrics.timed("geocode", 3):
+            _Geocoder().geocode("Atlantis,Nowhere")
+
+    assert metrics.errors.value(job=3, stage="geocode") == 1
+    assert metrics.stage_duration.count(job=3, stage="geocode") == 1
@@ -0,0 +1,134 @@
+import functools
+import json
+import time
+
+import app.scraper
+from app.checkpoint import ScrapeCheckpoint
+from app.fetcher import fetch_pages
+from app.partitioning import DateWindow, daily_windows, fetch_windows, plan_windows
+from app.sdk.file_repository import FileRepository
+from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
+from app.sdk.models import BaseJobState, ProtocolEnum
+from app.sdk.scraped_data_repository import ScrapedDataRepository
+from tests.stand_ins import KernelPlancksterStandIn, ScraperAPIStandIn
+
+
+# a quiet week with two busy days
+PAGES_PER_DAY = {
+    "2023-08-08": 1, "2023-08-09": 12, "2023-08-10": 2, "2023-08-11": 1,
+    "2023-08-12": 10, "2023-08-13": 1, "2023-08-14": 1,
+}
+
+
+def _probe(search_url: str):
+    def probe(window: DateWindow) -> dict | None:
+        pages = fetch_pages(
+            job_id=1, query="Maui Wildfires", start_date=window.start.isoformat(), end_date=window.end.isoformat(),
+            scraper_api_key="test", page_delay=0, search_url=search_url,
+        )
+        try:
+            return next((data for _, data in pages), None)
+        finally:
+            pages.close()
+    return probe
+
+
+def test_dense_windows_are_split_until_they_fit() -> None:
+
+    with ScraperAPIStandIn(tweets_per_page=2, pages_per_day=PAGES_PER_DAY) as stand_in:
+        windows = plan_windows(1, "2023-08-08", "2023-08-15", _probe(stand_in.search_url), max_pages=4)
+
+    assert [(w.start.isoformat(), w.end.isoformat(), w.expected_pages) for w in windows] == [
+        ("2023-08-08", "2023-08-09", 1),
+        ("2023-08-09", "2023-08-10", 12),
+        ("2023-08-10", "2023-08-11", 2),
+        ("2023-08-11", "2023-08-12", 1),
+        ("2023-08-12", "2023-08-13", 10),
+        ("2023-08-13", "2023-08-15", 2),
+    ]
+    assert [w.index for w in windows] == list(range(6))
+
+
+def test_windows_without_reported_volume_are_split_into_days() -> None:
+
+    with ScraperAPIStandIn(tweets_per_page=2, pages_per_day=PAGES_PER_DAY, report_totals=False) as stand_in:
+        windows = plan_windows(1, "2023-08-08", "2023-08-15", _probe(stand_in.search_url), max_pages=4)
+
+    assert [w.days for w in windows] == [1] * 7
+    assert [(w.start, w.end) for w in windows] == [(w.start, w.end) for w in daily_windows("2023-08-08", "2023-08-15")]
+
+
+def test_windows_yield_every_page_once_and_reuse_the_probes() -> None:
+
+    with ScraperAPIStandIn(tweets_per_page=2, pages_per_day=PAGES_PER_DAY) as stand_in:
+        windows = plan_windows(1, "2023-08-08", "2023-08-15", _probe(stand_in.search_url), max_pages=4)
+        probes = len(stand_in.requests)
+        keys = [
+            key
+            for key, _ in fetch_windows(
+                1, windows, functools.partial(fetch_pages, search_url=stand_in.search_url, page_delay=0),
+                concurrency=3, query="Maui Wildfires", scraper_api_key="test",
+            )
+        ]
+
+    assert sorted(keys) == sorted(w.key(page) for w in windows for page in range(1, stand_in.pages_between(w.start.isoformat(), w.end.isoformat()) + 1))
+    # pages 2..n of each window and the empty page after them; page 1 was fetched by the probe
+    assert len(stand_in.requests) - probes == sum(PAGES_PER_DAY.values())
+
+
+def _scrape(tmp_path, kernel_planckster_stand_in: KernelPlancksterStandIn, **kwargs):
+    kernel_planckster = KernelPlancksterGateway(host=kernel_planckster_stand_in.host, port=kernel_planckster_stand_in.port, auth_token="test", scheme="http")
+    return app.scraper.scrape(
+        job_id=1,
+        tracer_id="tracer",
+        query="Maui Wildfires",
+        start_date="2023-08-08",
+        end_date="2023-08-15",
+        scraped_data_repository=ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3)),
+        work_dir=str(tmp_path / "work"),
+        log_level="WARNING",
+        scraper_api_key="test",
+        openai_api_key="test",
+        **kwargs,
+    )
+
+
+def test_partitioned_scrape_is_bounded_by_its_slowest_window(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+    timings = {}
+    outputs = {}
+
+    for partition in ("none", "daily", "adaptive"):
+        with KernelPlancksterStandIn() as kernel_planckster_stand_in, ScraperAPIStandIn(tweets_per_page=2, latency=0.06, pages_per_day=PAGES_PER_DAY) as scraper_api_stand_in:
+            monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+            start = time.perf_counter()
+            outputs[partition] = _scrape(tmp_path / partition, kernel_planckster_stand_in, partition=partition, partition_concurrency=8, partition_max_pages=4)
+            timings[partition] = time.perf_counter() - start
+            tweet_all = next(path for path in kernel_planckster_stand_in.uploads if "tweet_all_" in path)
+            assert len(json.loads(kernel_planckster_stand_in.uploads[tweet_all])) == sum(PAGES_PER_DAY.values()) * 2
+
+    print(", ".join(f"{partition}: {timing:.2f}s" for partition, timing in timings.items()))
+
+    assert all(output.job_state == BaseJobState.FINISHED for output in outputs.values())
+    # 28 pages in one chain, against the 12 pages of the busiest day, on top of about 0.5s for the rest of the job
+    assert timings["adaptive"] < timings["none"] / 1.5
+    assert timings["daily"] < timings["none"] / 1.5
+
+
+def test_resumed_partitioned_job_keeps_its_windows(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "checkpoints"), "tracer", 1)
+    windows = daily_windows("2023-08-08", "2023-08-15")
+    checkpoint.record_windows([window.model_dump(mode="json") for window in windows])
+    checkpoint.close()
+
+    with KernelPlancksterStandIn() as kernel_planckster_stand_in, ScraperAPIStandIn(tweets_per_page=2, pages_per_day=PAGES_PER_DAY) as scraper_api_stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+        output = _scrape(tmp_path, kernel_planckster_stand_in, partition="adaptive", checkpoint_dir=str(tmp_path / "checkpoints"))
+
+    assert output.job_state == BaseJobState.FINISHED
+    # the daily windows of the first run, not an adaptive plan, so no probes
+    assert len(scraper_api_stand_in.requests) == sum(PAGES_PER_DAY.values()) + 7
+    assert {source_data.name for source_data in output.source_data_list} >= {f"tweet_{window.key(1)}" for window in windows}
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from app.pipeline import Pipeline, PipelineStage
+
+
+def test_pipeline_runs_items_through_all_stages() -> None:
+
+    collected = []
+    lock = threading.Lock()
+
+    def collect(item: int) -> int:
+        with lock:
+            collected.append(item)
+        return item
+
+    pipeline = Pipeline(
+        job_id=1,
+        stages=[
+            PipelineStage("double", lambda item: item * 2, workers=3),
+            PipelineStage("drop_odd_halves", lambda item: item if item % 4 == 0 else None, workers=2),
+            PipelineStage("collect", collect),
+        ],
+    )
+    pipeline.run(range(10))
+
+    assert sorted(collected) == [0, 4, 8, 12, 16]
+    assert pipeline.processed == {"double": 10, "drop_odd_halves": 10, "collect": 5}
+
+
+def test_pipeline_records_stage_errors_and_keeps_going() -> None:
+
+    def fail_on_three(item: int) -> int:
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+
+    pipeline = Pipeline(job_id=1, stages=[PipelineStage("check", fail_on_three)])
+    pipeline.run(range(5))
+
+    assert pipeline.processed == {"check": 4}
+    assert len(pipeline.errors) == 1
+    assert "bad item" in pipeline.errors[0]
+
+
+def test_pipeline_backpressure_stops_the_source() -> None:
+
+    pulled = []
+    release = threading.Event()
+
+    def source():
+        for item in range(100):
+            pulled.append(item)
+            yield item
+
+    pipeline = Pipeline(
+        job_id=1,
+        stages=[PipelineStage("slow", lambda item: release.wait(), workers=1, queue_size=2)],
+    )
+    runner = threading.Thread(target=pipeline.run, args=(source(),))
+    runner.start()
+    time.sleep(0.2)
+
+    # one item held by the worker, two in the queue, one blocked on put
+    assert len(pulled) <= 4
+
+    release.set()
+    runner.join()
+    assert len(pulled) == 100
+
+
+def test_pipeline_stages_overlap() -> None:
+
+    def slow(item: int) -> int:
+        time.sleep(0.05)
+        return item
+
+    pipeline = Pipeline(
+        job_id=1,
+        stages=[PipelineStage("a", slow, workers=2), PipelineStage("b", slow, workers=2)],
+    )
+    start = time.perf_counter()
+    pipeline.run(range(8))
+    elapsed = time.perf_counter() - start
+
+    # serially this takes 16 * 0.05s
+    assert elapsed < 0.5
@@ -0,0 +1,155 @@
+import filecmp
+import os
+import threading
+import time
+
+import pytest
+
+import app.scraper
+from app.pipeline import Pipeline, PipelineStage, ScrapedPage
+from app.postprocess import PostProcessingPool, chunked
+from app.prefilter import KeywordPrefilter
+from app.scraper import augment_tweets, prepare_tweets
+from app.tweet_stream import TweetStreamWriter
+from tests.stand_ins import FakeInstructorClient, make_tweet, wildfire_responder
+
+
+SNIPPETS = [
+    "the wildfire near Lahaina keeps spreading, evacuations ordered, the blaze burns through the forest...",
+    "smoke over the hills this morning, hoping it is nothing...",
+    "nice sunset at the beach today, the surf was great...",
+]
+
+
+def _square(x: int) -> int:
+    return x * x
+
+
+# held by the test while the pool starts its workers, like a logging lock held by another thread of the job
+_held = threading.Lock()
+
+
+def _square_with_held_lock(x: int) -> int:
+    with _held:
+        return x * x
+
+
+def _corpus(pages: int, tweets_per_page: int) -> list[ScrapedPage]:
+    corpus = []
+    for page in range(1, pages + 1):
+        tweets = [make_tweet(page, i) for i in range(1, tweets_per_page + 1)]
+        for i, tweet in enumerate(tweets):
+            tweet["snippet"] = f"Page {page}, tweet {i}: {SNIPPETS[(page + i) % len(SNIPPETS)]}"
+        corpus.append(ScrapedPage(page=page, tweets=tweets))
+    return corpus
+
+
+def test_pool_maps_batches_in_order() -> None:
+
+    with PostProcessingPool(workers=2, max_pending=3) as pool:
+        assert list(pool.map(_square, range(50))) == [x * x for x in range(50)]
+        assert pool.run(_square, 7) == 49
+
+    assert list(PostProcessingPool().map(_square, range(5))) == [0, 1, 4, 9, 16]
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    with pytest.raises(ValueError):
+        PostProcessingPool(workers=-1)
+
+
+def test_workers_do_not_inherit_locks_held_when_they_start() -> None:
+
+    pool = PostProcessingPool(workers=1)
+    results: list[int] = []
+    thread = threading.Thread(target=lambda: results.append(pool.run(_square_with_held_lock, 3)), daemon=True)
+    with _held:
+        thread.start()
+        thread.join(timeout=60)
+
+    # a forked worker would wait forever for its copy of the held lock
+    assert results == [9]
+    pool.close()
+
+
+def test_augmenting_in_a_pool_matches_inline(monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "get_lat_long", lambda location, geocoder=None: (20.87, -156.67))
+    tweets = _corpus(1, 30)[0].tweets + [{"title": "incomplete"}]
+    inline_prefilter = KeywordPrefilter.for_topic("forest wildfire")
+    pooled_prefilter = KeywordPrefilter.for_topic("forest wildfire")
+
+    inline = augment_tweets(FakeInstructorClient(wildfire_responder), tweets, "forest wildfire", prefilter=inline_prefilter)
+    with PostProcessingPool(workers=2) as pool:
+        pooled = augment_tweets(FakeInstructorClient(wildfire_responder), tweets, "forest wildfire", prefilter=pooled_prefilter, pool=pool)
+
+    assert pooled == inline
+    assert len(inline) == 10
+    # the bands are counted in the job's process, not in the workers
+    assert pooled_prefilter.counts == inline_prefilter.counts == {"drop": 0, "llm": 20, "accept": 10}
+
+
+def test_stream_artifacts_are_the_same_with_a_pool(tmp_path) -> None:
+
+    pages = _corpus(5, 20)
+    for page in pages:
+        page.augmented = [[tweet["title"], tweet["snippet"], "Lahaina,USA", 20.87, -156.67, "August", "09", 2023, "Wildfire"] for tweet in page.tweets[::3]]
+
+    def write(directory: str, pool: PostProcessingPool | None) -> None:
+        stream = TweetStreamWriter(str(tmp_path / directory), "20230810_000000", pool=pool, chunk_size=7)
+        for page in pages:
+            stream.write_page(page)
+        assert stream.write_tweet_all(str(tmp_path / directory / "tweet_all.json")) == 100
+        assert stream.write_augmented_json(str(tmp_path / directory / "augmented.json")) == 35
+        stream.close()
+
+    write("inline", None)
+    with PostProcessingPool(workers=2) as pool:
+        write("pooled", pool)
+
+    for name in ("tweet_all.json", "augmented.json", "tweets_20230810_000000.ndjson", "augmented_20230810_000000.ndjson"):
+        assert filecmp.cmp(tmp_path / "inline" / name, tmp_path / "pooled" / name, shallow=False)
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCHMARKS"), reason="benchmark, set RUN_BENCHMARKS=1 to run it")
+def test_postprocessing_scales_with_cores(tmp_path) -> None:
+
+    # 100k tweets, the CPU-bound part of a job: formatting and scoring, serializing pages, writing the final artifacts
+    corpus = _corpus(1000, 100)
+    cores = os.cpu_count() or 1
+
+    def postprocess(workers: int) -> float:
+        prefilter = KeywordPrefilter.for_topic("forest wildfire")
+        with PostProcessingPool(workers=workers) as pool:
+            directory = tmp_path / f"workers_{workers}"
+            stream = TweetStreamWriter(str(directory), "20230810_000000", pool=pool)
+
+            def prepare(page: ScrapedPage) -> ScrapedPage:
+                fields = [(tweet["title"], tweet["snippet"]) for tweet in page.tweets]
+                _, scores = pool.run(prepare_tweets, fields, prefilter)
+                page = page.model_copy()
+                page.augmented = [
+                    [tweet["title"], tweet["snippet"], "Lahaina,USA", 20.87, -156.67, "August", "09", 2023, "Wildfire"]
+                    for tweet, score in zip(page.tweets, scores) if prefilter.band(score) != "drop"
+                ]
+                return page
+
+            def persist(page: ScrapedPage) -> ScrapedPage:
+                stream.write_page(page)
+                return page
+
+            threads = max(workers, 1)
+            pipeline = Pipeline(job_id=0, stages=[PipelineStage("prepare", prepare, workers=threads), PipelineStage("persist", persist, workers=threads)])
+            start = time.perf_counter()
+            pipeline.run(corpus)
+            assert stream.write_tweet_all(str(directory / "tweet_all.json")) == 100_000
+            assert stream.write_augmented_json(str(directory / "augmented.json")) == prefilter.counts["llm"] + prefilter.counts["accept"]
+            elapsed = time.perf_counter() - start
+            stream.close()
+        assert not pipeline.errors
+        return elapsed
+
+    worker_counts = sorted({0} | {2 ** k for k in range(cores.bit_length()) if 2 ** k <= cores})
+    elapsed = {workers: postprocess(workers) for workers in worker_counts}
+
+    # with a single core, worker processes can only add overhead, so there is no speedup to check
+    if cores >= 2:
+        assert min(elapsed[workers] for workers in worker_counts if workers >= 2) < elapsed[0] / 1.3
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+import app.scraper
+from app.prefilter import KeywordPrefilter
+from app.scraper import augment_tweets, batchFilterData, filterData
+from tests.stand_ins import FakeInstructorClient, make_tweet, wildfire_responder
+
+
+def test_prefilter_bands_and_counts() -> None:
+
+    prefilter = KeywordPrefilter.for_topic("forest wildfire")
+
+    assert prefilter.classify("User A tweets: Nice sunset at the beach today.") == "drop"
+    assert prefilter.classify("User A tweets: There is smoke over the hills.") == "llm"
+    assert prefilter.classify("User A tweets: Wildfire forces evacuations, firefighters battle the blaze.") == "accept"
+    assert prefilter.counts == {"drop": 1, "llm": 1, "accept": 1}
+
+
+def test_prefilter_matches_words_stems_and_phrases() -> None:
+
+    prefilter = KeywordPrefilter({"fire": 1.0, "evacuat*": 1.0, "red flag warning*": 2.0})
+
+    assert prefilter.score("Residents EVACUATED overnight") == 1.0
+    assert prefilter.score("A Red-Flag Warning is in effect") == 2.0
+    assert prefilter.score("Red flag warnings issued") == 2.0
+    assert prefilter.score("A red flag for the warning lights") == 0.0
+    assert prefilter.score("Fire!") == 1.0
+    assert prefilter.score("Nothing to see") == 0.0
+    with pytest.raises(ValueError):
+        KeywordPrefilter({"*": 1.0})
+
+
+def test_prefilter_does_not_match_words_that_only_start_like_a_keyword() -> None:
+
+    prefilter = KeywordPrefilter.for_topic("forest wildfire")
+
+    assert prefilter.score("Fireworks over the bay tonight") == 0.0
+    assert prefilter.score("He got fired from his job") == 0.0
+    assert prefilter.classify("User A tweets: Fireworks were fired off at the firehouse party.") == "drop"
+    # "firefighters" counts once, as a firefighter, and not as a fire too
+    assert prefilter.score("Firefighters arrived") == 2.0
+
+
+def test_prefilter_from_file(tmp_path) -> None:
+
+    config = tmp_path / "flood.json"
+    config.write_text(json.dumps({"keywords": {"flood*": 3.0}, "low": 1.0, "high": 3.0}))
+    prefilter = KeywordPrefilter.from_file(str(config))
+
+    assert prefilter.classify("Flooding downtown") == "accept"
+    with pytest.raises(ValueError):
+        KeywordPrefilter({"flood": 1.0}, low=5.0, high=1.0)
+
+
+def test_augment_tweets_sends_only_the_ambiguous_band_to_the_llm(monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "get_lat_long", lambda location, geocoder=None: (20.87, -156.67))
+    tweets = [make_tweet(1, i) for i in range(1, 4)]
+    tweets[0]["snippet"] = "Nice sunset at the beach today..."
+    tweets[0]["title"] = "Surfer (@surfer)"
+    tweets[1]["snippet"] = "Smoke over the hills this morning..."
+    tweets[1]["title"] = "Hiker (@hiker)"
+    client = FakeInstructorClient(wildfire_responder)
+
+    augmented = augment_tweets(client, tweets, "forest wildfire", prefilter=KeywordPrefilter.for_topic("forest wildfire"))
+
+    filter_prompts = [prompt for _, response_model, prompt in client.requests if response_model in (filterData, batchFilterData)]
+    assert len(filter_prompts) == 1
+    assert "Smoke over the hills" in filter_prompts[0]
+    assert "Nice sunset" not in filter_prompts[0]
+    assert [row[0] for row in augmented] == [tweets[2]["title"]]
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from app.fetcher import fetch_pages
+from app.quota import QuotaLimitedChatClient, QuotaManager, TokenBucket, UpstreamQuota
+from tests.stand_ins import ScraperAPIStandIn
+
+
+def test_token_bucket_spaces_reservations_by_its_rate() -> None:
+
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    delays = [bucket.reserve() for _ in range(5)]
+
+    assert delays[:2] == [0, 0]
+    assert delays[2:] == pytest.approx([0.1, 0.2, 0.3], abs=0.02)
+
+
+def test_jobs_sharing_a_quota_stay_within_it_together() -> None:
+
+    quota = UpstreamQuota("scraperapi", requests_per_second=50, burst=0)
+    pages: dict[int, list[int]] = {}
+
+    def job(job_id: int, search_url: str) -> None:
+        pages[job_id] = [
+            page
+            for page, _ in fetch_pages(
+                job_id=job_id,
+                query="Maui Wildfires",
+                start_date="2023-08-08",
+                end_date="2023-08-30",
+                scraper_api_key="test",
+                concurrency=4,
+                page_delay=0,
+                search_url=search_url,
+                quota=quota,
+            )
+        ]
+
+    with ScraperAPIStandIn(pages=12, tweets_per_page=1) as stand_in:
+        jobs = [threading.Thread(target=job, args=(job_id, stand_in.search_url)) for job_id in range(3)]
+        start = time.perf_counter()
+        for thread in jobs:
+            thread.start()
+        for thread in jobs:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        served = len(stand_in.requests)
+
+    stats = quota.stats()
+    print(f"{served} requests in {elapsed:.2f}s ({served / elapsed:.1f}/s, quota 50/s), mean wait {stats.mean_wait * 1000:.0f}ms")
+
+    assert all(job_pages == list(range(1, 13)) for job_pages in pages.values())
+    # requests for pages after the last one may still be waiting for the quota
+    assert stats.requests >= served >= 3 * 13
+    # the first request is free, the others are spaced at the quota
+    assert (served - 1) / 50 <= elapsed + 0.01
+    assert served / elapsed > 50 * 0.7
+    assert stats.waited > 0 and stats.max_wait >= stats.mean_wait > 0
+
+
+def test_rate_limited_responses_pause_the_quota_for_everyone() -> None:
+
+    quota = UpstreamQuota("scraperapi", requests_per_second=100)
+
+    with ScraperAPIStandIn(pages=1, script=[(429, 1)]) as stand_in:
+        def get() -> dict:
+            response = requests.get(stand_in.search_url)
+            response.raise_for_status()
+            return response.json()
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            quota.call(get)
+        waited = quota.acquire()
+
+    assert waited == pytest.approx(1, abs=0.1)
+    assert quota.stats().rate_limited == 1
+
+
+def test_quotas_are_read_from_the_environment(monkeypatch) -> None:
+
+    monkeypatch.setenv("SCRAPERAPI_REQUESTS_PER_SECOND", "5")
+    monkeypatch.setenv("OPENAI_TOKENS_PER_MINUTE", "60000")
+    monkeypatch.delenv("OPENAI_REQUESTS_PER_SECOND", raising=False)
+    monkeypatch.delenv("NOMINATIM_REQUESTS_PER_SECOND", raising=False)
+
+    stats = {quota.upstream: quota for quota in QuotaManager.from_env().stats()}
+
+    assert stats["scraperapi"].requests_per_second == 5
+    assert stats["openai"].requests_per_second is None
+    assert stats["openai"].tokens_per_minute == 60000
+    assert stats["nominatim"].requests_per_second == 1
+
+    monkeypatch.setenv("SCRAPERAPI_REQUESTS_PER_SECOND", "fast")
+    with pytest.raises(ValueError):
+        QuotaManager.from_env()
+
+
+@pytest.mark.parametrize("name", ["QUOTA_BURST_SECONDS", "NOMINATIM_REQUESTS_PER_SECOND", "OPENAI_TOKENS_PER_MINUTE"])
+@pytest.mark.parametrize("value", ["0", "-1"])
+def test_quotas_from_the_environment_must_be_positive(monkeypatch, name: str, value: str) -> None:
+
+    monkeypatch.setenv(name, value)
+    with pytest.raises(ValueError, match=name):
+        QuotaManager.from_env()
+
+
+def test_chat_completions_draw_tokens_from_the_quota() -> None:
+
+    class Client:
+        def __init__(self) -> None:
+            self.chat = self
+            self.completions = self
+
+        def create(self, **kwargs):
+            return "done"
+
+    # 12000 tokens per minute, 200 per second and a burst of as many
+    quota = UpstreamQuota("openai", tokens_per_minute=12000)
+    client = QuotaLimitedChatClient(Client(), quota)
+    messages = [{"role": "user", "content": "x" * 400}]
+
+    # each completion is estimated at 100 prompt and 100 completion tokens
+    assert client.chat.completions.create(model="gpt-4", messages=messages, max_tokens=100) == "done"
+    start = time.perf_counter()
+    client.chat.completions.create(model="gpt-4", messages=messages, max_tokens=100)
+
+    assert time.perf_counter() - start == pytest.approx(1, abs=0.1)
+    assert quota.stats().waited == 1
@@ -0,0 +1,212 @@
+import functools
+
+import pytest
+import requests
+
+import app.scraper
+from app.fetcher import fetch_page, fetch_pages
+from app.retry import RetryBudget, RetryBudgetExhausted, RetryingChatClient, RetryPolicy
+from app.sdk.file_repository import FileRepository
+from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
+from app.sdk.models import BaseJobState, ProtocolEnum
+from app.sdk.scraped_data_repository import ScrapedDataRepository
+from tests.stand_ins import KernelPlancksterStandIn, ScraperAPIStandIn
+
+
+FAST = RetryPolicy(base_delay=0, max_delay=0, max_retry_after=0.05)
+
+
+def _fetch(search_url: str, retry_policy: RetryPolicy = FAST, retry_budget: RetryBudget | None = None) -> dict:
+    return fetch_page(
+        job_id=1,
+        page=1,
+        query="Maui Wildfires",
+        start_date="2023-08-08",
+        end_date="2023-08-30",
+        scraper_api_key="test",
+        page_delay=0,
+        search_url=search_url,
+        retry_policy=retry_policy,
+        retry_budget=retry_budget,
+    )
+
+
+def test_fetch_page_recovers_from_rate_limits_and_server_errors() -> None:
+
+    with ScraperAPIStandIn(pages=1, tweets_per_page=2, script=[(429, 0), 500, 503]) as stand_in:
+        data = _fetch(stand_in.search_url)
+
+    assert len(data["organic_results"]) == 2
+    assert len(stand_in.requests) == 4
+
+
+def test_fatal_statuses_are_not_retried() -> None:
+
+    with ScraperAPIStandIn(pages=1, script=[401]) as stand_in:
+        with pytest.raises(requests.exceptions.HTTPError):
+            _fetch(stand_in.search_url)
+
+    assert len(stand_in.requests) == 1
+
+
+def test_policy_gives_up_after_max_attempts() -> None:
+
+    with ScraperAPIStandIn(pages=1, script=[500] * 5) as stand_in:
+        with pytest.raises(requests.exceptions.HTTPError):
+            _fetch(stand_in.search_url, retry_policy=FAST.model_copy(update={"max_attempts": 3}))
+
+    assert len(stand_in.requests) == 3
+
+
+def test_retry_after_is_honoured_up_to_its_cap() -> None:
+
+    sleeps: list[float] = []
+    policy = RetryPolicy(base_delay=0, max_retry_after=10)
+
+    with ScraperAPIStandIn(pages=1, script=[(429, 3), (429, 120)]) as stand_in:
+        search = functools.partial(requests.get, stand_in.search_url)
+
+        def request() -> dict:
+            response = search()
+            response.raise_for_status()
+            return response.json()
+
+        policy.call(request, sleep=sleeps.append)
+
+    assert sleeps == [3, 10]
+
+
+def test_retry_budget_is_shared_by_the_requests_of_a_job() -> None:
+
+    budget = RetryBudget(3)
+
+    with ScraperAPIStandIn(pages=1, script=[500, 500, 500]) as stand_in:
+        _fetch(stand_in.search_url, retry_budget=budget)
+        assert budget.remaining == 0
+        stand_in.script.append(500)
+        with pytest.raises(RetryBudgetExhausted):
+            _fetch(stand_in.search_url, retry_budget=budget)
+
+
+def test_exhausted_retry_budget_fails_the_job(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+
+    with KernelPlancksterStandIn() as kernel_planckster_stand_in, ScraperAPIStandIn(pages=3, script=[500] * 20) as scraper_api_stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+        kernel_planckster = KernelPlancksterGateway(host=kernel_planckster_stand_in.host, port=kernel_planckster_stand_in.port, auth_token="test", scheme="http")
+        output = app.scraper.scrape(
+            job_id=1,
+            tracer_id="tracer",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3)),
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+            retry_policy=FAST,
+            retry_budget=4,
+        )
+
+    assert output.job_state == BaseJobState.FAILED
+    assert "Retry budget used up" in output.errors[-1]
+    # the first request and one per retry of the budget, then the job stops fetching
+    assert len(scraper_api_stand_in.requests) == 5
+
+
+def test_retry_budget_exhausted_by_the_llm_stops_fetching(tmp_path, monkeypatch) -> None:
+
+    class RateLimitedClient:
+        def __init__(self) -> None:
+            self.chat = self
+            self.completions = self
+
+        def create(self, **kwargs):
+            raise _StatusError(429)
+
+    monkeypatch.setattr(app.scraper.instructor, "from_openai", lambda openai_client: RateLimitedClient())
+
+    with KernelPlancksterStandIn() as kernel_planckster_stand_in, ScraperAPIStandIn(pages=40, tweets_per_page=2) as scraper_api_stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+        kernel_planckster = KernelPlancksterGateway(host=kernel_planckster_stand_in.host, port=kernel_planckster_stand_in.port, auth_token="test", scheme="http")
+        output = app.scraper.scrape(
+            job_id=1,
+            tracer_id="tracer",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3)),
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+            geocoder=None,
+            retry_policy=FAST,
+            retry_budget=2,
+        )
+
+    assert output.job_state == BaseJobState.FAILED
+    assert "Retry budget used up" in output.errors[-1]
+    # the pages fetched ahead of the first augmentation, not all 40
+    assert len(scraper_api_stand_in.requests) < 20
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_chat_client_retries_completions() -> None:
+
+    outcomes = [_StatusError(429), _StatusError(500), "done"]
+    calls: list[dict] = []
+
+    class Completions:
+        def create(self, **kwargs):
+            calls.append(kwargs)
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+    class Client:
+        def __init__(self) -> None:
+            self.chat = self
+            self.completions = Completions()
+
+    client = RetryingChatClient(Client(), FAST, RetryBudget(5))
+
+    assert client.chat.completions.create(model="gpt-4", messages=[]) == "done"
+    assert len(calls) == 3
+
+    outcomes.append(_StatusError(400))
+    with pytest.raises(_StatusError):
+        client.chat.completions.create(model="gpt-4", messages=[])
+    assert len(calls) == 4
+
+
+def test_exhausted_retry_budget_during_extraction_is_not_swallowed() -> None:
+
+    calls: list[object] = []
+
+    class Client:
+        def __init__(self) -> None:
+            self.chat = self
+            self.completions = self
+
+        def create(self, response_model, **kwargs):
+            calls.append(response_model)
+            if response_model is app.scraper.batchFilterData:
+                return app.scraper.batchFilterData(relevant=[True])
+            raise _StatusError(429)
+
+    client = RetryingChatClient(Client(), FAST, RetryBudget(1))
+    tweet = {"title": "Wildfire", "snippet": "the wildfire near Lahaina...", "link": "https://x.com/1", "position": 1, "source": "X", "displayed_link": "x.com"}
+
+    with pytest.raises(RetryBudgetExhausted):
+        app.scraper.augment_tweets(client, [tweet], "forest wildfire")
+    # the relevance filter, then the extraction and its one retry
+    assert calls == [app.scraper.batchFilterData, app.scraper.messageData, app.scraper.messageData]
@@ -0,0 +1,175 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import app.scraper
+from app.fetcher import fetch_pages
+from app.sdk.file_repository import FileRepository
+from app.sdk.kernel_plackster_gateway import AsyncKernelPlancksterGateway, KernelPlancksterGateway
+from app.sdk.models import BaseJobState, CompressionEnum, KernelPlancksterSourceData, ProtocolEnum
+from app.sdk.scraped_data_repository import AsyncScrapedDataRepository, ScrapedDataRepository
+from tests.stand_ins import KernelPlancksterStandIn, ScraperAPIStandIn
+
+
+def _artifacts(tmp_path, count: int) -> list[tuple[KernelPlancksterSourceData, str]]:
+    artifacts = []
+    for index in range(count):
+        local_file = tmp_path / f"tweet_{index}.json"
+        local_file.write_text(f'[{{"tweet": {index}}}]')
+        source_data = KernelPlancksterSourceData(name=f"tweet_{index}", protocol=ProtocolEnum.S3, relative_path=f"twitter/tweet_{index}.json")
+        artifacts.append((source_data, str(local_file)))
+    return artifacts
+
+
+async def _register_concurrently(stand_in: KernelPlancksterStandIn, artifacts: list[tuple[KernelPlancksterSourceData, str]]) -> None:
+    kernel_planckster = AsyncKernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http", max_connections=20)
+    async with kernel_planckster, AsyncScrapedDataRepository(
+        protocol=ProtocolEnum.S3,
+        kernel_planckster=kernel_planckster,
+        file_repository=FileRepository(ProtocolEnum.S3),
+    ) as scraped_data_repository:
+        await asyncio.gather(*(
+            scraped_data_repository.register_scraped_json(source_data, job_id=1, local_file_name=local_file)
+            for source_data, local_file in artifacts
+        ))
+
+
+def test_async_repository_uploads_and_registers_every_artifact(tmp_path) -> None:
+
+    artifacts = _artifacts(tmp_path, 5)
+
+    with KernelPlancksterStandIn() as stand_in:
+        asyncio.run(_register_concurrently(stand_in, artifacts))
+
+    assert stand_in.uploads == {source_data.relative_path: open(local_file, "rb").read() for source_data, local_file in artifacts}
+    assert stand_in.requests.count("/client/1/source") == 5
+
+
+def test_async_registration_overlaps_requests(tmp_path) -> None:
+
+    artifacts = _artifacts(tmp_path, 20)
+
+    with KernelPlancksterStandIn(latency=0.02) as stand_in:
+        with KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http") as kernel_planckster:
+            scraped_data_repository = ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3))
+            start = time.perf_counter()
+            for source_data, local_file in artifacts:
+                scraped_data_repository.register_scraped_json(source_data, job_id=1, local_file_name=local_file)
+            sync_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        asyncio.run(_register_concurrently(stand_in, artifacts))
+        async_time = time.perf_counter() - start
+
+    print(f"20 registrations: sync {sync_time:.3f}s, async {async_time:.3f}s")
+
+    assert async_time < sync_time / 2
+
+
+def test_upload_queue_returns_futures_and_retries(tmp_path) -> None:
+
+    artifacts = _artifacts(tmp_path, 8)
+
+    # uploads wait until released, so the futures can only have been returned before they completed
+    release = threading.Event()
+    file_repository = FileRepository(ProtocolEnum.S3)
+    upload = file_repository.public_upload
+
+    def blocked_upload(*args, **kwargs):
+        release.wait(timeout=30)
+        return upload(*args, **kwargs)
+
+    file_repository.public_upload = blocked_upload
+
+    with KernelPlancksterStandIn(failing_uploads=3) as stand_in:
+        with KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http") as kernel_planckster:
+            scraped_data_repository = ScrapedDataRepository(
+                ProtocolEnum.S3, kernel_planckster, file_repository, upload_workers=4, retry_delay=0,
+            )
+            futures = [scraped_data_repository.register_scraped_json(source_data, 1, local_file) for source_data, local_file in artifacts]
+
+            assert all(isinstance(future, Future) for future in futures)
+            assert not any(future.done() for future in futures)
+            assert stand_in.uploads == {}
+            release.set()
+            assert scraped_data_repository.flush() == []
+            scraped_data_repository.close()
+
+    assert all(future.done() for future in futures)
+    assert set(stand_in.uploads) == {source_data.relative_path for source_data, _ in artifacts}
+
+
+def test_failed_uploads_are_reported_in_the_job_output(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+
+    with KernelPlancksterStandIn(failing_uploads=1000) as kernel_planckster_stand_in, ScraperAPIStandIn(pages=3, tweets_per_page=2) as scraper_api_stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+        kernel_planckster = KernelPlancksterGateway(host=kernel_planckster_stand_in.host, port=kernel_planckster_stand_in.port, auth_token="test", scheme="http")
+        output = app.scraper.scrape(
+            job_id=1,
+            tracer_id="tracer",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=ScrapedDataRepository(
+                ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3), upload_workers=2, upload_retries=1, retry_delay=0,
+            ),
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+        )
+
+    assert output.job_state == BaseJobState.FINISHED
+    # 3 pages, tweet_all and the augmented json, each tried twice
+    assert len(output.errors) == 5
+    assert kernel_planckster_stand_in.requests.count("/client/1/upload-credentials") == 10
+    assert not os.path.exists(tmp_path / "work")
+
+
+def test_large_files_are_registered_by_their_manifest(tmp_path) -> None:
+
+    (source_data, local_file), = _artifacts(tmp_path, 1)
+    with open(local_file, "w") as f:
+        f.write("[" + ", ".join(f'{{"tweet": {index}}}' for index in range(2000)) + "]")
+
+    with KernelPlancksterStandIn() as stand_in:
+        with KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http") as kernel_planckster:
+            scraped_data_repository = ScrapedDataRepository(
+                ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3, chunked_upload_threshold=8 * 1024, part_size=4 * 1024),
+            )
+            scraped_data_repository.register_scraped_json(source_data, job_id=1, local_file_name=local_file)
+
+    assert source_data.relative_path == "twitter/tweet_0.json.manifest.json"
+    assert source_data.relative_path in stand_in.uploads
+    assert len([path for path in stand_in.uploads if ".part-" in path]) == -(-os.path.getsize(local_file) // (4 * 1024))
+
+
+def test_a_failed_registration_is_retried_with_the_same_paths(tmp_path) -> None:
+
+    (source_data, local_file), = _artifacts(tmp_path, 1)
+    with open(local_file, "w") as f:
+        f.write("[" + ", ".join(f'{{"tweet": {index}, "text": "{os.urandom(8).hex()}"}}' for index in range(200)) + "]")
+
+    with KernelPlancksterStandIn(failing_registrations=1) as stand_in:
+        with KernelPlancksterGateway(host=stand_in.host, port=stand_in.port, auth_token="test", scheme="http") as kernel_planckster:
+            scraped_data_repository = ScrapedDataRepository(
+                ProtocolEnum.S3,
+                kernel_planckster,
+                FileRepository(ProtocolEnum.S3, compression=CompressionEnum.GZIP, chunked_upload_threshold=1024, part_size=1024),
+                upload_workers=1,
+                retry_delay=0,
+            )
+            future = scraped_data_repository.register_scraped_json(source_data, 1, local_file)
+            assert scraped_data_repository.flush() == []
+            scraped_data_repository.close()
+
+    assert future.result() is source_data
+    assert source_data.relative_path == "twitter/tweet_0.json.gz.manifest.json"
+    assert stand_in.registered == ["twitter/tweet_0.json.gz.manifest.json"]
+    assert all(path.startswith("twitter/tweet_0.json.gz.") for path in stand_in.uploads)
+    assert not any(".manifest.json.gz" in path for path in stand_in.uploads)
@@ -1,5 +1,8 @@
 import uuid
+import app.scraper
 import twitter_api_scraper
+from app.scraper import augment_tweets, batchFilterData, filterData
+from tests.stand_ins import FakeInstructorClient, make_tweet, wildfire_responder
 
 
 
@@ -12,4 +15,40 @@ def test_main_scraping(
         query="narendra modi",
         tracer_id=f"test-{uuid.uuid4()}",
         log_level="INFO",
-    )
\ No newline at end of file
+    )
+
+def _tweets(count: int) -> list[dict]:
+    tweets = [make_tweet(1, i) for i in range(1, count + 1)]
+    for tweet in tweets[::2]:
+        tweet["snippet"] = "Nice sunset at the beach today..."
+    return tweets
+
+
+def test_augment_tweets_batches_relevance_requests(monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper, "get_lat_long", lambda location, geocoder=None: (20.87, -156.67))
+    client = FakeInstructorClient(wildfire_responder)
+
+    augmented = augment_tweets(client, _tweets(20), "forest wildfire", batch_size=20)
+
+    filter_requests = [request for request in client.requests if request[1] in (filterData, batchFilterData)]
+    assert len(filter_requests) == 1
+    assert len(augmented) == 10
+    assert augmented[0] == ["Maui Fire Watch (@mauifire1_2)", _tweets(20)[1]["snippet"], "Lahaina,USA", 20.87, -156.67, "August", "09", 2023, "Wildfire"]
+
+
+def test_augment_tweets_falls_back_to_single_requests(monkeypatch) -> None:
+
+    def short_batch_responder(response_model, prompt):
+        if response_model is batchFilterData:
+            return batchFilterData(relevant=[True])
+        return wildfire_responder(response_model, prompt)
+
+    monkeypatch.setattr(app.scraper, "get_lat_long", lambda location, geocoder=None: None)
+    client = FakeInstructorClient(short_batch_responder)
+
+    augmented = augment_tweets(client, _tweets(6), "forest wildfire", batch_size=20)
+
+    assert [request[1] for request in client.requests].count(filterData) == 6
+    assert len(augmented) == 3
+    assert augmented[0][3:5] == ["no latitude", "no longitude"]
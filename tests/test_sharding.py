@@ -0,0 +1,120 @@
+import functools
+import json
+import os
+
+import pytest
+
+import app.scraper
+from app.checkpoint import ScrapeCheckpoint
+from app.fetcher import fetch_pages
+from app.partitioning import WINDOW_PAGE_STRIDE
+from app.pipeline import ScrapedPage
+from app.sdk.file_repository import FileRepository
+from app.sdk.models import BaseJobState, KernelPlancksterSourceData, ProtocolEnum
+from app.sdk.scraped_data_repository import ScrapedDataRepository
+from app.sharding import ShardBuffer, save_shard
+from tests.stand_ins import ScraperAPIStandIn, make_tweet
+
+
+def _page(page: int, tweets: int = 10) -> ScrapedPage:
+    return ScrapedPage(page=page, tweets=[make_tweet(page, i) for i in range(1, tweets + 1)])
+
+
+def test_shard_buffer_ranges_and_names(tmp_path) -> None:
+
+    buffer = ShardBuffer(pages_per_shard=4)
+    # pages complete out of order, but every shard holds the pages of one fixed range
+    shards = [buffer.add(_page(page)) for page in (2, 5, 1, 4, 6, 3)]
+    assert [shard.name if shard else None for shard in shards] == [None, None, None, None, None, "pages_00001-00004"]
+    assert [page.page for page in shards[-1].pages] == [1, 2, 3, 4]
+    assert [shard.name for shard in buffer.drain()] == ["pages_00005-00006"]
+    assert buffer.drain() == []
+
+    # the pages of a partitioned job are keyed by window
+    partitioned = ShardBuffer(pages_per_shard=2)
+    assert partitioned.add(_page(3 * WINDOW_PAGE_STRIDE + 2)) is None
+    assert partitioned.add(_page(1)) is None
+    assert partitioned.add(_page(3 * WINDOW_PAGE_STRIDE + 1)).name == "window_00003_pages_00001-00002"
+    assert [shard.name for shard in partitioned.drain()] == ["pages_00001-00001"]
+
+    # pages completed by an earlier run count towards their range
+    resumed = ShardBuffer(pages_per_shard=4, done=[5, 6])
+    assert resumed.add(_page(8)) is None
+    shard = resumed.add(_page(7))
+    assert shard.name == "pages_00007-00008"
+
+    save_shard(shard, str(tmp_path / "shard.json"))
+    with open(tmp_path / "shard.json") as f:
+        records = json.load(f)
+    assert len(records) == 20
+    assert records[0] == {"page": 7, "tweet": make_tweet(7, 1), "tweet_number": 1}
+
+    # as do pages that have nothing to add
+    assert resumed.add(_page(1)) is None
+    assert resumed.skip(3) is None
+    assert resumed.skip(4) is None
+    assert [page.page for page in resumed.skip(2).pages] == [1]
+    assert resumed.drain() == []
+
+    with pytest.raises(ValueError):
+        ShardBuffer(pages_per_shard=0)
+
+
+def _scrape(tmp_path, monkeypatch, pages: int, checkpoint_dir: str | None = None):
+    monkeypatch.setattr(app.scraper, "augment_tweets", lambda client, tweets, filter, **kwargs: [])
+    repository = ScrapedDataRepository(
+        protocol=ProtocolEnum.LOCAL,
+        kernel_planckster=None,
+        file_repository=FileRepository(ProtocolEnum.LOCAL, data_dir=str(tmp_path / "data")),
+    )
+    with ScraperAPIStandIn(pages=pages, tweets_per_page=10) as stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=stand_in.search_url, page_delay=0))
+        return app.scraper.scrape(
+            job_id=1,
+            tracer_id="tracer",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=repository,
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+            checkpoint_dir=checkpoint_dir,
+            shard_pages=4,
+        )
+
+
+def test_scrape_rolls_pages_up_into_shards(tmp_path, monkeypatch) -> None:
+
+    output = _scrape(tmp_path, monkeypatch, pages=10)
+
+    assert output.job_state == BaseJobState.FINISHED
+    names = [source_data.name for source_data in output.source_data_list]
+    assert names == ["tweet_pages_00001-00004", "tweet_pages_00005-00008", "tweet_pages_00009-00010", "tweet_shards"]
+
+    scraped = tmp_path / "data" / "twitter" / "tracer" / "1" / "scraped"
+    with open(scraped / os.path.basename(output.source_data_list[-1].relative_path)) as f:
+        manifest = json.load(f)
+    assert [shard["pages"] for shard in manifest["shards"]] == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]]
+    assert manifest["pages"]["6"] == output.source_data_list[1].relative_path
+    with open(scraped / os.path.basename(output.source_data_list[2].relative_path)) as f:
+        assert [record["page"] for record in json.load(f)] == [9] * 10 + [10] * 10
+
+
+def test_resumed_sharded_job_keeps_the_shards_of_the_earlier_run(tmp_path, monkeypatch) -> None:
+
+    checkpoint = ScrapeCheckpoint(str(tmp_path / "checkpoints"), "tracer", 1)
+    source_data = KernelPlancksterSourceData(
+        name="tweet_pages_00001-00004",
+        protocol=ProtocolEnum.LOCAL,
+        relative_path=f"twitter/tracer/1/scraped/tweet_{checkpoint.timestamp}_pages_00001-00004.json",
+    )
+    for page in (1, 2, 3, 4):
+        checkpoint.record(_page(page).model_copy(update={"source_data": source_data}))
+    checkpoint.close()
+
+    output = _scrape(tmp_path, monkeypatch, pages=7, checkpoint_dir=str(tmp_path / "checkpoints"))
+
+    names = [source_data.name for source_data in output.source_data_list]
+    assert names == ["tweet_pages_00001-00004", "tweet_pages_00005-00007", "tweet_shards"]
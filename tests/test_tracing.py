@@ -0,0 +1,147 @@
+import functools
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import app.scraper
+from app.fetcher import fetch_pages
+from app.sdk.file_repository import FileRepository
+from app.sdk.kernel_plackster_gateway import KernelPlancksterGateway
+from app.sdk.models import BaseJobState, ProtocolEnum
+from app.sdk.scraped_data_repository import ScrapedDataRepository
+from app.tracing import JsonlSpanExporter, OtlpSpanExporter, Span, Tracer, otlp_trace_id, span_exporter_from_env
+from app.utils import safe_file_name
+from tests.stand_ins import FakeInstructorClient, KernelPlancksterStandIn, OTLPCollectorStandIn, ScraperAPIStandIn, wildfire_responder
+
+
+class _SlowOnceGeocoder:
+    """
+    Takes `delay` seconds for its first lookup, like a Nominatim request stuck behind a slow connection.
+    """
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def geocode(self, location_name: str):
+        with self.lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            time.sleep(self.delay)
+        return (20.87, -156.67)
+
+
+def test_a_slow_lookup_is_found_on_the_critical_path_of_a_job(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.setattr(app.scraper.instructor, "from_openai", lambda openai_client: FakeInstructorClient(wildfire_responder))
+    exporter = JsonlSpanExporter(str(tmp_path / "traces"))
+
+    with KernelPlancksterStandIn() as kernel_planckster_stand_in, ScraperAPIStandIn(pages=4, tweets_per_page=3) as scraper_api_stand_in:
+        monkeypatch.setattr(app.scraper, "fetch_pages", functools.partial(fetch_pages, search_url=scraper_api_stand_in.search_url, page_delay=0))
+        kernel_planckster = KernelPlancksterGateway(host=kernel_planckster_stand_in.host, port=kernel_planckster_stand_in.port, auth_token="test", scheme="http")
+        output = app.scraper.scrape(
+            job_id=1,
+            tracer_id="tracer-slow-geocode",
+            query="Maui Wildfires",
+            start_date="2023-08-08",
+            end_date="2023-08-30",
+            scraped_data_repository=ScrapedDataRepository(ProtocolEnum.S3, kernel_planckster, FileRepository(ProtocolEnum.S3)),
+            work_dir=str(tmp_path / "work"),
+            log_level="WARNING",
+            scraper_api_key="test",
+            openai_api_key="test",
+            geocoder=_SlowOnceGeocoder(delay=0.3),
+            tracer=Tracer("tracer-slow-geocode", exporter),
+        )
+
+    assert output.job_state == BaseJobState.FINISHED
+    with open(exporter.path("tracer-slow-geocode")) as f:
+        spans = [Span.model_validate(json.loads(line)) for line in f]
+    by_id = {span.span_id: span for span in spans}
+
+    roots = [span for span in spans if span.parent_id is None]
+    assert [root.name for root in roots] == ["scrape"]
+    assert all(span.parent_id in by_id for span in spans if span.parent_id is not None)
+    assert all(span.duration is not None and span.trace_id == "tracer-slow-geocode" for span in spans)
+
+    def children(parent: Span, name: str) -> list[Span]:
+        return [span for span in spans if span.parent_id == parent.span_id and span.name == name]
+
+    root = roots[0]
+    assert len(children(root, "fetch")) == 5
+    assert len(children(root, "page")) == len(children(root, "persist")) == 4
+    # 4 pages, tweet_all and the augmented JSON
+    assert len(children(root, "register")) == 6
+    for page in children(root, "page"):
+        assert page.attributes["relevant"] == 3
+        assert len(children(page, "filter")) == 1
+        assert len(children(children(page, "filter")[0], "llm")) == 1
+        for augmentation in children(page, "augment_tweet"):
+            assert [span.name for span in spans if span.parent_id == augmentation.span_id] == ["llm", "geocode"]
+
+    # follow the slowest child from the root down to the stalled lookup
+    slowest_page = max(children(root, "page"), key=lambda span: span.duration)
+    slowest_tweet = max(children(slowest_page, "augment_tweet"), key=lambda span: span.duration)
+    geocode = children(slowest_tweet, "geocode")[0]
+    assert geocode.duration >= 0.3
+    assert geocode.attributes == {"location": "Lahaina,USA", "found": True}
+    assert geocode.duration > slowest_page.duration * 0.8
+
+
+def test_spans_are_sent_to_an_otlp_collector() -> None:
+
+    with OTLPCollectorStandIn() as collector:
+        tracer = Tracer("tracer-otlp", OtlpSpanExporter(collector.url, headers={"authorization": "Bearer test"}), batch_size=2)
+        root = tracer.start_span("scrape", job_id=3)
+        with tracer.span("page", page=1):
+            with pytest.raises(RuntimeError):
+                with tracer.span("geocode", location="Lahaina,USA"):
+                    raise RuntimeError("Nominatim is down")
+        tracer.end_span(root)
+        tracer.flush()
+
+    assert collector.requests == ["/v1/traces", "/v1/traces"]
+    assert collector.headers[0]["authorization"] == "Bearer test"
+    spans = {span["name"]: span for span in collector.spans}
+    assert set(spans) == {"scrape", "page", "geocode"}
+    assert {span["traceId"] for span in spans.values()} == {otlp_trace_id("tracer-otlp")}
+    assert "parentSpanId" not in spans["scrape"]
+    assert spans["page"]["parentSpanId"] == spans["scrape"]["spanId"]
+    assert spans["geocode"]["parentSpanId"] == spans["page"]["spanId"]
+    assert spans["geocode"]["status"] == {"code": 2, "message": "Nominatim is down"}
+    assert spans["page"]["status"] == {"code": 1}
+    assert {"key": "page", "value": {"intValue": "1"}} in spans["page"]["attributes"]
+    assert {"key": "tracer_id", "value": {"stringValue": "tracer-otlp"}} in spans["page"]["attributes"]
+    assert int(spans["scrape"]["endTimeUnixNano"]) >= int(spans["page"]["endTimeUnixNano"]) > int(spans["page"]["startTimeUnixNano"])
+
+
+def test_the_exporter_is_chosen_from_the_environment(tmp_path, monkeypatch) -> None:
+
+    monkeypatch.delenv("OTEL_EXPORTER_OTLP_ENDPOINT", raising=False)
+    monkeypatch.setenv("TRACE_DIR", str(tmp_path / "traces"))
+    exporter = span_exporter_from_env()
+    assert isinstance(exporter, JsonlSpanExporter)
+    assert exporter.path("tracer") == str(tmp_path / "traces" / "tracer.jsonl")
+
+    monkeypatch.setenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://collector:4318")
+    assert isinstance(span_exporter_from_env(), OtlpSpanExporter)
+
+
+def test_trace_files_stay_in_the_trace_directory(tmp_path) -> None:
+
+    exporter = JsonlSpanExporter(str(tmp_path / "traces"))
+    tracer = Tracer("../../x", exporter)
+    tracer.end_span(tracer.start_span("scrape"))
+    tracer.flush()
+
+    assert os.path.dirname(exporter.path("../../x")) == str(tmp_path / "traces")
+    assert os.listdir(tmp_path) == ["traces"]
+    assert len(os.listdir(tmp_path / "traces")) == 1
+    assert safe_file_name("tracer-1_a.b") == "tracer-1_a.b"
+    assert safe_file_name("a/b") != safe_file_name("a_b")
+    assert "/" not in safe_file_name("../../x") and not safe_file_name("..").startswith(".")
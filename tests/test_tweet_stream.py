@@ -0,0 +1,108 @@
+import json
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from app.pipeline import ScrapedPage
+from app.scraper import save_tweets
+from app.tweet_stream import AUGMENTED_COLUMNS, AugmentedParquetWriter, TweetStreamWriter
+from tests.stand_ins import make_tweet
+
+
+def _page(page: int, tweets: int = 20) -> ScrapedPage:
+    return ScrapedPage(
+        page=page,
+        tweets=[make_tweet(page, i) for i in range(1, tweets + 1)],
+        augmented=[
+            [f"title {page}-{i}", "tweet", "Lahaina,USA", 20.87, -156.67, "August", "09", 2023, "Wildfire"]
+            for i in range(1, tweets // 2 + 1)
+        ] + [["title", "tweet", "Atlantis,Nowhere", "no latitude", "no longitude", "August", "10", 2023, "Other"]],
+    )
+
+
+def test_final_artifacts_match_the_in_memory_formats(tmp_path) -> None:
+
+    pages = [_page(1), _page(2), _page(3, tweets=0)]
+    stream = TweetStreamWriter(str(tmp_path / "stream"), "20230810_000000")
+    for page in pages:
+        stream.write_page(page)
+
+    assert stream.write_tweet_all(str(tmp_path / "tweet_all.json")) == 40
+    save_tweets([tweet for page in pages for tweet in page.tweets], str(tmp_path / "expected_tweet_all.json"))
+    with open(tmp_path / "tweet_all.json") as f, open(tmp_path / "expected_tweet_all.json") as expected:
+        assert json.load(f) == json.load(expected)
+
+    assert stream.write_augmented_json(str(tmp_path / "augmented.json")) == 23
+    df = pd.DataFrame([row for page in pages for row in page.augmented], columns=AUGMENTED_COLUMNS)
+    df.to_json(str(tmp_path / "expected_augmented.json"), orient="index", indent=4)
+    with open(tmp_path / "augmented.json") as f, open(tmp_path / "expected_augmented.json") as expected:
+        assert json.load(f) == json.load(expected)
+
+    stream.close()
+
+
+def test_empty_stream_writes_empty_artifacts(tmp_path) -> None:
+
+    stream = TweetStreamWriter(str(tmp_path), "20230810_000000")
+
+    assert stream.write_tweet_all(str(tmp_path / "tweet_all.json")) == 0
+    assert stream.write_augmented_json(str(tmp_path / "augmented.json")) == 0
+    assert json.load(open(tmp_path / "tweet_all.json")) == []
+    assert json.load(open(tmp_path / "augmented.json")) == {}
+
+
+def test_memory_stays_flat_regardless_of_result_size(tmp_path) -> None:
+
+    def peak_memory(pages: int) -> int:
+        stream = TweetStreamWriter(str(tmp_path / f"stream_{pages}"), "20230810_000000")
+        tracemalloc.start()
+        for page in range(1, pages + 1):
+            stream.write_page(_page(page))
+        stream.write_tweet_all(str(tmp_path / f"tweet_all_{pages}.json"))
+        stream.write_augmented_json(str(tmp_path / f"augmented_{pages}.json"))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        stream.close()
+        return peak
+
+    small, large = peak_memory(10), peak_memory(200)
+
+    assert large < small * 2
+
+
+def test_parquet_output_is_typed_with_incremental_row_groups(tmp_path) -> None:
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    writer = AugmentedParquetWriter(str(tmp_path / "augmented.parquet"), row_group_size=8)
+    for page in range(1, 4):
+        writer.write_rows(_page(page).augmented)
+    writer.close()
+
+    parquet_file = pq.ParquetFile(str(tmp_path / "augmented.parquet"))
+    assert parquet_file.metadata.num_rows == writer.row_count == 33
+    assert parquet_file.metadata.num_row_groups == 5
+
+    table = parquet_file.read()
+    assert table.schema.names == AUGMENTED_COLUMNS
+    assert str(table.schema.field("Resolved_Latitude").type) == "double"
+    assert str(table.schema.field("Year").type) == "int32"
+    latitudes = table.column("Resolved_Latitude").to_pylist()
+    assert latitudes[0] == 20.87
+    assert latitudes[10] is None
+    assert table.column("Resolved_Longitude").null_count == 3
+
+
+def test_stream_writes_parquet_alongside_json(tmp_path) -> None:
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    stream = TweetStreamWriter(str(tmp_path), "20230810_000000", parquet_file=str(tmp_path / "augmented.parquet"))
+    for page in range(1, 3):
+        stream.write_page(_page(page))
+    assert stream.write_augmented_json(str(tmp_path / "augmented.json")) == 22
+    stream.close()
+
+    rows = pq.read_table(str(tmp_path / "augmented.parquet")).to_pylist()
+    assert [row["Title"] for row in rows] == [row[0] for row in stream.iter_augmented_rows()]
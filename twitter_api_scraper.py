@@ -1,6 +1,13 @@
 import logging
+from typing import List
+from app.dedup import DedupIndex
+from app.geocoding import create_geocoder
+from app.llm_cache import LLMCache
+from app.pipeline import PipelineConfig
+from app.prefilter import KeywordPrefilter
+from app.retry import RetryPolicy
 from app.scraper import scrape
-from app.sdk.models import KernelPlancksterSourceData, BaseJobState
+from app.sdk.models import CompressionEnum, KernelPlancksterSourceData, BaseJobState
 from app.sdk.scraped_data_repository import ScrapedDataRepository
 from app.setup import setup
 
@@ -21,6 +28,32 @@ def main(
     openai_api_key:str,
     scraper_api_key:str,
     log_level: str = "WARNING",
+    fetch_concurrency: int = 1,
+    pipeline_config: PipelineConfig | None = None,
+    filter_batch_size: int = 20,
+    llm_cache_dir: str | None = None,
+    llm_cache_ttl: float | None = 30 * 24 * 3600,
+    geocoder_backend: str = "nominatim",
+    gazetteer_path: str | None = None,
+    prefilter_config: str | None = None,
+    dedup: bool = False,
+    dedup_index_path: str | None = None,
+    checkpoint_dir: str | None = None,
+    checkpoint_interval: int = 10,
+    augmented_formats: List[str] | None = None,
+    upload_workers: int = 0,
+    compression: str = "none",
+    compression_level: int | None = None,
+    chunked_upload_threshold_mb: float | None = None,
+    part_size_mb: float = 8,
+    upload_parallelism: int = 4,
+    shard_pages: int | None = None,
+    retry_max_attempts: int = 8,
+    retry_budget: int = 100,
+    partition: str = "none",
+    partition_concurrency: int = 4,
+    partition_max_pages: int = 10,
+    postprocess_workers: int = 0,
 
 ) -> None:
 
@@ -42,15 +75,35 @@ def main(
         kp_host=kp_host,
         kp_port=kp_port,
         kp_scheme=kp_scheme,
+        compression=CompressionEnum(compression),
+        compression_level=compression_level,
+        chunked_upload_threshold=int(chunked_upload_threshold_mb * 1024 * 1024) if chunked_upload_threshold_mb is not None else None,
+        part_size=int(part_size_mb * 1024 * 1024),
+        upload_parallelism=upload_parallelism,
     )
 
     scraped_data_repository = ScrapedDataRepository(
         protocol=protocol,
         kernel_planckster=kernel_planckster,
         file_repository=file_repository,
+        upload_workers=upload_workers,
     )
 
-   
+    llm_cache = None
+    if llm_cache_dir:
+        llm_cache = LLMCache(cache_dir=llm_cache_dir, ttl=llm_cache_ttl)
+
+    geocoder = create_geocoder(geocoder_backend, gazetteer_path)
+
+    prefilter = None
+    if prefilter_config == "default":
+        prefilter = KeywordPrefilter.for_topic("forest wildfire")
+    elif prefilter_config:
+        prefilter = KeywordPrefilter.from_file(prefilter_config)
+
+    dedup_index = None
+    if dedup or dedup_index_path:
+        dedup_index = DedupIndex(path=dedup_index_path)
 
     scrape(
         job_id=job_id,
@@ -63,7 +116,23 @@ def main(
         scraped_data_repository=scraped_data_repository,
         work_dir=work_dir,
         log_level=log_level,
-
+        fetch_concurrency=fetch_concurrency,
+        pipeline_config=pipeline_config,
+        filter_batch_size=filter_batch_size,
+        llm_cache=llm_cache,
+        geocoder=geocoder,
+        prefilter=prefilter,
+        dedup_index=dedup_index,
+        checkpoint_dir=checkpoint_dir,
+        checkpoint_interval=checkpoint_interval,
+        augmented_formats=augmented_formats or ["json"],
+        shard_pages=shard_pages,
+        retry_policy=RetryPolicy(max_attempts=retry_max_attempts),
+        retry_budget=retry_budget,
+        partition=partition,
+        partition_concurrency=partition_concurrency,
+        partition_max_pages=partition_max_pages,
+        postprocess_workers=postprocess_workers,
     )
 
 
@@ -166,6 +235,192 @@ if __name__ == "__main__":
         help="Scrape API key",
     )   
 
+    parser.add_argument(
+        "--fetch-concurrency",
+        type=int,
+        default=1,
+        help="The number of search pages to fetch concurrently",
+    )
+
+    parser.add_argument(
+        "--pipeline-config",
+        type=PipelineConfig.model_validate_json,
+        default=None,
+        help='Worker count and queue size per pipeline stage, as JSON. E.g. \'{"augment": {"workers": 4, "queue_size": 8}}\'',
+    )
+
+    parser.add_argument(
+        "--filter-batch-size",
+        type=int,
+        default=20,
+        help="The number of tweets classified per relevance filter request. 1 sends one request per tweet",
+    )
+
+    parser.add_argument(
+        "--llm-cache-dir",
+        type=str,
+        default=None,
+        help="Directory of the persistent cache of LLM filter and extraction results. No cache is used if not set",
+    )
+
+    parser.add_argument(
+        "--llm-cache-ttl",
+        type=float,
+        default=30 * 24 * 3600,
+        help="Seconds after which cached LLM results expire",
+    )
+
+    parser.add_argument(
+        "--geocoder",
+        type=str,
+        choices=["nominatim", "gazetteer", "offline"],
+        default="nominatim",
+        help="The geocoder backend: Nominatim, a local gazetteer falling back to Nominatim on a miss, or the local gazetteer only",
+    )
+
+    parser.add_argument(
+        "--gazetteer-path",
+        type=str,
+        default=None,
+        help="GeoNames-style gazetteer TSV, used by the gazetteer and offline geocoders",
+    )
+
+    parser.add_argument(
+        "--prefilter",
+        type=str,
+        default=None,
+        help="Score tweets locally before the LLM relevance filter: 'default' for the built-in wildfire keywords, or a JSON file of keywords and thresholds. Disabled if not set",
+    )
+
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Skip tweets whose link or near-identical text was already seen in this job",
+    )
+
+    parser.add_argument(
+        "--dedup-index-path",
+        type=str,
+        default=None,
+        help="SQLite file of a persistent deduplication index, to also skip tweets seen by earlier jobs. Implies --dedup",
+    )
+
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        default=None,
+        help="Directory for job checkpoints. A rerun with the same job id and tracer id resumes from its checkpoint. Disabled if not set",
+    )
+
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=10,
+        help="The number of completed pages between checkpoint syncs to disk",
+    )
+
+    parser.add_argument(
+        "--augmented-format",
+        type=str,
+        nargs="+",
+        choices=["json", "parquet"],
+        default=["json"],
+        help="The formats of the augmented data artifact. Parquet has a typed schema, with nulls for unresolved coordinates",
+    )
+
+    parser.add_argument(
+        "--upload-workers",
+        type=int,
+        default=0,
+        help="Upload files in the background with this many threads, retrying failed uploads. 0 uploads inline",
+    )
+
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=["none", "gzip", "zstd"],
+        default="none",
+        help="Compress the scraped json files before storing them. Their relative paths get a .gz or .zst suffix",
+    )
+
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        default=None,
+        help="The compression level, e.g. 1-9 for gzip or 1-22 for zstd. Defaults to 6 for gzip and 3 for zstd",
+    )
+
+    parser.add_argument(
+        "--chunked-upload-threshold-mb",
+        type=float,
+        default=None,
+        help="Upload files larger than this many MiB in resumable parts, with a manifest. Disabled if not set",
+    )
+
+    parser.add_argument(
+        "--part-size-mb",
+        type=float,
+        default=8,
+        help="The size of the parts of chunked uploads, in MiB",
+    )
+
+    parser.add_argument(
+        "--upload-parallelism",
+        type=int,
+        default=4,
+        help="The number of parts of a chunked upload uploaded at once",
+    )
+
+    parser.add_argument(
+        "--shard-pages",
+        type=int,
+        default=None,
+        help="Roll every this many consecutive pages up into one shard, instead of one artifact per page",
+    )
+
+    parser.add_argument(
+        "--retry-max-attempts",
+        type=int,
+        default=8,
+        help="How many times to try a ScraperAPI or OpenAI request that is rate limited or fails with a server error",
+    )
+
+    parser.add_argument(
+        "--retry-budget",
+        type=int,
+        default=100,
+        help="How many retries the job may spend in total before it fails",
+    )
+
+    parser.add_argument(
+        "--partition",
+        type=str,
+        default="none",
+        choices=["none", "daily", "adaptive"],
+        help="Scrape the date range as one query, as one query per day, or split by the volume of its parts",
+    )
+
+    parser.add_argument(
+        "--partition-concurrency",
+        type=int,
+        default=4,
+        help="How many date windows of a partitioned job to scrape at once",
+    )
+
+    parser.add_argument(
+        "--partition-max-pages",
+        type=int,
+        default=10,
+        help="With --partition adaptive, split date windows that are expected to have more pages than this",
+    )
+
+    parser.add_argument(
+        "--postprocess-workers",
+        type=int,
+        default=0,
+        help="Format, score and serialize tweets in this many worker processes, 0 to do it in the job's process. Pair with more augment and persist workers in --pipeline-config",
+    )
+
     args = parser.parse_args()
 
     main(
@@ -181,5 +436,31 @@ if __name__ == "__main__":
         kp_port=args.kp_port,
         kp_scheme=args.kp_scheme,
         scraper_api_key=args.scraper_api_key,
-        openai_api_key=args.openai_api_key
+        openai_api_key=args.openai_api_key,
+        fetch_concurrency=args.fetch_concurrency,
+        pipeline_config=args.pipeline_config,
+        filter_batch_size=args.filter_batch_size,
+        llm_cache_dir=args.llm_cache_dir,
+        llm_cache_ttl=args.llm_cache_ttl,
+        geocoder_backend=args.geocoder,
+        gazetteer_path=args.gazetteer_path,
+        prefilter_config=args.prefilter,
+        dedup=args.dedup,
+        dedup_index_path=args.dedup_index_path,
+        checkpoint_dir=args.checkpoint_dir,
+        checkpoint_interval=args.checkpoint_interval,
+        augmented_formats=args.augmented_format,
+        upload_workers=args.upload_workers,
+        compression=args.compression,
+        compression_level=args.compression_level,
+        chunked_upload_threshold_mb=args.chunked_upload_threshold_mb,
+        part_size_mb=args.part_size_mb,
+        upload_parallelism=args.upload_parallelism,
+        shard_pages=args.shard_pages,
+        retry_max_attempts=args.retry_max_attempts,
+        retry_budget=args.retry_budget,
+        partition=args.partition,
+        partition_concurrency=args.partition_concurrency,
+        partition_max_pages=args.partition_max_pages,
+        postprocess_workers=args.postprocess_workers,
     )